@@ -0,0 +1,701 @@
+"""
+ECS service autoscaling: target tracking and market session scheduled scaling
+Returns:
+    None:
+"""
+import os
+import re
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from aws import get_client
+
+logger = logging.getLogger("Deployment")
+
+MARKET_TIMEZONE = 'America/New_York'
+
+### Session -> (start, end), market timezone
+MARKET_SESSIONS = {
+    'pre': ('04:00', '09:30'),
+    'regular': ('09:30', '16:00'),
+    'post': ('16:00', '20:00'),
+}
+
+### NYSE holidays and early closes. Extend yearly or pass --market_calendar
+DEFAULT_MARKET_CALENDAR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'market_calendar.json')
+
+### Statistics accepted by CustomizedMetricSpecification, percentiles go through metric math
+STATISTICS = ('Average', 'Minimum', 'Maximum', 'SampleCount', 'Sum')
+PERCENTILE_PATTERN = re.compile(r'^p\d{1,2}(\.\d+)?$')
+
+AUTOSCALING_MODES = ('apply', 'reconcile', 'plan')
+
+### Days ahead to generate holiday free schedules and early close overrides for
+HOLIDAY_HORIZON_DAYS = 120
+
+
+def parse_time(value):
+    """Minutes since midnight for "HH:MM" """
+    hours, _, minutes = value.partition(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_session_spec(spec, max_capacity):
+    """Parse session capacities like "pre:2,regular:6:12,post:2"
+
+    Args:
+        spec (str): Comma separated session:min_capacity[:max_capacity]
+        max_capacity (int): Max capacity used when session doesn't set it
+
+    Returns:
+        dict: Session -> (min capacity, max capacity)
+    """
+    capacities = {}
+    for item in spec.split(','):
+        session, *values = item.strip().split(':')
+        if session not in MARKET_SESSIONS:
+            raise ValueError(f'Unknown market session "{session}". Use one of {", ".join(MARKET_SESSIONS)}')
+        if not 1 <= len(values) <= 2:
+            raise ValueError(f'Invalid market session capacity "{item.strip()}", expected session:min[:max]')
+        min_capacity = int(values[0])
+        session_max = int(values[1]) if len(values) == 2 else max(max_capacity, min_capacity)
+        if not 0 <= min_capacity <= session_max:
+            raise ValueError(f'Invalid capacity for {session} session: min {min_capacity}, max {session_max}')
+        capacities[session] = (min_capacity, session_max)
+    return capacities
+
+
+def load_market_calendar(path=None):
+    """Load market holidays and early closes
+
+    Args:
+        path (str): JSON file: {"holidays": ["2026-01-01"], "early_closes": {"2026-11-27": "13:00"}}.
+            Defaults to devops/market_calendar.json
+
+    Returns:
+        dict: holidays set of dates and early_closes date -> close minute
+    """
+    with open(path or DEFAULT_MARKET_CALENDAR) as f:
+        calendar = json.loads(f.read())
+    return {
+        'holidays': {date.fromisoformat(item) for item in calendar.get('holidays', [])},
+        'early_closes': {date.fromisoformat(key): parse_time(value) for key, value in calendar.get('early_closes', {}).items()},
+    }
+
+
+def calendar_months(today, horizon_days):
+    """First days of the months from today through today + horizon_days"""
+    last = today + timedelta(days=horizon_days)
+    month = today.replace(day=1)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def regular_trading_days(month, calendar):
+    """Days of the month with the regular session times: weekdays without holidays and early closes"""
+    day = month
+    days = []
+    while day.month == month.month:
+        if day.weekday() < 5 and day not in calendar['holidays'] and day not in calendar['early_closes']:
+            days.append(day.day)
+        day += timedelta(days=1)
+    return days
+
+
+def day_ranges(days):
+    """Cron day of month list like "2-6,9-13" for sorted days"""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] == day - 1:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ','.join(str(start) if start == end else f'{start}-{end}' for start, end in ranges)
+
+
+def session_times(close=None):
+    """Session start and end minutes. Early close shortens regular session and moves post session
+
+    Args:
+        close (int): Regular session close minute on early close days
+
+    Returns:
+        dict: Session -> (start, end)
+    """
+    times = {session: (parse_time(start), parse_time(end)) for session, (start, end) in MARKET_SESSIONS.items()}
+    if close is not None:
+        post_start, post_end = times['post']
+        times['regular'] = (times['regular'][0], close)
+        times['post'] = (close, close + post_end - post_start)
+    return times
+
+
+def session_transitions(capacities, base, lead_minutes, scale_in_delay, close=None):
+    """Capacity changes of the trading day
+
+    Capacity is raised lead_minutes before the session starts and dropped back
+    to the base capacity scale_in_delay minutes after the last adjacent session ends.
+
+    Args:
+        capacities (dict): Session -> (min, max)
+        base (tuple): Capacity outside of the sessions
+        lead_minutes (int): Minutes to pre-scale before session start
+        scale_in_delay (int): Minutes to keep capacity after session end
+        close (int): Early close minute
+
+    Returns:
+        list: Sorted (minute, (min, max), name) tuples
+    """
+    times = session_times(close)
+    sessions = sorted(capacities, key=lambda session: times[session][0])
+    transitions = []
+    current = base
+    for i, session in enumerate(sessions):
+        start, end = times[session]
+        capacity = capacities[session]
+        ## Lower capacity of the next adjacent session starts with the session, not earlier
+        transitions.append((start - lead_minutes if capacity[0] > current[0] else start, capacity, f'{session}-scale-out'))
+        current = capacity
+        following = sessions[i + 1] if i + 1 < len(sessions) else None
+        if following is None or times[following][0] != end:
+            transitions.append((end + scale_in_delay, base, f'{session}-scale-in'))
+            current = base
+    return sorted(transitions, key=lambda item: item[0])
+
+
+def capacity_at(transitions, minute, base):
+    """Capacity set by the last transition before the minute"""
+    capacity = base
+    for transition_minute, transition_capacity, _ in transitions:
+        if transition_minute <= minute:
+            capacity = transition_capacity
+    return capacity
+
+
+def day_transitions(day, capacities, base, lead_minutes, scale_in_delay, calendar):
+    """Transitions of the given day. Empty for weekends and holidays"""
+    if day.weekday() >= 5 or day in calendar['holidays']:
+        return []
+    return session_transitions(capacities, base, lead_minutes, scale_in_delay, calendar['early_closes'].get(day))
+
+
+def build_scheduled_actions(service, capacities, base, lead_minutes, scale_in_delay, calendar,
+                            today, horizon_days=HOLIDAY_HORIZON_DAYS):
+    """Build scheduled actions for the market sessions
+
+    Months within the horizon get a cron per transition listing their regular trading
+    days, so nothing fires on holidays and early closes. Early closes get one time
+    actions with their own session times. Plain weekday crons start after the last
+    listed month, in case the deploy doesn't run again before.
+
+    Args:
+        service (str): ECS service name, used in the action names
+        capacities (dict): Session -> (min, max)
+        base (tuple): Capacity outside of the sessions
+        lead_minutes (int): Minutes to pre-scale before session start
+        scale_in_delay (int): Minutes to keep capacity after session end
+        calendar (dict): load_market_calendar result
+        today (date): First day of the holiday free schedules
+        horizon_days (int): Days of the holiday free schedules
+
+    Returns:
+        list: Actions with name, schedule, (min, max) capacity and optional start date
+    """
+    normal = session_transitions(capacities, base, lead_minutes, scale_in_delay)
+    for minute, _, name in normal:
+        if not 0 <= minute < 24 * 60:
+            raise ValueError(f'Scheduled action {name} falls outside of the trading day. Reduce lead or scale in delay')
+
+    months = calendar_months(today, horizon_days)
+    last_year = max((day.year for day in calendar['holidays']), default=None)
+    if last_year is None or months[-1].year > last_year:
+        logger.warning(f'Market calendar has no holidays after {last_year}, weekday schedules will scale out on '
+                       f'holidays. Extend {os.path.basename(DEFAULT_MARKET_CALENDAR)} or pass --market_calendar')
+
+    ## Weekday crons take over after the listed months
+    after = (months[-1] + timedelta(days=32)).replace(day=1)
+    actions = [
+        {
+            'name': f'{service}-market-{name}',
+            'schedule': f'cron({minute % 60} {minute // 60} ? * MON-FRI *)',
+            'capacity': capacity,
+            'start': after.isoformat(),
+        }
+        for minute, capacity, name in normal
+    ]
+
+    for month in months:
+        days = regular_trading_days(month, calendar)
+        if not days:
+            continue
+        for minute, capacity, name in normal:
+            actions.append({
+                'name': f'{service}-market-{month:%Y%m}-{name}',
+                'schedule': f'cron({minute % 60} {minute // 60} {day_ranges(days)} {month.month} ? {month.year})',
+                'capacity': capacity,
+            })
+
+    early_closes = sorted(
+        day for day in calendar['early_closes']
+        if today <= day < after and day.weekday() < 5 and day not in calendar['holidays']
+    )
+    for day in early_closes:
+        for minute, capacity, name in day_transitions(day, capacities, base, lead_minutes, scale_in_delay, calendar):
+            actions.append({
+                'name': f'{service}-market-{day:%Y%m%d}-{name}',
+                'schedule': f'at({day.isoformat()}T{minute // 60:02d}:{minute % 60:02d}:00)',
+                'capacity': capacity,
+            })
+    return actions
+
+
+def action_window(action, timezone):
+    """StartTime argument of put_scheduled_action: midnight of the start date in the timezone"""
+    if not action.get('start'):
+        return {}
+    return {'StartTime': datetime.combine(date.fromisoformat(action['start']), time(), ZoneInfo(timezone))}
+
+
+def apply_scheduled_actions(client, service, resource_id, actions, timezone):
+    """Put scheduled actions and delete market actions which are not generated anymore(past holidays)
+
+    Args:
+        client (obj): Boto3 application-autoscaling client
+        service (str): ECS service name
+        resource_id (str): Scalable target resource id
+        actions (list): build_scheduled_actions result
+        timezone (str): IANA timezone of the schedules
+    """
+    for action in actions:
+        client.put_scheduled_action(
+            ServiceNamespace='ecs',
+            Schedule=action['schedule'],
+            Timezone=timezone,
+            ScheduledActionName=action['name'],
+            ResourceId=resource_id,
+            ScalableDimension='ecs:service:DesiredCount',
+            ScalableTargetAction={
+                'MinCapacity': action['capacity'][0],
+                'MaxCapacity': action['capacity'][1]
+            },
+            **action_window(action, timezone)
+        )
+
+    names = {action['name'] for action in actions}
+    paginator = client.get_paginator('describe_scheduled_actions')
+    response_iterator = paginator.paginate(
+        ServiceNamespace='ecs',
+        ResourceId=resource_id,
+        ScalableDimension='ecs:service:DesiredCount'
+    )
+    for page in response_iterator:
+        for item in page['ScheduledActions']:
+            name = item['ScheduledActionName']
+            if name.startswith(f'{service}-market-') and name not in names:
+                logger.info(f'Deleting stale scheduled action {name}')
+                client.delete_scheduled_action(
+                    ServiceNamespace='ecs',
+                    ScheduledActionName=name,
+                    ResourceId=resource_id,
+                    ScalableDimension='ecs:service:DesiredCount'
+                )
+
+
+def parse_metric_spec(value):
+    """Parse customized metric target tracking spec
+
+    Example: {"name": "event-loop-lag", "namespace": "TraderLion/App", "metric": "nodejs_eventloop_lag_seconds",
+    "statistic": "p95", "target": 0.1, "dimensions": {"ServiceName": "{service}"}}
+
+    Args:
+        value (str|dict): JSON string or already parsed dict(manifest)
+
+    Returns:
+        dict: Metric spec
+    """
+    spec = json.loads(value) if isinstance(value, str) else dict(value)
+    missing = [key for key in ('name', 'namespace', 'metric', 'target') if key not in spec]
+    if missing:
+        raise ValueError(f'Target metric spec is missing keys: {", ".join(missing)}')
+    unknown = set(spec) - {'name', 'namespace', 'metric', 'statistic', 'target', 'dimensions', 'unit'}
+    if unknown:
+        raise ValueError(f'Unknown target metric spec keys: {", ".join(sorted(unknown))}')
+    statistic = spec.setdefault('statistic', 'Average')
+    if statistic not in STATISTICS and not PERCENTILE_PATTERN.match(statistic):
+        raise ValueError(f'Invalid statistic "{statistic}". Use one of {", ".join(STATISTICS)} or a percentile like p95')
+    spec['target'] = float(spec['target'])
+    return spec
+
+
+def customized_metric_specification(spec, cluster, service):
+    """CustomizedMetricSpecification for the metric spec. Percentiles need the metric math form
+
+    Args:
+        spec (dict): parse_metric_spec result
+        cluster (str): ECS cluster, substituted for {cluster} in the dimension values
+        service (str): ECS service name, substituted for {service} in the dimension values
+
+    Returns:
+        dict: CustomizedMetricSpecification
+    """
+    dimensions = [
+        {'Name': name, 'Value': str(value).format(cluster=cluster, service=service)}
+        for name, value in spec.get('dimensions', {}).items()
+    ]
+    if spec['statistic'] in STATISTICS:
+        specification = {
+            'MetricName': spec['metric'],
+            'Namespace': spec['namespace'],
+            'Dimensions': dimensions,
+            'Statistic': spec['statistic']
+        }
+        if spec.get('unit'):
+            specification['Unit'] = spec['unit']
+        return specification
+
+    metric_stat = {
+        'Metric': {
+            'MetricName': spec['metric'],
+            'Namespace': spec['namespace'],
+            'Dimensions': dimensions
+        },
+        'Stat': spec['statistic']
+    }
+    if spec.get('unit'):
+        metric_stat['Unit'] = spec['unit']
+    return {'Metrics': [{'Id': 'm1', 'MetricStat': metric_stat, 'ReturnData': True}]}
+
+
+def get_alb_resource_label(cluster, service):
+    """Find ALBRequestCountPerTarget resource label of the service target group
+
+    Args:
+        cluster (str): ECS cluster
+        service (str): ECS service name
+
+    Returns:
+        str: app/<alb name>/<alb id>/targetgroup/<target group name>/<target group id>. None without load balancer
+    """
+    description = get_client('ecs').describe_services(cluster=cluster, services=[service])['services']
+    target_groups = [item['targetGroupArn'] for item in (description[0].get('loadBalancers', []) if description else []) if item.get('targetGroupArn')]
+    if not target_groups:
+        return None
+    if description[0].get('deploymentController', {}).get('type') == 'CODE_DEPLOY':
+        ## Blue/green swaps target groups, the label follows the one registered on the service
+        logger.warning(f'{service} uses CodeDeploy, request count is tracked on {target_groups[0].split(":")[-1]}. '
+                       'Pass --alb_resource_label to pin it')
+    target_group = get_client('elbv2').describe_target_groups(TargetGroupArns=target_groups[:1])['TargetGroups'][0]
+    if not target_group.get('LoadBalancerArns'):
+        return None
+    load_balancer = target_group['LoadBalancerArns'][0].split(':loadbalancer/')[-1]
+    return f"{load_balancer}/{target_group['TargetGroupArn'].split(':')[-1]}"
+
+
+def target_tracking_policies(cluster, service, target_cpu=0, target_mem=0, target_requests=0,
+                             alb_resource_label=None, custom_metrics=None,
+                             scale_out_cooldown=60, scale_in_cooldown=60):
+    """Build target tracking policies of the service
+
+    Args:
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        target_cpu (int): Average CPU %, 0 disables the policy
+        target_mem (int): Average memory %, 0 disables the policy
+        target_requests (int): ALB requests per target, 0 disables the policy
+        alb_resource_label (str): ALB/target group label for the request count policy
+        custom_metrics (list): parse_metric_spec results
+        scale_out_cooldown (int): Seconds after scale out before the next scaling activity
+        scale_in_cooldown (int): Seconds after scale in before the next scale in
+
+    Returns:
+        dict: Policy name -> TargetTrackingScalingPolicyConfiguration
+    """
+    def configuration(target, **metric):
+        return {
+            'TargetValue': target,
+            **metric,
+            'ScaleOutCooldown': scale_out_cooldown,
+            'ScaleInCooldown': scale_in_cooldown
+        }
+
+    policies = {}
+    if target_cpu > 0:
+        policies[f"{service}-cpu-scaling"] = configuration(target_cpu, PredefinedMetricSpecification={
+            'PredefinedMetricType': 'ECSServiceAverageCPUUtilization'
+        })
+    if target_mem > 0:
+        policies[f"{service}-memory-scaling"] = configuration(target_mem, PredefinedMetricSpecification={
+            'PredefinedMetricType': 'ECSServiceAverageMemoryUtilization'
+        })
+    if target_requests > 0:
+        if not alb_resource_label:
+            raise ValueError(f'{service} has no load balancer target group, request count tracking needs --alb_resource_label')
+        policies[f"{service}-requests-scaling"] = configuration(target_requests, PredefinedMetricSpecification={
+            'PredefinedMetricType': 'ALBRequestCountPerTarget',
+            'ResourceLabel': alb_resource_label
+        })
+    for spec in custom_metrics or []:
+        policies[f"{service}-{spec['name']}-scaling"] = configuration(
+            spec['target'],
+            CustomizedMetricSpecification=customized_metric_specification(spec, cluster, service)
+        )
+    return policies
+
+
+def describe_autoscaling(client, service, resource_id):
+    """Get current scalable target, target tracking policies and market scheduled actions of the service
+
+    Args:
+        client (obj): Boto3 application-autoscaling client
+        service (str): ECS service name
+        resource_id (str): Scalable target resource id
+
+    Returns:
+        dict: capacity (min, max) or None, policies name -> configuration, actions name -> action
+    """
+    targets = client.describe_scalable_targets(
+        ServiceNamespace='ecs',
+        ResourceIds=[resource_id],
+        ScalableDimension='ecs:service:DesiredCount'
+    )['ScalableTargets']
+    current = {
+        'capacity': (targets[0]['MinCapacity'], targets[0]['MaxCapacity']) if targets else None,
+        'policies': {},
+        'actions': {},
+    }
+
+    paginator = client.get_paginator('describe_scaling_policies')
+    for page in paginator.paginate(ServiceNamespace='ecs', ResourceId=resource_id, ScalableDimension='ecs:service:DesiredCount'):
+        for item in page['ScalingPolicies']:
+            ## Only policies created by the deploy are managed
+            if item['PolicyName'].startswith(f'{service}-') and item['PolicyName'].endswith('-scaling'):
+                current['policies'][item['PolicyName']] = item.get('TargetTrackingScalingPolicyConfiguration', {})
+
+    paginator = client.get_paginator('describe_scheduled_actions')
+    for page in paginator.paginate(ServiceNamespace='ecs', ResourceId=resource_id, ScalableDimension='ecs:service:DesiredCount'):
+        for item in page['ScheduledActions']:
+            if item['ScheduledActionName'].startswith(f'{service}-market-'):
+                action = {
+                    'name': item['ScheduledActionName'],
+                    'schedule': item['Schedule'],
+                    'timezone': item.get('Timezone', 'UTC'),
+                    'capacity': (item['ScalableTargetAction'].get('MinCapacity'), item['ScalableTargetAction'].get('MaxCapacity')),
+                }
+                if item.get('StartTime'):
+                    action['start'] = item['StartTime'].astimezone(ZoneInfo(action['timezone'])).date().isoformat()
+                current['actions'][item['ScheduledActionName']] = action
+    return current
+
+
+def normalize_policy(configuration):
+    """Comparable target tracking configuration. Describe returns defaults and floats"""
+    configuration = json.loads(json.dumps(configuration, default=str))
+    configuration['TargetValue'] = float(configuration.get('TargetValue', 0))
+    configuration.setdefault('DisableScaleIn', False)
+    specification = configuration.get('CustomizedMetricSpecification', {})
+    if 'Dimensions' in specification:
+        specification['Dimensions'] = sorted(specification['Dimensions'], key=lambda item: item['Name'])
+    return json.dumps(configuration, sort_keys=True)
+
+
+def plan_autoscaling(current, desired, timezone):
+    """Diff current and desired autoscaling state
+
+    Args:
+        current (dict): describe_autoscaling result
+        desired (dict): capacity, policies and actions to have. Registered capacities in
+            equivalent_capacities are not changed
+        timezone (str): Timezone of the scheduled actions
+
+    Returns:
+        list: Changes with op(register, put, delete), kind(target, policy, action), name and details
+    """
+    plan = []
+    ## Scheduled actions move the target between base and session capacity, both are in sync
+    if current['capacity'] != desired['capacity'] and current['capacity'] not in desired.get('equivalent_capacities', ()):
+        plan.append({'op': 'register', 'kind': 'target', 'name': 'capacity',
+                     'current': current['capacity'], 'desired': desired['capacity']})
+
+    for name, configuration in desired['policies'].items():
+        existing = current['policies'].get(name)
+        if existing is None or normalize_policy(existing) != normalize_policy(configuration):
+            plan.append({'op': 'put', 'kind': 'policy', 'name': name, 'current': existing, 'desired': configuration})
+    for name, configuration in current['policies'].items():
+        if name not in desired['policies']:
+            plan.append({'op': 'delete', 'kind': 'policy', 'name': name, 'current': configuration, 'desired': None})
+
+    for action in desired['actions']:
+        existing = current['actions'].get(action['name'])
+        wanted = dict(action, timezone=timezone)
+        if existing != wanted:
+            plan.append({'op': 'put', 'kind': 'action', 'name': action['name'], 'current': existing, 'desired': wanted})
+    names = {action['name'] for action in desired['actions']}
+    for name, action in current['actions'].items():
+        if name not in names:
+            plan.append({'op': 'delete', 'kind': 'action', 'name': name, 'current': action, 'desired': None})
+    return plan
+
+
+def log_plan(service, plan, unchanged):
+    """Log autoscaling plan like "+ put policy api-cpu-scaling" """
+    symbols = {'register': '~', 'put': '+', 'delete': '-'}
+    logger.info(f'Autoscaling plan for {service}: {len(plan)} changes, {unchanged} unchanged')
+    for change in plan:
+        details = ''
+        if change['kind'] == 'target':
+            details = f"{change['current']} -> {change['desired']}"
+        elif change['kind'] == 'policy' and change['desired']:
+            details = f"target {change['desired']['TargetValue']}" + (' (changed)' if change['current'] else ' (new)')
+        elif change['kind'] == 'action' and change['desired']:
+            details = f"{change['desired']['schedule']} {change['desired']['capacity']}" + (' (changed)' if change['current'] else ' (new)')
+        logger.info(f"  {symbols[change['op']]} {change['op']} {change['kind']} {change['name']} {details}".rstrip())
+
+
+def apply_autoscaling_plan(client, resource_id, plan):
+    """Apply plan_autoscaling changes. Target is registered before policies and actions
+
+    Args:
+        client (obj): Boto3 application-autoscaling client
+        resource_id (str): Scalable target resource id
+        plan (list): plan_autoscaling result
+    """
+    dimension = {
+        'ServiceNamespace': 'ecs',
+        'ResourceId': resource_id,
+        'ScalableDimension': 'ecs:service:DesiredCount'
+    }
+    for change in plan:
+        if change['kind'] == 'target':
+            client.register_scalable_target(
+                **dimension,
+                MinCapacity=change['desired'][0],
+                MaxCapacity=change['desired'][1]
+            )
+        elif change['kind'] == 'policy' and change['op'] == 'put':
+            client.put_scaling_policy(
+                **dimension,
+                PolicyName=change['name'],
+                PolicyType='TargetTrackingScaling',
+                TargetTrackingScalingPolicyConfiguration=change['desired']
+            )
+        elif change['kind'] == 'policy':
+            client.delete_scaling_policy(**dimension, PolicyName=change['name'])
+        elif change['op'] == 'put':
+            client.put_scheduled_action(
+                **dimension,
+                ScheduledActionName=change['name'],
+                Schedule=change['desired']['schedule'],
+                Timezone=change['desired']['timezone'],
+                ScalableTargetAction={
+                    'MinCapacity': change['desired']['capacity'][0],
+                    'MaxCapacity': change['desired']['capacity'][1]
+                },
+                **action_window(change['desired'], change['desired']['timezone'])
+            )
+        else:
+            client.delete_scheduled_action(**dimension, ScheduledActionName=change['name'])
+
+
+def setup_autoscaling(cluster, service, min_cap, max_cap, target_cpu, target_mem, sessions=None,
+                      timezone=MARKET_TIMEZONE, lead_minutes=15, scale_in_delay=15, calendar_path=None,
+                      target_requests=0, alb_resource_label=None, custom_metrics=None,
+                      scale_out_cooldown=60, scale_in_cooldown=60, mode='apply'):
+    """Configure scalable target, target tracking policies and market session scheduled actions
+
+    Args:
+        mode (str): apply: put everything, errors are only logged.
+            reconcile: describe current state and apply only the diff, stale policies are deleted.
+            plan: log the diff without changes
+
+    Returns:
+        list: Reconcile/plan changes. None in apply mode
+    """
+    logger.info(f"Configuring Autoscaling for {service}...")
+    resource_id = f"service/{cluster}/{service}"
+    autoscaling_client = get_client('application-autoscaling')
+
+    if mode not in AUTOSCALING_MODES:
+        raise ValueError(f'Unknown autoscaling mode "{mode}". Use one of {", ".join(AUTOSCALING_MODES)}')
+    capacity = (min_cap, max_cap)
+    if sessions:
+        ## Invalid session spec or calendar fails the deploy
+        capacities = parse_session_spec(sessions, max_cap)
+        calendar = load_market_calendar(calendar_path)
+    ## Single spec comes from the manifest as a dict
+    if isinstance(custom_metrics, (str, dict)):
+        custom_metrics = [custom_metrics]
+    custom_metrics = [parse_metric_spec(spec) for spec in custom_metrics or []]
+
+    def desired_state():
+        state = {'capacity': capacity, 'actions': []}
+        if sessions:
+            ## Target tracking scales inside of the capacity set by the session schedule
+            base = (min_cap, max_cap)
+            now = datetime.now(ZoneInfo(timezone))
+            state['actions'] = build_scheduled_actions(
+                service, capacities, base, lead_minutes, scale_in_delay, calendar, now.date()
+            )
+            ### Registering the base capacity during the session would scale in until the next action
+            state['capacity'] = capacity_at(
+                day_transitions(now.date(), capacities, base, lead_minutes, scale_in_delay, calendar),
+                now.hour * 60 + now.minute,
+                base
+            )
+            ## Target set by the schedule depends on the time of the run, not a drift
+            state['equivalent_capacities'] = (base, state['capacity'])
+
+        label = alb_resource_label
+        if target_requests > 0 and not label:
+            label = get_alb_resource_label(cluster, service)
+
+        state['policies'] = target_tracking_policies(
+            cluster, service, target_cpu, target_mem, target_requests, label,
+            custom_metrics, scale_out_cooldown, scale_in_cooldown
+        )
+        return state
+
+    if mode != 'apply':
+        ## Errors fail the deploy, so drift is never hidden
+        desired = desired_state()
+        current = describe_autoscaling(autoscaling_client, service, resource_id)
+        plan = plan_autoscaling(current, desired, timezone)
+        unchanged = 1 + len(desired['policies']) + len(desired['actions']) - len([item for item in plan if item['op'] != 'delete'])
+        log_plan(service, plan, unchanged)
+        if mode == 'reconcile':
+            apply_autoscaling_plan(autoscaling_client, resource_id, plan)
+        return plan
+
+    try:
+        desired = desired_state()
+        capacity = desired['capacity']
+
+        autoscaling_client.register_scalable_target(
+            ServiceNamespace='ecs',
+            ResourceId=resource_id,
+            ScalableDimension='ecs:service:DesiredCount',
+            MinCapacity=capacity[0],
+            MaxCapacity=capacity[1]
+        )
+
+        for policy_name, policy_configuration in desired['policies'].items():
+            autoscaling_client.put_scaling_policy(
+                PolicyName=policy_name,
+                ServiceNamespace='ecs',
+                ResourceId=resource_id,
+                ScalableDimension='ecs:service:DesiredCount',
+                PolicyType='TargetTrackingScaling',
+                TargetTrackingScalingPolicyConfiguration=policy_configuration
+            )
+            logger.info(f"Autoscaling: {policy_name} target set to {policy_configuration['TargetValue']}")
+
+        if sessions:
+            apply_scheduled_actions(autoscaling_client, service, resource_id, desired['actions'], timezone)
+            logger.info(f"Autoscaling: {len(desired['actions'])} market session actions in {timezone}, current capacity {capacity[0]}-{capacity[1]}")
+
+    except Exception as e:
+        logger.error(f"Failed to configure autoscaling: {str(e)}")
@@ -1,12 +1,116 @@
 """Boto3 clients init. Used to import anywhere
+
+Clients are created lazily on first use and cached per service and region.
+All of them share one botocore session and the same connection pool/retry tuning.
+Multi-region deploys switch the default region per thread with use_region.
 """
 import os
+import copy
+import threading
+import contextvars
+from contextlib import contextmanager
 import boto3
+import botocore.session
+from botocore.config import Config
 
 current_region = os.environ.get('AWS_DEFAULT_REGION', 'us-east-2')
 
-client = boto3.client("ecs", region_name=current_region)
-ssm_client = boto3.client('ssm', region_name=current_region)
-deploy_client = boto3.client('codedeploy', region_name=current_region)
-batch_client = boto3.client('batch', region_name=current_region)
-autoscaling_client = boto3.client('application-autoscaling', region_name=current_region)
\ No newline at end of file
+### Region of the current deploy thread, overrides current_region
+region_override = contextvars.ContextVar('region_override', default=None)
+
+CLIENT_SETTINGS = {
+    'max_pool_connections': int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50)),
+    'retry_mode': os.environ.get('AWS_RETRY_MODE', 'adaptive'),
+    'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', 10)),
+}
+
+### Old module level client names
+CLIENT_ALIASES = {
+    'client': 'ecs',
+    'ssm_client': 'ssm',
+    'deploy_client': 'codedeploy',
+    'batch_client': 'batch',
+    'autoscaling_client': 'application-autoscaling',
+}
+
+lock = threading.RLock()
+session = None
+clients = {}
+
+
+def configure(**settings):
+    """Tune clients created from now on
+
+    Args:
+        settings: max_pool_connections, retry_mode and/or max_attempts
+    """
+    with lock:
+        CLIENT_SETTINGS.update(settings)
+
+
+def get_session():
+    """Get shared boto3 session
+
+    Returns:
+        obj: boto3 Session built on the single botocore session
+    """
+    global session
+    with lock:
+        if session is None:
+            session = boto3.session.Session(botocore_session=botocore.session.get_session())
+        return session
+
+
+def get_region():
+    """Region used by clients created without explicit region"""
+    return region_override.get() or current_region
+
+
+@contextmanager
+def use_region(region):
+    """Create clients in the region inside the block. Thread pools need metrics.bind_context
+
+    Args:
+        region (str): Region name
+    """
+    token = region_override.set(region)
+    try:
+        yield region
+    finally:
+        region_override.reset(token)
+
+
+def get_client(service, region=None, **config):
+    """Get cached boto3 client
+
+    Args:
+        service (str): Service name, for example ecs
+        region (str): Region name. Defaults to use_region region or AWS_DEFAULT_REGION
+        config: Extra botocore Config arguments for this client, for example retries
+
+    Returns:
+        obj: Boto3 client
+    """
+    region = region or get_region()
+    key = (service, region, repr(sorted(config.items())))
+    with lock:
+        if key not in clients:
+            client_config = Config(
+                max_pool_connections=CLIENT_SETTINGS['max_pool_connections'],
+                retries={
+                    'max_attempts': CLIENT_SETTINGS['max_attempts'],
+                    'mode': CLIENT_SETTINGS['retry_mode']
+                }
+            )
+            if config:
+                ## botocore updates retries dict in place, keep the cache key stable
+                client_config = client_config.merge(Config(**copy.deepcopy(config)))
+            clients[key] = get_session().client(service, region_name=region, config=client_config)
+        return clients[key]
+
+
+def __getattr__(name):
+    """Keep `from aws import ssm_client` style imports working, without creating clients on import"""
+    if name in CLIENT_ALIASES:
+        return get_client(CLIENT_ALIASES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
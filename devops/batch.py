@@ -1,6 +1,14 @@
 """
 Batch module
 """
+import json
+import time
+import logging
+import statistics
+
+from rollout import poll_intervals, RolloutFailed, RolloutTimeout
+
+logger = logging.getLogger("Deployment")
 
 def get_latest_batch_revision(client, family):
     """Get lateset batch job revison
@@ -15,4 +23,163 @@ def get_latest_batch_revision(client, family):
     return client.describe_job_definitions(
         maxResults=1,
         jobDefinitionName=family,
-    )['jobDefinitions'][-1]
\ No newline at end of file
+    )['jobDefinitions'][-1]
+
+### Array job size limits of AWS Batch
+MAX_ARRAY_SIZE = 10000
+SHARD_KEYS = ('markets', 'symbols')
+### Market lists go to every child environment, the SubmitJob request has to stay small
+MAX_SHARD_VALUES_BYTES = 4096
+
+
+def build_shards(spec):
+    """Build crawler shards from the spec
+
+    Args:
+        spec (str): "markets:us,ca" for one child per market or "symbols:16" for 16 symbol partitions
+
+    Returns:
+        dict: Shard key and the list of shard values, child N handles values[N]. For symbols values[N] is N
+    """
+    key, _, values = spec.partition(':')
+    if key not in SHARD_KEYS:
+        raise ValueError(f'Unknown shard key "{key}". Use one of {", ".join(SHARD_KEYS)}')
+    if key == 'markets':
+        shards = [item.strip() for item in values.split(',') if item.strip()]
+    else:
+        shards = [str(i) for i in range(int(values or 0))]
+    if not 1 <= len(shards) <= MAX_ARRAY_SIZE:
+        raise ValueError(f'Shard count must be between 1 and {MAX_ARRAY_SIZE}, got {len(shards)}')
+    if key == 'markets' and len(json.dumps(shards)) > MAX_SHARD_VALUES_BYTES:
+        raise ValueError(f'Market list is above {MAX_SHARD_VALUES_BYTES} bytes')
+    return {'key': key, 'values': shards}
+
+
+def submit_array_job(client, job_name, job_queue, job_definition, shards, vcpu, memory, attempts=1):
+    """Submit crawler work as an array job, one child per shard
+
+    Children share the overrides and find their shard with the AWS_BATCH_JOB_ARRAY_INDEX
+    env variable: symbols partition AWS_BATCH_JOB_ARRAY_INDEX of CRAWLER_SHARD_COUNT, or
+    market CRAWLER_SHARDS[AWS_BATCH_JOB_ARRAY_INDEX]. Symbol partitions are not listed, so
+    the request size doesn't grow with the shard count. Single shard is submitted as a plain job.
+
+    Args:
+        client (obj): Boto3 batch client
+        job_name (str): Job name
+        job_queue (str): Job queue
+        job_definition (str): Job definition ARN
+        shards (dict): build_shards result
+        vcpu (str): vCPUs of every child
+        memory (str): Memory of every child, MiB
+        attempts (int): Attempts per child
+
+    Returns:
+        dict: Job id and array size
+    """
+    request = {
+        'jobName': job_name,
+        'jobQueue': job_queue,
+        'jobDefinition': job_definition,
+        'retryStrategy': {'attempts': attempts},
+        'containerOverrides': {
+            'resourceRequirements': [
+                {'value': vcpu, 'type': 'VCPU'},
+                {'value': str(memory), 'type': 'MEMORY'}
+            ],
+            'environment': [
+                {'name': 'CRAWLER_SHARD_KEY', 'value': shards['key']},
+                {'name': 'CRAWLER_SHARD_COUNT', 'value': str(len(shards['values']))}
+            ]
+        }
+    }
+    if shards['key'] == 'markets':
+        request['containerOverrides']['environment'].append({'name': 'CRAWLER_SHARDS', 'value': json.dumps(shards['values'])})
+    size = len(shards['values'])
+    ## Array jobs need at least 2 children
+    if size > 1:
+        request['arrayProperties'] = {'size': size}
+    job = client.submit_job(**request)
+    logger.info(f"Submitted {job_name} {job['jobId']} with {size} {shards['key']} shards to {job_queue}")
+    return {'job_id': job['jobId'], 'size': size}
+
+
+def list_child_jobs(client, job_id, statuses=('SUCCEEDED', 'FAILED')):
+    """List child jobs of the array job
+
+    Returns:
+        list: Job summaries with index, status and timestamps
+    """
+    children = []
+    paginator = client.get_paginator('list_jobs')
+    for status in statuses:
+        for page in paginator.paginate(arrayJobId=job_id, jobStatus=status, PaginationConfig={'PageSize': 100}):
+            children.extend(page['jobSummaryList'])
+    return children
+
+
+def summarize_child_jobs(children, created_at):
+    """Aggregate child timings
+
+    Args:
+        children (list): list_child_jobs result
+        created_at (int): Array job creation time, epoch milliseconds
+
+    Returns:
+        dict: Wall time, summed child run time, slowest child, median, queue time and failed shard indexes
+    """
+    finished = [item for item in children if item.get('startedAt') and item.get('stoppedAt')]
+    durations = sorted((item['stoppedAt'] - item['startedAt']) / 1000 for item in finished)
+    queued = sorted((item['startedAt'] - created_at) / 1000 for item in finished)
+    wall_seconds = round((max(item['stoppedAt'] for item in finished) - created_at) / 1000, 2) if finished else 0
+    child_seconds = round(sum(durations), 2)
+    return {
+        'wall_seconds': wall_seconds,
+        'child_seconds': child_seconds,
+        'slowest_child_seconds': round(durations[-1], 2) if durations else 0,
+        'median_child_seconds': round(statistics.median(durations), 2) if durations else 0,
+        'median_queue_seconds': round(statistics.median(queued), 2) if queued else 0,
+        ## Close to the number of shards when children ran in parallel
+        'parallelism': round(child_seconds / wall_seconds, 2) if wall_seconds else 0,
+        'failed_indexes': sorted(
+            item.get('arrayProperties', {}).get('index', 0) for item in children if item['status'] == 'FAILED'
+        )
+    }
+
+
+def wait_for_array_job(client, job, timeout=7200, initial_delay=5, max_delay=60):
+    """Wait until all children finish and report their timing
+
+    Args:
+        client (obj): Boto3 batch client
+        job (dict): submit_array_job result
+        timeout (int): Seconds to wait
+        initial_delay (float): First polling interval
+        max_delay (float): Max polling interval
+
+    Returns:
+        dict: summarize_child_jobs result
+    """
+    started = time.time()
+    for delay in poll_intervals(initial_delay, max_delay):
+        description = client.describe_jobs(jobs=[job['job_id']])['jobs'][0]
+        status = description['status']
+        summary = description.get('arrayProperties', {}).get('statusSummary', {})
+        progress = ', '.join(f'{key.lower()} {value}' for key, value in summary.items() if value)
+        logger.info(f"{job['job_id']}: {status} {progress}".rstrip())
+        if status in ('SUCCEEDED', 'FAILED'):
+            break
+        if time.time() - started + delay > timeout:
+            raise RolloutTimeout(f"Batch job {job['job_id']} did not finish in {timeout}s, last status {status}")
+        time.sleep(delay)
+
+    if job['size'] > 1:
+        children = list_child_jobs(client, job['job_id'])
+    else:
+        children = [dict(description, jobId=job['job_id'])]
+    report = summarize_child_jobs(children, description.get('createdAt') or int(started * 1000))
+    logger.info(f"{job['job_id']}: {len(children)} children in {report['wall_seconds']}s, "
+                f"{report['child_seconds']}s of child time, slowest {report['slowest_child_seconds']}s, "
+                f"parallelism {report['parallelism']}")
+    if status == 'FAILED':
+        raise RolloutFailed(f"Batch job {job['job_id']} failed. Failed shards: {report['failed_indexes'] or description.get('statusReason')}")
+    return report
@@ -0,0 +1,775 @@
+"""
+Offline benchmark of deploy.py and fluent.py
+
+AWS calls are answered by an in-process fake backend hooked into the shared
+botocore session, so nothing leaves the machine. Every scenario reports wall
+time and API calls per operation.
+
+    python devops/benchmark.py
+    python devops/benchmark.py --scenario fargate --scenario manifest --repeat 5 --json bench.json
+
+Returns:
+    None:
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+### Never reach real AWS account, even if credentials are configured
+os.environ.pop('AWS_PROFILE', None)
+os.environ['AWS_ACCESS_KEY_ID'] = 'benchmark'
+os.environ['AWS_SECRET_ACCESS_KEY'] = 'benchmark'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-2'
+
+from botocore.awsrequest import AWSResponse
+
+import ssm
+import deploy
+from aws import get_session
+from metrics import metrics
+from fluentbit_profiles import PROFILES
+from taskdef import task_definition_hash, diff_task_definitions
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+ACCOUNT_ID = '123456789012'
+ENVIRONMENT = 'production'
+FIXTURE_REGION = 'us-east-2'
+
+### Synthetic fixture sizes: SSM path -> parameter count
+SSM_PATHS = {
+    'GLOBAL': 150,
+    'api': 220,
+    'lightserver': 120,
+    'crawler': 340,
+    'crawler-realtime': 180,
+    'alerts': 60,
+    'web': 90,
+}
+### Share of the parameters tagged for deletion(delete=1)
+DELETED_RATIO = 0.05
+### Running tasks of the restarted crawler-realtime service, more than one list_tasks page
+REALTIME_TASKS = 250
+
+
+class FakeAWS:
+    """In-process stand-in for ECS, SSM, S3, Batch, CodeDeploy and Application Auto Scaling
+
+    Responses are returned from the before-call event, so the deploy code runs
+    unchanged through boto3 clients, paginators and waiters.
+
+    Args:
+        latency (float): Seconds added to every API call, to make concurrency visible
+        seed (int): Fixture random seed
+    """
+
+    def __init__(self, latency=0.02, seed=1):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.random = random.Random(seed)
+        self.parameters = {}
+        self.tags = {}
+        self.task_definitions = {}
+        self.job_definitions = {}
+        self.services = {}
+        self.tasks = {}
+        self.task_details = {}
+        self.objects = {}
+        self.deployments = {}
+        self.jobs = {}
+        self.scheduled_actions = {}
+        self.target_groups = {}
+        self.scalable_targets = {}
+        self.scaling_policies = {}
+        ## Region of the call being answered. ECS services outside the fixture region are kept apart
+        self.region = FIXTURE_REGION
+        self.load_fixtures()
+
+    def load_fixtures(self):
+        """Build SSM parameters, task definitions, job definitions and running tasks"""
+        for path, count in SSM_PATHS.items():
+            for i in range(count):
+                ## Part of the names repeat GLOBAL ones, ssm_extend keeps the service value
+                key = f'SHARED_{i}' if path != 'GLOBAL' and i < 20 else f'{path.upper()}_VAR_{i}'
+                name = f'/{ENVIRONMENT}/{path}/{key}'
+                self.parameters[name] = {
+                    'Name': name,
+                    'ARN': f'arn:aws:ssm:us-east-2:{ACCOUNT_ID}:parameter{name}',
+                    'Type': 'SecureString',
+                    'Value': f'value-{i}',
+                    'Version': 1,
+                    'LastModifiedDate': 1700000000,
+                }
+                if self.random.random() < DELETED_RATIO:
+                    self.tags[name] = {'delete': '1'}
+
+        for family, container in (('api', 'api'), ('lightserver', 'lightserver'), ('crawler-realtime', 'crawler-realtime'),
+                                  ('alerts', 'alerts'), ('web', 'web'), ('adminapi', 'adminapi'), ('crawler', 'crawler')):
+            self.add_task_definition({
+                'family': family,
+                'taskRoleArn': f'arn:aws:iam::{ACCOUNT_ID}:role/{family}-task',
+                'executionRoleArn': f'arn:aws:iam::{ACCOUNT_ID}:role/{family}-execution',
+                'networkMode': 'bridge',
+                'compatibilities': ['EC2'],
+                'requiresCompatibilities': ['EC2'],
+                'memory': '1024',
+                'containerDefinitions': [{
+                    'name': container,
+                    'image': f'{ACCOUNT_ID}.dkr.ecr.us-east-2.amazonaws.com/{family}:previous',
+                    'cpu': 0,
+                    'essential': True,
+                    'portMappings': [{'containerPort': 3000, 'hostPort': 0, 'protocol': 'tcp'}],
+                    'secrets': [],
+                }],
+                'volumes': [{'name': 'logs'}],
+            })
+
+        self.job_definitions['crawler'] = {
+            'jobDefinitionName': 'crawler',
+            'revision': 1,
+            'containerProperties': {
+                'image': f'{ACCOUNT_ID}.dkr.ecr.us-east-2.amazonaws.com/crawler:previous',
+                'command': ['node', 'crawler.js'],
+                'secrets': [],
+                'resourceRequirements': [],
+            }
+        }
+
+        for service in ('api', 'web'):
+            self.target_groups[service] = f'arn:aws:elasticloadbalancing:us-east-2:{ACCOUNT_ID}:targetgroup/{service}-production/{sum(map(ord, service)):016x}'
+
+        self.tasks['crawler-realtime'] = {
+            f'arn:aws:ecs:us-east-2:{ACCOUNT_ID}:task/production-crawler-realtime/{i:032x}': 'RUNNING'
+            for i in range(REALTIME_TASKS)
+        }
+
+    def add_task_definition(self, definition):
+        """Store new task definition revision
+
+        Returns:
+            dict: Stored task definition
+        """
+        revisions = self.task_definitions.setdefault(definition['family'], [])
+        definition = dict(definition)
+        definition['revision'] = len(revisions) + 1
+        definition['taskDefinitionArn'] = f'arn:aws:ecs:us-east-2:{ACCOUNT_ID}:task-definition/{definition["family"]}:{definition["revision"]}'
+        definition['status'] = 'ACTIVE'
+        revisions.append(definition)
+        return definition
+
+    def install(self, session):
+        """Register fake responder on the shared session. Must run before clients are created
+
+        Args:
+            session (obj): Shared boto3 session
+        """
+        session.events.register('before-parameter-build', self.capture_params)
+        ## Registered last, so the metrics hooks still count the calls
+        session.events.register_last('before-call', self.respond)
+
+    def capture_params(self, params, context, **kwargs):
+        """Keep API params, before-call only sees the serialized request"""
+        context['benchmark_params'] = dict(params)
+
+    def respond(self, model, context, **kwargs):
+        """Answer API call from the fake state
+
+        Returns:
+            tuple: HTTP response and parsed response
+        """
+        service = model.service_model.service_id.hyphenize()
+        with self.lock:
+            self.calls[f'{service}.{model.name}'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        handler = getattr(self, f'{service.replace("-", "_")}_{model.name}', None)
+        if handler is None:
+            raise NotImplementedError(f'Benchmark backend does not implement {service}.{model.name}')
+        with self.lock:
+            self.region = context.get('client_region') or FIXTURE_REGION
+            status, parsed = handler(context.get('benchmark_params', {}))
+        parsed.setdefault('ResponseMetadata', {'HTTPStatusCode': status})
+        return AWSResponse(None, status, {}, None), parsed
+
+    @staticmethod
+    def page(items, params, limit_key, token_key, default_limit=50):
+        """Slice items into one page
+
+        Returns:
+            tuple: Page items and next token
+        """
+        start = int(params.get(token_key) or 0)
+        end = start + int(params.get(limit_key) or default_limit)
+        return items[start:end], str(end) if end < len(items) else None
+
+    @staticmethod
+    def error(status, code, message=''):
+        return status, {'Error': {'Code': code, 'Message': message}}
+
+    # ------------------------------- SSM -------------------------------
+
+    def path_parameters(self, path):
+        prefix = f'{path.rstrip("/")}/'
+        return [
+            item for name, item in sorted(self.parameters.items())
+            if name.startswith(prefix) and '/' not in name[len(prefix):]
+        ]
+
+    def ssm_DescribeParameters(self, params):
+        items = list(self.parameters.values())
+        for item in params.get('ParameterFilters', []):
+            if item['Key'] == 'Path':
+                items = self.path_parameters(item['Values'][0])
+            elif item['Key'].startswith('tag:'):
+                tag = item['Key'][4:]
+                items = [entry for entry in items if self.tags.get(entry['Name'], {}).get(tag) in item['Values']]
+        page, token = self.page(items, params, 'MaxResults', 'NextToken')
+        response = {'Parameters': [{key: value for key, value in entry.items() if key != 'Value'} for entry in page]}
+        if token:
+            response['NextToken'] = token
+        return 200, response
+
+    def ssm_GetParametersByPath(self, params):
+        page, token = self.page(self.path_parameters(params['Path']), params, 'MaxResults', 'NextToken', 10)
+        response = {'Parameters': [dict(entry) for entry in page]}
+        if token:
+            response['NextToken'] = token
+        return 200, response
+
+    def ssm_GetParameters(self, params):
+        names = params['Names']
+        return 200, {
+            'Parameters': [dict(self.parameters[name]) for name in names if name in self.parameters],
+            'InvalidParameters': [name for name in names if name not in self.parameters]
+        }
+
+    def ssm_PutParameter(self, params):
+        current = self.parameters.get(params['Name'])
+        version = current['Version'] + 1 if current else 1
+        self.parameters[params['Name']] = dict(current or {}, Name=params['Name'], Value=params['Value'], Version=version,
+                                               Type=params.get('Type', 'String'),
+                                               ARN=f'arn:aws:ssm:{self.region}:{ACCOUNT_ID}:parameter{params["Name"]}')
+        return 200, {'Version': version}
+
+    def ssm_DeleteParameters(self, params):
+        deleted = [name for name in params['Names'] if self.parameters.pop(name, None)]
+        return 200, {'DeletedParameters': deleted, 'InvalidParameters': [name for name in params['Names'] if name not in deleted]}
+
+    # ------------------------------- ECS -------------------------------
+
+    def ecs_ListTaskDefinitions(self, params):
+        revisions = self.task_definitions.get(params['familyPrefix'], [])
+        arns = [item['taskDefinitionArn'] for item in revisions]
+        if params.get('sort') == 'DESC':
+            arns.reverse()
+        return 200, {'taskDefinitionArns': arns[:params.get('maxResults', 100)]}
+
+    def ecs_DescribeTaskDefinition(self, params):
+        family, _, revision = params['taskDefinition'].split('/')[-1].partition(':')
+        revisions = self.task_definitions.get(family)
+        if not revisions:
+            return self.error(400, 'ClientException', 'Unable to describe task definition.')
+        definition = revisions[int(revision) - 1] if revision else revisions[-1]
+        return 200, {'taskDefinition': json.loads(json.dumps(definition)), 'tags': []}
+
+    @staticmethod
+    def server_defaults(definition):
+        """Values ECS fills in on registration, describe_task_definition returns them"""
+        network_mode = definition.get('networkMode', 'bridge')
+        for container in definition['containerDefinitions']:
+            container.setdefault('cpu', 0)
+            container.setdefault('essential', True)
+            container.setdefault('volumesFrom', [])
+            for mapping in container.get('portMappings', []):
+                mapping.setdefault('protocol', 'tcp')
+                if network_mode == 'awsvpc' and 'containerPort' in mapping:
+                    mapping['hostPort'] = mapping['containerPort']
+            for mount in container.get('mountPoints', []):
+                mount.setdefault('readOnly', False)
+            if 'healthCheck' in container:
+                for key, value in (('interval', 30), ('timeout', 5), ('retries', 3)):
+                    container['healthCheck'].setdefault(key, value)
+        for volume in definition.get('volumes', []):
+            volume.setdefault('host', {})
+        return definition
+
+    def ecs_RegisterTaskDefinition(self, params):
+        definition = self.add_task_definition(self.server_defaults(json.loads(json.dumps(params))))
+        return 200, {'taskDefinition': json.loads(json.dumps(definition))}
+
+    def task_timestamps(self, task_definition):
+        """Synthetic start timeline of a new task, for the cold start profiler"""
+        created = datetime.now(timezone.utc)
+        pull_started = created + timedelta(seconds=self.random.uniform(2, 20))
+        pull_stopped = pull_started + timedelta(seconds=self.random.uniform(5, 40))
+        return {
+            'taskDefinitionArn': task_definition,
+            'createdAt': created,
+            'pullStartedAt': pull_started,
+            'pullStoppedAt': pull_stopped,
+            'startedAt': pull_stopped + timedelta(seconds=self.random.uniform(1, 8)),
+            'healthStatus': 'UNKNOWN',
+        }
+
+    def service_key(self, name):
+        """ECS service state key in the region of the current call"""
+        return name if self.region == FIXTURE_REGION else f'{name}@{self.region}'
+
+    def ecs_UpdateService(self, params):
+        key = self.service_key(params['service'])
+        service = self.services.setdefault(key, {'desiredCount': 1})
+        service.update({name: value for name, value in params.items() if name != 'service'})
+        if service.get('desiredCount') == 0:
+            ## Scheduler stops nothing by itself here, deploy stops the tasks
+            pass
+        else:
+            for arn, status in list(self.tasks.get(key, {}).items()):
+                if status == 'STOPPED':
+                    del self.tasks[key][arn]
+            for i in range(service['desiredCount']):
+                arn = f'arn:aws:ecs:{self.region}:{ACCOUNT_ID}:task/{params["cluster"]}/new{i:029x}'
+                self.tasks.setdefault(key, {})[arn] = 'RUNNING'
+                self.task_details[arn] = self.task_timestamps(service.get('taskDefinition', ''))
+        return 200, {'service': self.describe_service(params['service'])}
+
+    def describe_service(self, name):
+        service = self.services.setdefault(self.service_key(name), {'desiredCount': 1})
+        count = service['desiredCount']
+        description = {
+            'serviceName': name,
+            'status': 'ACTIVE',
+            'taskDefinition': service.get('taskDefinition', ''),
+            'desiredCount': count,
+            'runningCount': count,
+            'pendingCount': 0,
+            'deployments': [{
+                'id': f'ecs-svc/{name}',
+                'status': 'PRIMARY',
+                'taskDefinition': service.get('taskDefinition', ''),
+                'desiredCount': count,
+                'runningCount': count,
+                'pendingCount': 0,
+                'failedTasks': 0,
+                'rolloutState': 'COMPLETED',
+            }]
+        }
+        for key in ('capacityProviderStrategy', 'placementStrategy', 'placementConstraints'):
+            if key in service:
+                description[key] = service[key]
+        if name in self.target_groups:
+            description['loadBalancers'] = [{'targetGroupArn': self.target_groups[name], 'containerName': name, 'containerPort': 3000}]
+        return description
+
+    def ecs_DescribeServices(self, params):
+        return 200, {'services': [self.describe_service(name) for name in params['services']], 'failures': []}
+
+    def ecs_ListTasks(self, params):
+        tasks = self.tasks.get(self.service_key(params.get('serviceName')), {})
+        desired_status = params.get('desiredStatus', 'RUNNING')
+        arns = [arn for arn, status in tasks.items() if status == desired_status]
+        page, token = self.page(arns, params, 'maxResults', 'nextToken', 100)
+        response = {'taskArns': page}
+        if token:
+            response['nextToken'] = token
+        return 200, response
+
+    def ecs_StopTask(self, params):
+        for tasks in self.tasks.values():
+            if params['task'] in tasks:
+                tasks[params['task']] = 'STOPPED'
+        return 200, {'task': {'taskArn': params['task'], 'lastStatus': 'STOPPED', 'desiredStatus': 'STOPPED'}}
+
+    def ecs_DescribeTasks(self, params):
+        statuses = {arn: status for tasks in self.tasks.values() for arn, status in tasks.items()}
+        return 200, {
+            'tasks': [
+                dict(self.task_details.get(arn, {}), taskArn=arn, lastStatus=statuses.get(arn, 'STOPPED'))
+                for arn in params['tasks']
+            ],
+            'failures': []
+        }
+
+    # ------------------------------- Batch -------------------------------
+
+    def batch_DescribeJobDefinitions(self, params):
+        definition = self.job_definitions.get(params.get('jobDefinitionName'))
+        return 200, {'jobDefinitions': [json.loads(json.dumps(definition))] if definition else []}
+
+    def batch_RegisterJobDefinition(self, params):
+        current = self.job_definitions.get(params['jobDefinitionName'], {'revision': 0})
+        definition = dict(json.loads(json.dumps(params)), revision=current['revision'] + 1)
+        self.job_definitions[params['jobDefinitionName']] = definition
+        return 200, {
+            'jobDefinitionName': definition['jobDefinitionName'],
+            'jobDefinitionArn': f'arn:aws:batch:us-east-2:{ACCOUNT_ID}:job-definition/{definition["jobDefinitionName"]}:{definition["revision"]}',
+            'revision': definition['revision']
+        }
+
+    def batch_SubmitJob(self, params):
+        job_id = f'job-{len(self.jobs):08d}'
+        self.jobs[job_id] = dict(params, size=params.get('arrayProperties', {}).get('size', 1), createdAt=int(time.time() * 1000))
+        return 200, {'jobId': job_id, 'jobName': params['jobName'], 'jobArn': f'arn:aws:batch:us-east-2:{ACCOUNT_ID}:job/{job_id}'}
+
+    def batch_DescribeJobs(self, params):
+        ## Children finish right after submit, each ran 10 minutes
+        return 200, {'jobs': [
+            {
+                'jobId': job_id,
+                'jobName': self.jobs[job_id]['jobName'],
+                'status': 'SUCCEEDED',
+                'createdAt': self.jobs[job_id]['createdAt'],
+                'startedAt': self.jobs[job_id]['createdAt'],
+                'stoppedAt': self.jobs[job_id]['createdAt'] + 600000,
+                'arrayProperties': {'statusSummary': {'SUCCEEDED': self.jobs[job_id]['size']}, 'size': self.jobs[job_id]['size']},
+            }
+            for job_id in params['jobs'] if job_id in self.jobs
+        ]}
+
+    def batch_ListJobs(self, params):
+        job = self.jobs[params['arrayJobId']]
+        children = [] if params.get('jobStatus') != 'SUCCEEDED' else [
+            {
+                'jobId': f'{params["arrayJobId"]}:{i}',
+                'jobName': job['jobName'],
+                'status': 'SUCCEEDED',
+                ## Staggered start as capacity is allocated
+                'startedAt': job['createdAt'] + 30000 + i % 50 * 1000,
+                'stoppedAt': job['createdAt'] + 630000 + i % 50 * 1000 + i * 100,
+                'arrayProperties': {'index': i},
+            }
+            for i in range(job['size'])
+        ]
+        page, token = self.page(children, params, 'maxResults', 'nextToken', 100)
+        response = {'jobSummaryList': page}
+        if token:
+            response['nextToken'] = token
+        return 200, response
+
+    # ------------------------------- S3 -------------------------------
+
+    def s3_HeadObject(self, params):
+        item = self.objects.get((params['Bucket'], params['Key']))
+        if item is None:
+            return self.error(404, '404', 'Not Found')
+        return 200, {'ETag': f'"{item["digest"]}"', 'Metadata': item['metadata'], 'ContentLength': item['size']}
+
+    def s3_PutObject(self, params):
+        body = params['Body']
+        ## Body is wrapped in a file object by the S3 parameter handlers
+        if hasattr(body, 'read'):
+            body = body.read()
+        metadata = params.get('Metadata', {})
+        self.objects[(params['Bucket'], params['Key'])] = {
+            'digest': metadata.get('content-md5', ''),
+            'metadata': metadata,
+            'size': len(body)
+        }
+        return 200, {'ETag': f'"{metadata.get("content-md5", "")}"'}
+
+    # ------------------------------- CodeDeploy -------------------------------
+
+    def codedeploy_CreateDeployment(self, params):
+        deployment_id = f'd-BENCH{len(self.deployments):05d}'
+        self.deployments[deployment_id] = params
+        return 200, {'deploymentId': deployment_id}
+
+    def codedeploy_GetDeployment(self, params):
+        return 200, {'deploymentInfo': {'deploymentId': params['deploymentId'], 'status': 'Succeeded'}}
+
+    def codedeploy_ListDeploymentTargets(self, params):
+        return 200, {'targetIds': [f'{params["deploymentId"]}-target']}
+
+    def codedeploy_BatchGetDeploymentTargets(self, params):
+        return 200, {'deploymentTargets': [{
+            'deploymentTargetType': 'ECSTarget',
+            'ecsTarget': {'taskSetsInfo': [
+                {'taskSetLabel': 'Blue', 'trafficWeight': 0.0},
+                {'taskSetLabel': 'Green', 'trafficWeight': 100.0},
+            ]}
+        }]}
+
+    # ------------------------------- ELB -------------------------------
+
+    def elastic_load_balancing_v2_DescribeTargetGroups(self, params):
+        return 200, {'TargetGroups': [
+            {
+                'TargetGroupArn': arn,
+                'LoadBalancerArns': [f'arn:aws:elasticloadbalancing:us-east-2:{ACCOUNT_ID}:loadbalancer/app/production/50dc6c495c0c9188']
+            }
+            for arn in params['TargetGroupArns']
+        ]}
+
+    # ------------------------------- Application Auto Scaling -------------------------------
+
+    def application_auto_scaling_RegisterScalableTarget(self, params):
+        self.scalable_targets[params['ResourceId']] = params
+        return 200, {'ScalableTargetARN': f'arn:aws:application-autoscaling:us-east-2:{ACCOUNT_ID}:scalable-target/{params["ResourceId"]}'}
+
+    def application_auto_scaling_PutScheduledAction(self, params):
+        self.scheduled_actions[params['ScheduledActionName']] = params
+        return 200, {}
+
+    def application_auto_scaling_DescribeScheduledActions(self, params):
+        items = [item for item in self.scheduled_actions.values() if item['ResourceId'] == params.get('ResourceId')]
+        page, token = self.page(items, params, 'MaxResults', 'NextToken')
+        response = {'ScheduledActions': [dict(item) for item in page]}
+        if token:
+            response['NextToken'] = token
+        return 200, response
+
+    def application_auto_scaling_DeleteScheduledAction(self, params):
+        self.scheduled_actions.pop(params['ScheduledActionName'], None)
+        return 200, {}
+
+    def application_auto_scaling_DescribeScalableTargets(self, params):
+        return 200, {'ScalableTargets': [
+            dict(self.scalable_targets[resource_id])
+            for resource_id in params.get('ResourceIds', []) if resource_id in self.scalable_targets
+        ]}
+
+    def application_auto_scaling_DescribeScalingPolicies(self, params):
+        items = [item for item in self.scaling_policies.values() if item['ResourceId'] == params.get('ResourceId')]
+        page, token = self.page(items, params, 'MaxResults', 'NextToken', 10)
+        response = {'ScalingPolicies': [json.loads(json.dumps(item)) for item in page]}
+        if token:
+            response['NextToken'] = token
+        return 200, response
+
+    def application_auto_scaling_DeleteScalingPolicy(self, params):
+        self.scaling_policies.pop(params['PolicyName'], None)
+        return 200, {}
+
+    def application_auto_scaling_PutScalingPolicy(self, params):
+        self.scaling_policies[params['PolicyName']] = params
+        return 200, {
+            'PolicyARN': f'arn:aws:autoscaling:us-east-2:{ACCOUNT_ID}:scalingPolicy:{params["ResourceId"]}:policyName/{params["PolicyName"]}',
+            'Alarms': []
+        }
+
+
+def service_argv(service, family, cluster, servicenames, *extra):
+    """deploy.py args of the benchmark service"""
+    return [
+        '--cluster', cluster,
+        '--service', service,
+        '--family', family,
+        '--port', '3000',
+        '--memory', '2048',
+        '--cpu', '1024',
+        '--capacityprovider', f'{cluster}-capacity',
+        '--contanername', family,
+        '--environment', ENVIRONMENT,
+        '--servicenames', servicenames,
+        '--onlybatch', '0',
+        *extra
+    ]
+
+
+def write_manifest(directory):
+    """Write manifest with several services sharing SSM paths
+
+    Returns:
+        str: Manifest path
+    """
+    manifest = {
+        'defaults': {
+            'environment': ENVIRONMENT,
+            'port': 3000,
+            'memory': 2048,
+            'cpu': 1024,
+            'onlybatch': 0,
+        },
+        'services': [
+            {'service': 'api', 'family': 'api', 'contanername': 'api', 'cluster': 'production-api',
+             'capacityprovider': 'api-capacity', 'servicenames': 'GLOBAL api', 'fargate': True},
+            {'service': 'adminapi', 'family': 'adminapi', 'contanername': 'adminapi', 'cluster': 'production-api',
+             'capacityprovider': 'api-capacity', 'servicenames': 'GLOBAL api'},
+            {'service': 'alerts', 'family': 'alerts', 'contanername': 'alerts', 'cluster': 'production-alerts',
+             'capacityprovider': 'alerts-capacity', 'servicenames': 'GLOBAL alerts',
+             'placement_strategy': 'binpack:memory', 'placement_constraint': ['memberOf:attribute:ecs.os-type == linux']},
+            {'service': 'web', 'family': 'web', 'contanername': 'web', 'cluster': 'production-web',
+             'capacityprovider': 'web-capacity', 'servicenames': 'GLOBAL web'},
+            {'service': 'lightserver', 'family': 'lightserver', 'contanername': 'lightserver', 'cluster': 'production-lightserver',
+             'capacityprovider': 'lightserver-capacity', 'servicenames': 'GLOBAL lightserver',
+             'deployment': 'lightserver', 'deploymentgroup': 'lightserver-production'},
+        ]
+    }
+    path = os.path.join(directory, 'manifest.json')
+    with open(path, 'w') as f:
+        f.write(json.dumps(manifest, indent=4))
+    return path
+
+
+def run_deploy(argv):
+    """Run deploy.py main, exit code 0 is expected"""
+    try:
+        deploy.main(argv)
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError(f'deploy.py exited with {e.code}')
+
+
+def run_fluent(directory):
+    """Render fluent.conf with fluent.py for every profile"""
+    os.makedirs(os.path.join(directory, 'builds', 'fluent'), exist_ok=True)
+    cwd, argv = os.getcwd(), sys.argv
+    try:
+        ## fluent.py writes builds/fluent/fluent.conf relative to the working directory
+        os.chdir(directory)
+        for profile in PROFILES:
+            sys.argv = ['fluent.py', '--service', 'api', '--containername', 'api', '--profile', profile]
+            runpy.run_path(os.path.join(DIR_PATH, 'fluent.py'), run_name='__main__')
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+
+
+def check_taskdef_fixtures(directory):
+    """register_task_definition args and the describe_task_definition output ECS returns for them hash the same"""
+    with open(os.path.join(DIR_PATH, 'taskdef_fixtures.json')) as f:
+        fixtures = json.loads(f.read())
+    for fixture in fixtures:
+        if task_definition_hash(fixture['register']) != task_definition_hash(fixture['describe']):
+            raise RuntimeError(f"{fixture['name']} describe output doesn't normalize to the register args:\n"
+                               f"{diff_task_definitions(fixture['describe'], fixture['register'])}")
+
+
+def reconcile_argv(*extra):
+    """lightserver deploy with reconciled autoscaling"""
+    return service_argv('lightserver', 'lightserver', 'production-lightserver', 'GLOBAL lightserver',
+                        '--enable_autoscaling', '--autoscaling_mode', 'reconcile', '--target_cpu', '60',
+                        '--market_sessions', 'pre:2,regular:6,post:2', *extra)
+
+
+SCENARIOS = {
+    'batch_only': lambda directory: run_deploy(
+        service_argv('crawler', 'crawler', 'production-crawler', 'GLOBAL crawler', '--onlybatch', '1')
+    ),
+    'batch_array': lambda directory: run_deploy(
+        service_argv('crawler', 'crawler', 'production-crawler', 'GLOBAL crawler', '--onlybatch', '1',
+                     '--batch_shards', 'symbols:250', '--batch_queue', 'crawler-production', '--shard_cpu', '512',
+                     '--shard_memory', '1024', '--wait', '--poll_initial', '0.1')
+    ),
+    'fargate': lambda directory: run_deploy(
+        service_argv('api', 'api', 'production-api', 'GLOBAL api', '--fargate', '--wait',
+                     '--capacity_strategy', 'FARGATE:2:1,FARGATE_SPOT:0:3',
+                     '--enable_autoscaling', '--target_cpu', '60', '--target_memory', '70', '--target_requests', '1000',
+                     '--target_metric', json.dumps({'name': 'latency', 'namespace': 'TraderLion/App', 'metric': 'http_server_duration',
+                                                    'statistic': 'p95', 'target': 0.25, 'dimensions': {'ServiceName': '{service}'}}),
+                     '--scale_in_cooldown', '300')
+    ),
+    'ec2_bridge': lambda directory: run_deploy(
+        service_argv('crawler-realtime', 'crawler-realtime', 'production-crawler-realtime', 'GLOBAL crawler-realtime',
+                     '--stable_poll_delay', '1', '--fluentbit_profile', 'high_throughput',
+                     '--placement_strategy', 'spread:attribute:ecs.availability-zone,binpack:memory')
+    ),
+    'codedeploy': lambda directory: run_deploy(
+        service_argv('lightserver', 'lightserver', 'production-lightserver', 'GLOBAL lightserver',
+                     '--deployment', 'lightserver', '--deploymentgroup', 'lightserver-production',
+                     '--placement_constraint', 'distinctInstance',
+                     '--wait', '--poll_initial', '0.1', '--enable_autoscaling', '--target_cpu', '60',
+                     '--market_sessions', 'pre:2,regular:6,post:2')
+    ),
+    'manifest': lambda directory: run_deploy(['--manifest', write_manifest(directory), '--workers', '4']),
+    'coldstart': lambda directory: run_deploy(
+        service_argv('web', 'web', 'production-web', 'GLOBAL web', '--desired_count', '20', '--coldstart_report',
+                     '--coldstart_history', directory, '--poll_initial', '0.1')
+    ),
+    'secrets_bundle': lambda directory: run_deploy(
+        service_argv('web', 'web', 'production-web', 'GLOBAL web', '--secrets_bundle', '--markettype', 'us')
+    ),
+    'multi_region': lambda directory: run_deploy(
+        service_argv('web', 'web', 'production-web', 'GLOBAL web', '--regions', 'us-east-2,us-west-2,eu-west-1',
+                     '--wait', '--poll_initial', '0.1')
+    ),
+    'fluent': run_fluent,
+    'taskdef_fixtures': check_taskdef_fixtures,
+    ## Autoscaling is already configured by the setup run, only the memory policy is new
+    'autoscaling_reconcile': lambda directory: run_deploy(reconcile_argv('--target_memory', '70', '--force')),
+}
+
+### Run before the scenario, not measured
+SETUPS = {
+    'autoscaling_reconcile': lambda directory: run_deploy(reconcile_argv()),
+}
+
+
+def run_scenario(name, latency):
+    """Run scenario against fresh fake backend state
+
+    Returns:
+        dict: Wall time, API calls and deploy phases
+    """
+    backend.__init__(latency=latency)
+    metrics.reset()
+    ssm.api_calls.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        if name in SETUPS:
+            SETUPS[name](directory)
+            backend.calls.clear()
+            metrics.reset()
+            ssm.api_calls.clear()
+        started = time.monotonic()
+        SCENARIOS[name](directory)
+        seconds = time.monotonic() - started
+    return {
+        'seconds': seconds,
+        'api_calls': dict(sorted(backend.calls.items())),
+        'api_calls_total': sum(backend.calls.values()),
+        'phases': {service: item['phases'] for service, item in metrics.summary().items()},
+    }
+
+
+parser = argparse.ArgumentParser(description='offline benchmark of the deploy scripts')
+parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Scenario to run. Can be repeated, defaults to all', default=[])
+parser.add_argument('--repeat', type=int, help='Runs per scenario, median wall time is reported', default=3)
+parser.add_argument('--latency_ms', type=float, help='Simulated latency of every API call', default=20)
+parser.add_argument('--json', type=str, help='Write results to the JSON file, to compare runs', default=None)
+parser.add_argument('--verbose', action='store_true', help='Keep deploy logs', default=False)
+
+### Fake backend is installed once, clients keep the session event hooks they were created with
+backend = FakeAWS()
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if not args.verbose:
+        ## deploy.py and fluent.py set up logging on every run
+        os.environ['DEPLOY_LOG_LEVEL'] = 'WARNING'
+    os.environ.setdefault('ES_HOST', 'search-benchmark.us-east-2.es.amazonaws.com')
+    os.environ['production_image'] = f'{ACCOUNT_ID}.dkr.ecr.us-east-2.amazonaws.com/app:benchmark'
+
+    session = get_session()
+    backend.install(session)
+    metrics.install(session)
+
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        runs = [run_scenario(name, args.latency_ms / 1000) for _ in range(max(1, args.repeat))]
+        result = runs[-1]
+        result['seconds'] = round(statistics.median(run['seconds'] for run in runs), 3)
+        result['runs'] = [round(run['seconds'], 3) for run in runs]
+        results[name] = result
+
+    print(f'{"scenario":<22} {"wall":>9} {"calls":>6}  top operations')
+    for name, result in results.items():
+        top = ', '.join(f'{operation} {count}' for operation, count in Counter(result['api_calls']).most_common(4))
+        print(f'{name:<22} {result["seconds"]:>8.3f}s {result["api_calls_total"]:>6}  {top}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""
+Task cold start profiler: where new tasks of a revision spend the time until they are healthy
+
+    python devops/coldstart.py --cluster production-api --service api
+    python devops/coldstart.py --cluster production-api --service api --task_definition api:42 --timeout 0
+
+Returns:
+    None:
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import datetime, timezone
+
+from log import LOG_FORMATS, setup_logging
+from aws import get_client, get_region
+from sizing import percentile
+from rollout import DESCRIBE_TASKS_BATCH_SIZE, list_service_tasks, poll_intervals
+
+logger = logging.getLogger("Deployment")
+
+### Phase -> (start, end) describe_tasks timestamps. healthyAt is observed by polling
+PHASES = {
+    ## Placement, capacity provider scale out, ENI attachment
+    'provisioning': ('createdAt', 'pullStartedAt'),
+    'pull': ('pullStartedAt', 'pullStoppedAt'),
+    ## Secrets resolution, log_router START dependency, container creation
+    'start': ('pullStoppedAt', 'startedAt'),
+    ## App boot until the container health check passes
+    'boot': ('startedAt', 'healthyAt'),
+    'total': ('createdAt', 'healthyAt'),
+}
+PERCENTILES = (50, 90, 99)
+DEFAULT_HISTORY_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.coldstart')
+
+
+def has_health_check(client, task_definition):
+    """Check if any container of the task definition has a health check"""
+    definition = client.describe_task_definition(taskDefinition=task_definition)['taskDefinition']
+    return any(container.get('healthCheck') for container in definition['containerDefinitions'])
+
+
+def describe_revision_tasks(client, cluster, service, task_definition):
+    """Describe running service tasks of the task definition revision
+
+    Returns:
+        list: describe_tasks entries
+    """
+    task_arns = list_service_tasks(client, cluster, service)
+    tasks = []
+    for i in range(0, len(task_arns), DESCRIBE_TASKS_BATCH_SIZE):
+        response = client.describe_tasks(cluster=cluster, tasks=task_arns[i:i + DESCRIBE_TASKS_BATCH_SIZE])
+        tasks.extend(task for task in response['tasks'] if task.get('taskDefinitionArn') == task_definition)
+    return tasks
+
+
+def watch_cold_starts(client, cluster, service, task_definition, expected=None, timeout=900,
+                      initial_delay=2, max_delay=10, stop=None):
+    """Poll tasks of the revision until the expected number of them is healthy
+
+    Health transitions have no timestamp in describe_tasks, healthyAt is the first poll
+    seeing HEALTHY. Tasks already healthy on the first poll get no boot/total phases.
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        task_definition (str): Task definition ARN of the new revision
+        expected (int): Tasks to wait for. Defaults to the service desired count
+        timeout (int): Seconds to wait. 0 takes a single snapshot
+        initial_delay (float): First polling interval, seconds
+        max_delay (float): Max polling interval, seconds
+        stop (threading.Event): Stops polling, for example when the rollout failed
+
+    Returns:
+        dict: Task ARN -> timestamps
+    """
+    health_check = has_health_check(client, task_definition)
+    deadline = time.monotonic() + timeout
+    timestamps = {}
+    first_poll = True
+    intervals = poll_intervals(initial_delay, max_delay)
+    while True:
+        now = datetime.now(timezone.utc)
+        for task in describe_revision_tasks(client, cluster, service, task_definition):
+            item = timestamps.setdefault(task['taskArn'], {'healthCheck': health_check})
+            item.update({key: task[key] for key in ('createdAt', 'pullStartedAt', 'pullStoppedAt', 'startedAt') if task.get(key)})
+            if 'healthyAt' in item or 'startedAt' not in item:
+                continue
+            if not health_check:
+                item['healthyAt'] = item['startedAt']
+            elif task.get('healthStatus') == 'HEALTHY':
+                item['healthyAt'] = None if first_poll else now
+        first_poll = False
+
+        target = expected
+        if target is None:
+            target = client.describe_services(cluster=cluster, services=[service])['services'][0]['desiredCount']
+        healthy = sum(1 for item in timestamps.values() if 'healthyAt' in item)
+        if healthy >= target or time.monotonic() >= deadline or (stop is not None and stop.is_set()):
+            break
+        delay = min(next(intervals), max(0.0, deadline - time.monotonic()))
+        if stop is not None:
+            stop.wait(delay)
+        else:
+            time.sleep(delay)
+
+    if not health_check:
+        logger.info(f'{task_definition} has no container health check, tasks count as healthy once started')
+    return timestamps
+
+
+def phase_durations(timestamps):
+    """Seconds spent in every phase with both timestamps known"""
+    durations = {}
+    for phase, (start, end) in PHASES.items():
+        ## Without health check healthyAt is startedAt, boot time is unknown
+        if phase == 'boot' and not timestamps.get('healthCheck', True):
+            continue
+        if timestamps.get(start) and timestamps.get(end):
+            durations[phase] = (timestamps[end] - timestamps[start]).total_seconds()
+    return durations
+
+
+def summarize_phases(timestamps):
+    """Per phase percentiles over the tasks
+
+    Args:
+        timestamps (dict): Task ARN -> timestamps
+
+    Returns:
+        dict: Phase -> count and p50/p90/p99 seconds
+    """
+    samples = {}
+    for item in timestamps.values():
+        for phase, seconds in phase_durations(item).items():
+            samples.setdefault(phase, []).append(seconds)
+    summary = {}
+    for phase in PHASES:
+        if phase in samples:
+            summary[phase] = {'count': len(samples[phase])}
+            summary[phase].update({f'p{value}': round(percentile(samples[phase], value), 2) for value in PERCENTILES})
+    return summary
+
+
+def history_path(history_dir, cluster, service):
+    """History file of the service, one JSON line per profiled revision"""
+    return os.path.join(history_dir or DEFAULT_HISTORY_DIR, f'{get_region()}-{cluster}-{service}.jsonl')
+
+
+def load_history(path):
+    """Read history records, oldest first"""
+    try:
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def append_history(path, record):
+    """Append the record to the history file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def compare_phases(current, previous):
+    """p50/p90 change of every phase against the previous revision, seconds"""
+    changes = {}
+    for phase, item in current.items():
+        if phase in previous:
+            changes[phase] = {key: round(item[key] - previous[phase][key], 2) for key in ('p50', 'p90')}
+    return changes
+
+
+def profile_cold_starts(client, cluster, service, task_definition, expected=None, timeout=900,
+                        history_dir=None, stop=None, initial_delay=2, max_delay=10):
+    """Profile the new revision tasks, compare with the previous revision and store the history
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        task_definition (str): Task definition ARN or family:revision
+        expected (int): Tasks to wait for. Defaults to the service desired count
+        timeout (int): Seconds to wait for the tasks to become healthy
+        history_dir (str): History directory. Defaults to devops/.coldstart
+        stop (threading.Event): Stops waiting for the tasks
+        initial_delay (float): First polling interval, seconds
+        max_delay (float): Max polling interval, seconds
+
+    Returns:
+        dict: Phase percentiles, change against the previous revision
+    """
+    task_definition = client.describe_task_definition(taskDefinition=task_definition)['taskDefinition']['taskDefinitionArn']
+    timestamps = watch_cold_starts(client, cluster, service, task_definition, expected, timeout,
+                                   initial_delay, max_delay, stop)
+    report = {
+        'task_definition': task_definition,
+        'tasks': len(timestamps),
+        'healthy': sum(1 for item in timestamps.values() if 'healthyAt' in item),
+        'phases': summarize_phases(timestamps),
+    }
+
+    path = history_path(history_dir, cluster, service)
+    previous = [item for item in load_history(path) if item['task_definition'] != task_definition]
+    if previous:
+        report['previous_task_definition'] = previous[-1]['task_definition']
+        report['change'] = compare_phases(report['phases'], previous[-1]['phases'])
+    if timestamps:
+        append_history(path, dict(report, recorded_at=datetime.now(timezone.utc).isoformat(), cluster=cluster, service=service))
+
+    for phase, item in report['phases'].items():
+        change = report.get('change', {}).get(phase)
+        change = f", p50 {change['p50']:+.2f}s against previous revision" if change else ''
+        logger.info(f"Cold start {service} {phase:<12} p50 {item['p50']:>7.2f}s p90 {item['p90']:>7.2f}s "
+                    f"p99 {item['p99']:>7.2f}s ({item['count']} tasks){change}")
+    return report
+
+
+parser = argparse.ArgumentParser(description='ECS task cold start profiler')
+parser.add_argument('--cluster', type=str, help='ECS cluster')
+parser.add_argument('--service', type=str, help='ECS service name')
+parser.add_argument('--task_definition', type=str, help='Revision to profile. Defaults to the service task definition', default=None)
+parser.add_argument('--timeout', type=int, help='Seconds to wait for the tasks to become healthy. 0 takes a single snapshot', default=300)
+parser.add_argument('--history_dir', type=str, help='History directory. Defaults to devops/.coldstart', default=None)
+parser.add_argument('--log_format', type=str, choices=LOG_FORMATS, help='text: colored lines, json: JSON lines. Defaults to DEPLOY_LOG_FORMAT env or text', default=None)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    setup_logging(args.log_format)
+    if not args.cluster or not args.service:
+        parser.error('Specify --cluster and --service')
+    client = get_client('ecs')
+    task_definition = args.task_definition or \
+        client.describe_services(cluster=args.cluster, services=[args.service])['services'][0]['taskDefinition']
+    report = profile_cold_starts(client, args.cluster, args.service, task_definition,
+                                 timeout=args.timeout, history_dir=args.history_dir)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
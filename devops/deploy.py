@@ -2,37 +2,35 @@ import re
 import os
 import sys
 import json
+import copy
+import time
 import argparse
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from log import LOG_FORMATS, setup_logging
+from aws import get_client, get_session, get_region, use_region
+from ssm import get_vars_from_ssm, api_calls as ssm_api_calls
+from ssm_cache import SSMCache, DEFAULT_CACHE_TTL
+from manifest import SharedLookups, load_manifest, manifest_service_args
+from taskdef import task_definition_hash, diff_task_definitions
+from ports import DEFAULT_PORT_RANGE, PORT_MAPPING_MODES, build_port_mappings
+from metrics import metrics, current_service, bind_context
+from rollout import drain_and_restart, watch_ecs_deployment, watch_codedeploy_deployment, service_runs_revision, \
+    service_task_definitions, RolloutFailed
+from helpers import prepare_fluentbit_config
+from pipeline import run_pipeline, load_stage_modules
+from fluentbit_profiles import DEFAULT_PROFILE, PROFILES
+from sizing import ECS_CPU_TO_VCPU, validate_fargate_size, get_utilization, recommend_size, compare_size
+from secrets_bundle import BUNDLE_KEEP_REVISIONS, bundle_secrets, check_loader_image, prune_bundles, loader_environment
+from coldstart import profile_cold_starts
+from batch import get_latest_batch_revision, build_shards, submit_array_job, wait_for_array_job
+from placement import parse_capacity_strategy, appspec_capacity_strategy, parse_placement_strategy, \
+    parse_placement_constraint, placement_update_args
+from autoscaling import MARKET_TIMEZONE, AUTOSCALING_MODES, setup_autoscaling, parse_metric_spec
 
-from formatter import CustomFormatter
-from aws import client, deploy_client, batch_client, autoscaling_client
-from ssm import get_vars_from_ssm
-from helpers import apply_fluent_bit, prepare_fluentbit_config, apply_opentelemetry_config
-from batch import get_latest_batch_revision
-
-ECS_CPU_TO_VCPU = {
-    256: "0.25",
-    512: "0.5",
-    1024: "1",
-    2048: "2",
-    4096: "4",
-    8192: "8",
-    16384: "16"
-}
-
-port_range=range(40000, 40101)
-
-### Colored logging
 logger = logging.getLogger("Deployment")
-logger.setLevel(logging.DEBUG)
-
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-
-ch.setFormatter(CustomFormatter())
-
-logger.addHandler(ch)
 
 ### Arg parser
 parser = argparse.ArgumentParser(description='traderlion deployment script for nodejs apps')
@@ -45,8 +43,12 @@ parser.add_argument('--deployment', type=str, help='Code deploy app name')
 parser.add_argument('--deploymentgroup', type=str, help='Code Deploy deployment group')
 parser.add_argument('--memory', type=str, help='ECS definition RAM')
 parser.add_argument('--capacityprovider', type=str, help='ECS capacityprovider name for cluster')
+parser.add_argument('--capacity_strategy', type=str, help='Capacity provider strategy, provider[:base[:weight]] list, for example "FARGATE:2:1,FARGATE_SPOT:0:3". Defaults to --capacityprovider with weight 1', default=None)
+parser.add_argument('--placement_strategy', type=str, help='EC2 task placement, type[:field] list applied in order, for example "spread:attribute:ecs.availability-zone,binpack:memory"', default=None)
+parser.add_argument('--placement_constraint', action='append', type=parse_placement_constraint, help='EC2 placement constraint: "distinctInstance" or "memberOf:<expression>". Can be repeated', default=[])
 parser.add_argument('--contanername', type=str, help='ECS task definition container name')
 parser.add_argument('--verbose', type=str, help='verbose', default=False)
+parser.add_argument('--log_format', type=str, choices=LOG_FORMATS, help='text: colored lines, json: JSON lines with service and region fields. Defaults to DEPLOY_LOG_FORMAT env or text', default=None)
 parser.add_argument('--cpu', type=str, help='Task cpu', default=False)
 parser.add_argument('--environment',
                     type=str, help='Environemnt name: for example staging or production')
@@ -56,301 +58,86 @@ parser.add_argument('--onlybatch', type=int, help='Deploy only batch')
 parser.add_argument('--markettype', type=str, help='Market type')
 parser.add_argument('--fargate', help='Enable fargate', action='store_true', default=False)
 parser.add_argument('--fluentimage', type=str, help='Custom fluent bit image', default='')
+parser.add_argument('--fluentbit_profile', type=str, choices=list(PROFILES), help='Fluent bit throughput profile, see fluentbit_profiles.py', default=DEFAULT_PROFILE)
+parser.add_argument('--port_range', type=str, help='Extra container ports, for example "40000-40100,50000". "none" disables them', default=DEFAULT_PORT_RANGE)
+parser.add_argument('--port_mapping_mode', type=str, choices=PORT_MAPPING_MODES, help='auto: containerPortRange where network mode allows it, individual: one mapping per port', default='auto')
+parser.add_argument('--drain_workers', type=int, help='Parallel stop_task calls when restarting crawler-realtime/repeater', default=10)
+parser.add_argument('--stable_timeout', type=int, help='Seconds to wait for stopped tasks and for stable service', default=600)
+parser.add_argument('--stable_poll_delay', type=int, help='Seconds between stability checks', default=5)
+parser.add_argument('--wait', action='store_true', help='Wait for ECS/CodeDeploy rollout or the --batch_shards array job to finish. Exit code 2 if it fails, 3 on timeout', default=False)
+parser.add_argument('--wait_timeout', type=int, help='Seconds to wait for rollout', default=1800)
+parser.add_argument('--poll_initial', type=float, help='First rollout polling interval, seconds', default=2)
+parser.add_argument('--poll_max', type=float, help='Max rollout polling interval, seconds', default=30)
+parser.add_argument('--force', action='store_true', help='Register and roll out task definition even if it is identical to the latest revision', default=False)
+parser.add_argument('--image', type=str, help='Application image. Defaults to production_image env variable', default=None)
+parser.add_argument('--batch_shards', type=str, help='Submit crawler array job after --onlybatch 1 registration: "markets:us,ca" or "symbols:16"', default=None)
+parser.add_argument('--batch_queue', type=str, help='Batch job queue for --batch_shards', default=None)
+parser.add_argument('--shard_cpu', type=str, help='ECS cpu units of every array child. Defaults to --cpu', default=None)
+parser.add_argument('--shard_memory', type=str, help='Memory of every array child, MiB. Defaults to --memory', default=None)
+parser.add_argument('--shard_attempts', type=int, help='Attempts per array child', default=1)
+parser.add_argument('--batch_timeout', type=int, help='Seconds to wait for the array job with --wait', default=7200)
+parser.add_argument('--sizing_report', action='store_true', help='Log cpu/memory recommendation from Container Insights history', default=False)
+parser.add_argument('--sizing_cluster', type=str, help='Cluster with the Container Insights metrics. Defaults to --cluster, set it to the compute environment cluster for Batch', default=None)
+parser.add_argument('--sizing_days', type=int, help='Days of history for --sizing_report', default=14)
+parser.add_argument('--coldstart_report', action='store_true', help='Watch the new tasks until healthy and log per phase start latency against the previous revision', default=False)
+parser.add_argument('--coldstart_timeout', type=int, help='Seconds to wait for the new tasks with --coldstart_report', default=900)
+parser.add_argument('--coldstart_history', type=str, help='Cold start history directory. Defaults to devops/.coldstart', default=None)
 parser.add_argument('--desired_count', type=int, help='Service desired count', default=1)
 parser.add_argument('--disable_ssm_management', type=int, help='Disable SSM management. Disables adding SSM variables to the ECS task definition also removes.', default=0)
+parser.add_argument('--secrets_bundle', action='store_true', help='Pack SSM variables into a few JSON secrets(String and SecureString), expanded in the container by secrets-loader.cjs through NODE_OPTIONS', default=False)
+parser.add_argument('--secrets_bundle_keep', type=int, help='Latest task definition revisions whose secrets bundles are kept, with the revisions the service runs. Other bundles are deleted after a successful rollout', default=BUNDLE_KEEP_REVISIONS)
+parser.add_argument('--ssm-cache', action='store_true', help='Reuse locally cached SSM paths. A cached path still costs two describe_parameters listings(metadata and delete tags), only get_parameters_by_path reads are skipped', default=False)
+parser.add_argument('--ssm_cache_dir', type=str, help='SSM cache directory. Defaults to devops/.ssm-cache', default=None)
+parser.add_argument('--ssm_cache_ttl', type=int, help='Seconds before cached SSM path is evicted', default=DEFAULT_CACHE_TTL)
+parser.add_argument('--ssm_cache_refresh', action='store_true', help='Ignore cached SSM paths and refetch them', default=False)
 
 parser.add_argument('--enable_autoscaling', action='store_true', help='Enable autoscaling', default=False)
 parser.add_argument('--min_capacity', type=int, help='Minimum tasks', default=1)
 parser.add_argument('--max_capacity', type=int, help='Maximum tasks', default=5)
 parser.add_argument('--target_cpu', type=int, help='Target CPU %', default=0)
 parser.add_argument('--target_memory', type=int, help='Target Memory %', default=0)
-
-args = parser.parse_args()
-
-if args.port is None or args.family is None or args.service is None \
-    or args.cluster is None or args.memory is None or args.port is None\
-    or args.capacityprovider is None or args.contanername is None\
-    or args.environment is None or args.servicenames is None:
-    logger.critical('Specify all of args:\
-                    --cluster, --service, --family, --port, --memory, \
-                    --capacityprovider, --contanername, --environment, --servicenames')
-    sys.exit(0)
-
-logger.info(f'Fagate enabled: {args.fargate}')
-
-def setup_autoscaling(cluster, service, min_cap, max_cap, target_cpu, target_mem):
-    logger.info(f"Configuring Autoscaling for {service}...")
-    resource_id = f"service/{cluster}/{service}"
-
-    try:
-        autoscaling_client.register_scalable_target(
-            ServiceNamespace='ecs',
-            ResourceId=resource_id,
-            ScalableDimension='ecs:service:DesiredCount',
-            MinCapacity=min_cap,
-            MaxCapacity=max_cap
-        )
-        
-        if target_cpu > 0:
-            autoscaling_client.put_scaling_policy(
-                PolicyName=f"{service}-cpu-scaling",
-                ServiceNamespace='ecs',
-                ResourceId=resource_id,
-                ScalableDimension='ecs:service:DesiredCount',
-                PolicyType='TargetTrackingScaling',
-                TargetTrackingScalingPolicyConfiguration={
-                    'TargetValue': target_cpu,
-                    'PredefinedMetricSpecification': {
-                        'PredefinedMetricType': 'ECSServiceAverageCPUUtilization'
-                    },
-                    'ScaleOutCooldown': 60,
-                    'ScaleInCooldown': 60
-                }
-            )
-            logger.info(f"Autoscaling: CPU target set to {target_cpu}%")
-
-        if target_mem > 0:
-            autoscaling_client.put_scaling_policy(
-                PolicyName=f"{service}-memory-scaling",
-                ServiceNamespace='ecs',
-                ResourceId=resource_id,
-                ScalableDimension='ecs:service:DesiredCount',
-                PolicyType='TargetTrackingScaling',
-                TargetTrackingScalingPolicyConfiguration={
-                    'TargetValue': target_mem,
-                    'PredefinedMetricSpecification': {
-                        'PredefinedMetricType': 'ECSServiceAverageMemoryUtilization'
-                    },
-                    'ScaleOutCooldown': 60,
-                    'ScaleInCooldown': 60
-                }
-            )
-            logger.info(f"Autoscaling: Memory target set to {target_mem}%")
-            
-    except Exception as e:
-        logger.error(f"Failed to configure autoscaling: {str(e)}")
-
-portMappings = []
-
-###  Add port mapping for the application port
-portMappings.append({
-    "hostPort": 0 if not args.fargate else int(args.port),
-    "protocol": "tcp",
-    "containerPort": int(args.port)
-})
-
-### Add custom dynamic ports
-for port in port_range:
-    portMappings.append({
-        "hostPort": 0 if not args.fargate else int(port),
-        "protocol": "tcp",
-        "containerPort": int(port)
-    })
-
-### Get latest task revision using family arg
-tasks = client.list_task_definitions(
-    familyPrefix=args.family,
-    maxResults=1,
-    sort="DESC"
-)
-latest_revision_arn = tasks['taskDefinitionArns'][-1]
-
-### MAKING NEW REVISION ###
-new_definition = client.describe_task_definition(
-    taskDefinition=latest_revision_arn,
-    include=[
-        'TAGS',
-    ]
-)
-
-batch_image = new_definition['taskDefinition']['containerDefinitions'][0]['image']
-secrets = get_vars_from_ssm(args.environment, args.servicenames)
-if args.verbose:
-    logger.debug('------------------- Current vars -------------------')
-    for var in secrets:
-        logger.debug(var)
-    logger.debug('------------------- END Current vars -------------------')
-
-## Remove 
-if not args.disable_ssm_management:
-    new_definition['taskDefinition']['containerDefinitions'][0]['secrets'] = secrets
-else:
-    new_definition['taskDefinition']['containerDefinitions'][0]['secrets'] = []
-
-### Not privileged if fargate. Required
-new_definition['taskDefinition']['containerDefinitions'][0]['portMappings'] = portMappings
-if args.fargate:
-    new_definition['taskDefinition']['containerDefinitions'][0]['privileged'] = False
-elif args.onlybatch:
-    new_definition['taskDefinition']['containerDefinitions'][0]['portMappings'] = []
-
-### pass markettype
-if args.markettype:
-    new_definition['taskDefinition']['containerDefinitions'][0]['environment'] = [
-        {
-             "name": "MARKETS",
-             "value": args.markettype
-        }
-    ]
-
-### Update image
-new_definition['taskDefinition']['containerDefinitions'][0]['image'] = os.environ.get('production_image')
-### Set container name
-new_definition['taskDefinition']['containerDefinitions'][0]['name'] = args.contanername
-### Update batch image
-batch_image = os.environ.get('production_image')
-
-
-### Batch update/deploy
-if args.service == 'crawler' and args.onlybatch == 1:
-    logger.info(f"Creating new batch revision for {args.family}")
-    latest_revision_batch = get_latest_batch_revision(batch_client, args.family)
-    if args.verbose:
-        logger.debug("----------------")
-        logger.debug(json.dumps(latest_revision_batch, indent=4))
-        logger.debug("----------------")
-    latest_revision_batch['containerProperties']['secrets'] = secrets
-    latest_revision_batch['containerProperties']['image'] = batch_image
-
-    latest_revision_batch['containerProperties']['resourceRequirements'] = [
-        {
-            "value": ECS_CPU_TO_VCPU[int(args.cpu)],
-            "type": "VCPU"
-        },
-        {
-            "value": args.memory,
-            "type": "MEMORY"
-        }
-    ]
-
-    definition = {
-        'jobDefinitionName': args.family,
-        'type': 'container',
-        'containerProperties': latest_revision_batch['containerProperties'],
-        'platformCapabilities': ["FARGATE"]
-    }
-    
-    batch_client.register_job_definition(
-        jobDefinitionName=args.family,
-        type='container',
-        containerProperties=latest_revision_batch['containerProperties'],
-        platformCapabilities=["FARGATE"]
-    )
-
-### Non batch deploy
-if args.onlybatch == 0:
-    logger.info(f"ALLOCATED MEMORY FOR TASK : {args.memory}MB")
-    logger.info(f'Registering new task definition for task family: {args.family}')
-    
-    # -------------------------------------------------------------
-    # LOGIC FIX: Check environment to skip sidecars in DEV
-    # -------------------------------------------------------------
-    if args.environment.lower() != 'dev':
-        logger.info("Applying fluent bit configuration")
-
-        index_name = args.contanername
-        ## Add AWS region name for lightservers(used in the Opensearch)
-        if 'lightserver' in args.service:
-            index_name = f"{index_name}-{os.environ.get('AWS_DEFAULT_REGION')}"
-        if 'crawler-realtime' in args.service:
-            index_name = f'crawler-realtime-{args.environment.lower()}'
-        
-        bucket_name = f"{args.environment.lower()}-traderlion-logging-configs"
-        logger.info(f"Using logging config bucket: {bucket_name}")
-        
-        fluent_bit_config_location = prepare_fluentbit_config(
-            os.environ.get('ES_HOST', ''), 
-            args.contanername, 
-            logger, 
-            index_name,
-            bucket_name
-        )
-
-        ### Apply fluentbit configuration for logging
-        new_definition = apply_fluent_bit(
-            args.environment.lower(),
-            args.service,
-            new_definition,
-            fluent_bit_config_location,
-            logger,
-            args.contanername,
-            custom_image=None if not args.fluentimage else args.fluentimage
-        )
-
-        logger.info('Applying opentelemetry config')
-        new_definition = apply_opentelemetry_config(
-            args.environment.lower(),
-            args.service,
-            new_definition,
-            logger,
-            args.contanername
-        )
-    else:
-        logger.info("Skipping Sidecars (FluentBit/OpenTelemetry) for DEV environment")
-    # -------------------------------------------------------------
-
-    ### Task definition registration
-    if args.fargate:
-        logger.info('Enabling fargate')
-        new_definition['taskDefinition']['requiresCompatibilities'] = ['FARGATE']
-        new_definition['taskDefinition']['networkMode'] = 'awsvpc'
-        ### Cleanup compatibilities from previous EC2 revision
-        if 'compatibilities' in new_definition['taskDefinition']:
-            del new_definition['taskDefinition']['compatibilities']
-        logger.info('Fargate enabled')
-    else:
-        logger.info('Disabling/skipping fargate')
-        new_definition['taskDefinition']['requiresCompatibilities'] = ['EC2']
-        new_definition['taskDefinition']['networkMode'] = 'bridge'
-        if 'compatibilities' not in new_definition['taskDefinition']:
-            new_definition['taskDefinition']['compatibilities'] = ['EC2']
-        logger.info('Disabling/skipping fargate finish')
-
-    if args.fargate:
-
-        definition_args = {
-            'family': args.family,
-            'taskRoleArn': new_definition['taskDefinition']['taskRoleArn'],
-            'executionRoleArn': new_definition['taskDefinition']['executionRoleArn'],
-            'networkMode': 'bridge' if not args.fargate else 'awsvpc',
-            'memory': args.memory,
-            'containerDefinitions' : new_definition['taskDefinition']['containerDefinitions'],
-            'requiresCompatibilities' : ['EC2'] if not args.fargate else ['FARGATE'],
-            'runtimePlatform' : {
-                'cpuArchitecture': 'ARM64',
-                'operatingSystemFamily': 'LINUX'
-            },
-            'volumes' : [{ 'name': 'logs' }]
-        }
-
-        if args.cpu:
-            definition_args['cpu'] = args.cpu
-        task_definition = client.register_task_definition(**definition_args)
-    else:
-        for i in range(0, len(new_definition['taskDefinition']['containerDefinitions'])):
-            new_definition['taskDefinition']['containerDefinitions'][i]['mountPoints'] = [{
-                "sourceVolume": "logs",
-                "containerPath": "/var/www/app/tmp/traderlionApp/"
-            }]
-
-        definition_args = {
-            'family' :args.family,
-            'executionRoleArn' : new_definition['taskDefinition']['executionRoleArn'],
-            'networkMode': 'bridge' if not args.fargate else 'awsvpc',
-            'memory': args.memory,
-            'containerDefinitions': new_definition['taskDefinition']['containerDefinitions'],
-            'requiresCompatibilities': ['EC2'] if not args.fargate else ['FARGATE'],
-            'volumes': [{ 'name': 'logs' }]
-        }
-        if args.cpu:
-            definition_args['cpu'] = args.cpu
-        task_definition = client.register_task_definition(**definition_args)
-
-    latest_revision_arn = task_definition['taskDefinition']['taskDefinitionArn']
-
-    if args.verbose:
-        logger.debug(f"New task definition json: {latest_revision_arn}")
-
+parser.add_argument('--autoscaling_mode', type=str, choices=AUTOSCALING_MODES, help='apply: put target and policies every deploy. reconcile: apply only the diff and delete stale policies. plan: only log the diff', default='apply')
+parser.add_argument('--target_requests', type=int, help='Target ALB requests per task(ALBRequestCountPerTarget)', default=0)
+parser.add_argument('--alb_resource_label', type=str, help='app/<alb>/<id>/targetgroup/<name>/<id> for --target_requests. Found from the service target group by default', default=None)
+parser.add_argument('--target_metric', action='append', type=parse_metric_spec, help='Customized metric target tracking, JSON: {"name", "namespace", "metric", "statistic", "target", "dimensions"}. Can be repeated', default=[])
+parser.add_argument('--scale_out_cooldown', type=int, help='Target tracking scale out cooldown, seconds', default=60)
+parser.add_argument('--scale_in_cooldown', type=int, help='Target tracking scale in cooldown, seconds', default=60)
+parser.add_argument('--market_sessions', type=str, help='Scheduled scaling per market session, session:min[:max], for example "pre:2,regular:6,post:2"', default=None)
+parser.add_argument('--market_timezone', type=str, help='Timezone of the market sessions', default=MARKET_TIMEZONE)
+parser.add_argument('--market_lead_minutes', type=int, help='Minutes to scale out before the session starts', default=15)
+parser.add_argument('--market_scale_in_delay', type=int, help='Minutes to keep session capacity after it ends', default=15)
+parser.add_argument('--market_calendar', type=str, help='JSON file with holidays and early closes. Defaults to the NYSE calendar in devops/market_calendar.json', default=None)
+
+parser.add_argument('--metrics_json', type=str, help='Write per service phase timings and API call counts to the JSON file', default=None)
+parser.add_argument('--metrics_prom', type=str, help='Write metrics in Prometheus text format to the file (node_exporter textfile collector)', default=None)
+parser.add_argument('--metrics_otel', action='store_true', help='Export deploy phases as OpenTelemetry spans through OTLP', default=False)
+parser.add_argument('--stage_module', action='append', help='Module registering extra task definition stages(pipeline.register_stage). Can be repeated, also read from DEPLOY_STAGE_MODULES', default=[])
+parser.add_argument('--skip_stages', type=lambda value: tuple(item.strip() for item in value.split(',') if item.strip()), help='Comma separated task definition stages to skip, for example "otel,mounts"', default=())
+parser.add_argument('--manifest', type=str, help='JSON/YAML file with the list of services to deploy. Service keys are the same as the flags', default=None)
+parser.add_argument('--workers', type=int, help='Number of services deployed at the same time in manifest mode', default=4)
+parser.add_argument('--regions', type=lambda value: [item.strip() for item in value.split(',') if item.strip()], help='Deploy to these regions. The first one is the canary, the rest are deployed together after it succeeds', default=None)
+parser.add_argument('--region_workers', type=int, help='Regions deployed at the same time after the canary. Defaults to all of them', default=0)
+
+REQUIRED_ARGS = ('cluster', 'service', 'family', 'port', 'memory', 'capacityprovider', 'contanername', 'environment', 'servicenames')
+
+
+def rollout_service(args, client, latest_revision_arn, capacity_strategy=None, placement=None):
+    """Roll out new task definition: update service, manual restart or CodeDeploy blue/green
+
+    Args:
+        args (obj): Service args
+        client (obj): Boto3 ECS client
+        latest_revision_arn (str): Task definition ARN to deploy
+        capacity_strategy (list): ECS capacityProviderStrategy from --capacity_strategy
+        placement (dict): placementStrategy/placementConstraints update_service arguments
+
+    Returns:
+        dict: Rollout report
+    """
+    report = {}
+    ## Strategy change is only applied with a new deployment
+    update_args = {'capacityProviderStrategy': capacity_strategy, 'forceNewDeployment': True} if capacity_strategy else {}
+    update_args.update(placement or {})
     logger.info(f"Running deployment")
     #### Deployment
 
@@ -358,39 +145,24 @@ if args.onlybatch == 0:
     if args.deployment is None and args.deploymentgroup is None:
         ## Manual stop and run if this is crawler rt or repeater
         if 'crawler-realtime' in args.cluster or 'repeater' in args.cluster:
-            waiter = client.get_waiter('services_stable')
-            client.update_service(
-                cluster=args.cluster,
-                service=args.service,
-                desiredCount=0,
-                taskDefinition=latest_revision_arn
-            )
-            paginator = client.get_paginator('list_tasks')
-            response_iterator = paginator.paginate(
-                cluster=args.cluster,
-                serviceName=args.service,
-                PaginationConfig={
-                    'PageSize':100
-                }
-            )
-            for each_page in response_iterator:
-                for each_task in each_page['taskArns']:
-                    client.stop_task(
-                        cluster=args.cluster,
-                        task=each_task
-                    )
-            client.update_service(
-                cluster=args.cluster,
-                service=args.service,
-                desiredCount=args.desired_count,
-                taskDefinition=latest_revision_arn
+            report = drain_and_restart(
+                client,
+                args.cluster,
+                args.service,
+                latest_revision_arn,
+                args.desired_count,
+                max_workers=args.drain_workers,
+                timeout=args.stable_timeout,
+                delay=args.stable_poll_delay,
+                update_args=update_args
             )
         else:
             client.update_service(
                 cluster=args.cluster,
                 service=args.service,
                 desiredCount=args.desired_count,
-                taskDefinition=latest_revision_arn
+                taskDefinition=latest_revision_arn,
+                **update_args
             )
     else:
         ## Code deploy type of deployment(blue/green)
@@ -405,11 +177,9 @@ if args.onlybatch == 0:
                             'ContainerName': args.contanername,
                             'ContainerPort': args.port
                         },
-                        'CapacityProviderStrategy': [{
-                            'CapacityProvider': args.capacityprovider,
-                            'Base': 0,
-                            'Weight': 1
-                        }]
+                        'CapacityProviderStrategy': appspec_capacity_strategy(
+                            capacity_strategy or [{'capacityProvider': args.capacityprovider, 'base': 0, 'weight': 1}]
+                        )
                     }
                 }
             }]
@@ -422,7 +192,12 @@ if args.onlybatch == 0:
                 "BeforeAllowTraffic": hook_function_name
             }]
 
-        deploy_client.create_deployment(
+        ## AppSpec has no placement, CODE_DEPLOY services take it from update_service
+        if placement:
+            client.update_service(cluster=args.cluster, service=args.service, **placement)
+
+        deploy_client = get_client('codedeploy')
+        deployment = deploy_client.create_deployment(
             applicationName=args.deployment,
             deploymentGroupName=args.deploymentgroup,
             revision={
@@ -434,13 +209,665 @@ if args.onlybatch == 0:
             description='Deploying updates',
             ignoreApplicationStopFailures=False,
         )
+        report['deployment_id'] = deployment['deploymentId']
+
+    if args.wait:
+        with metrics.phase('wait'):
+            if 'deployment_id' in report:
+                report['rollout_seconds'] = watch_codedeploy_deployment(
+                    get_client('codedeploy'),
+                    report['deployment_id'],
+                    timeout=args.wait_timeout,
+                    initial_delay=args.poll_initial,
+                    max_delay=args.poll_max
+                )
+            else:
+                report['rollout_seconds'] = watch_ecs_deployment(
+                    client,
+                    args.cluster,
+                    args.service,
+                    latest_revision_arn,
+                    timeout=args.wait_timeout,
+                    initial_delay=args.poll_initial,
+                    max_delay=args.poll_max
+                )
+    return report
+
+
+def service_setting_changes(args, description, capacity_strategy=None, placement=None):
+    """Service settings the args change, for a redeploy of the revision the service already runs
+
+    Args:
+        args (obj): Service args
+        description (dict): describe_services entry
+        capacity_strategy (list): ECS capacityProviderStrategy from --capacity_strategy
+        placement (dict): placementStrategy/placementConstraints update_service arguments
+
+    Returns:
+        dict: update_service arguments. Empty if nothing changed
+    """
+    def providers(strategy):
+        return [(item['capacityProvider'], item.get('base', 0), item.get('weight', 0)) for item in strategy or []]
+
+    changes = {}
+    codedeploy = args.deployment is not None or args.deploymentgroup is not None
+    ## CodeDeploy deploys never set desiredCount
+    if not codedeploy and description.get('desiredCount') != args.desired_count:
+        changes['desiredCount'] = args.desired_count
+    if capacity_strategy and providers(description.get('capacityProviderStrategy')) != providers(capacity_strategy):
+        changes.update(capacityProviderStrategy=capacity_strategy, forceNewDeployment=True)
+    for key, value in (placement or {}).items():
+        if description.get(key, []) != value:
+            changes[key] = value
+    return changes
+
+
+def update_service_settings(args, client, latest_revision_arn, capacity_strategy=None, placement=None):
+    """Apply changed service settings without a new revision. Strategy changes need a new deployment
+
+    Args:
+        args (obj): Service args
+        client (obj): Boto3 ECS client
+        latest_revision_arn (str): Task definition ARN the service runs
+        capacity_strategy (list): ECS capacityProviderStrategy from --capacity_strategy
+        placement (dict): placementStrategy/placementConstraints update_service arguments
+
+    Returns:
+        dict: Rollout report, empty if nothing changed
+    """
+    description = client.describe_services(cluster=args.cluster, services=[args.service])['services'][0]
+    changes = service_setting_changes(args, description, capacity_strategy, placement)
+    if not changes:
+        logger.info(f'{args.service} settings are unchanged. Skipping update_service')
+        return {}
+    logger.info(f'Updating {args.service} settings: {", ".join(key for key in changes if key != "forceNewDeployment")}')
+    codedeploy = args.deployment is not None or args.deploymentgroup is not None
+    if codedeploy and 'capacityProviderStrategy' in changes:
+        ## CODE_DEPLOY services take the strategy from the AppSpec only
+        return rollout_service(args, client, latest_revision_arn, capacity_strategy, placement)
+    client.update_service(cluster=args.cluster, service=args.service, **changes)
+    return {'updated_settings': sorted(key for key in changes if key != 'forceNewDeployment')}
+
+
+def deploy_service(args, shared):
+    """Deploy single service: new task definition or batch job definition and rollout
+
+    Args:
+        args (obj): Service args
+        shared (SharedLookups): Lookups shared with other services of the same run
+
+    Returns:
+        dict: Deployed task definition ARN and rollout report. Empty for batch only deploys
+    """
+    result = {}
+    validate_sizes(args)
+    if args.secrets_bundle and not args.disable_ssm_management:
+        check_loader_image(args.service, batch=args.service == 'crawler' and args.onlybatch == 1)
+    capacity_strategy = parse_capacity_strategy(args.capacity_strategy, args.fargate) if args.capacity_strategy else None
+    placement = placement_update_args(
+        parse_placement_strategy(args.placement_strategy) if args.placement_strategy else [],
+        args.placement_constraint,
+        args.fargate,
+        capacity_strategy
+    )
+    logger.info(f'Fagate enabled: {args.fargate}')
+    if args.sizing_report:
+        report_sizing(args)
+    portMappings = build_port_mappings(
+        int(args.port),
+        args.port_range,
+        'awsvpc' if args.fargate else 'bridge',
+        args.port_mapping_mode
+    )
+
+    ### Get latest task revision using family arg
+    client = get_client('ecs')
+    with metrics.phase('describe_task_definition'):
+        tasks = client.list_task_definitions(
+            familyPrefix=args.family,
+            maxResults=1,
+            sort="DESC"
+        )
+        latest_revision_arn = tasks['taskDefinitionArns'][-1]
+
+        ### MAKING NEW REVISION ###
+        new_definition = client.describe_task_definition(
+            taskDefinition=latest_revision_arn,
+            include=[
+                'TAGS',
+            ]
+        )
+
+    ### Kept to skip registration if the new revision is identical
+    current_definition = copy.deepcopy(new_definition['taskDefinition'])
+
+    batch_image = new_definition['taskDefinition']['containerDefinitions'][0]['image']
+    with metrics.phase('ssm'):
+        secrets = get_vars_from_ssm(args.environment, args.servicenames, cache=shared.ssm_cache, shared=shared)
+    logger.info(f'Resolved {len(secrets)} SSM variables for {args.service}. SSM API calls so far: {sum(ssm_api_calls.values())}')
+    if args.verbose:
+        logger.debug('------------------- Current vars -------------------')
+        for var in secrets:
+            logger.debug(var)
+        logger.debug('------------------- END Current vars -------------------')
+        logger.debug(f'SSM API calls: {dict(ssm_api_calls)}')
+    if args.secrets_bundle and not args.disable_ssm_management:
+        with metrics.phase('secrets_bundle'):
+            secrets = bundle_secrets(args.environment, args.family, secrets)
+
+    image = args.image or os.environ.get('production_image')
+    ### Update batch image
+    batch_image = image
+
+    ### Batch update/deploy
+    if args.service == 'crawler' and args.onlybatch == 1:
+        logger.info(f"Creating new batch revision for {args.family}")
+        batch_client = get_client('batch')
+        latest_revision_batch = get_latest_batch_revision(batch_client, args.family)
+        if args.verbose:
+            logger.debug("----------------")
+            logger.debug(json.dumps(latest_revision_batch, indent=4))
+            logger.debug("----------------")
+        latest_revision_batch['containerProperties']['secrets'] = secrets
+        environment = loader_environment(latest_revision_batch['containerProperties'].get('environment'), args.secrets_bundle)
+        if environment != latest_revision_batch['containerProperties'].get('environment', []):
+            latest_revision_batch['containerProperties']['environment'] = environment
+        latest_revision_batch['containerProperties']['image'] = batch_image
+
+        latest_revision_batch['containerProperties']['resourceRequirements'] = [
+            {
+                "value": ECS_CPU_TO_VCPU[int(args.cpu)],
+                "type": "VCPU"
+            },
+            {
+                "value": args.memory,
+                "type": "MEMORY"
+            }
+        ]
+
+        definition = {
+            'jobDefinitionName': args.family,
+            'type': 'container',
+            'containerProperties': latest_revision_batch['containerProperties'],
+            'platformCapabilities': ["FARGATE"]
+        }
+    
+        with metrics.phase('register_job_definition'):
+            job_definition = batch_client.register_job_definition(
+                jobDefinitionName=args.family,
+                type='container',
+                containerProperties=latest_revision_batch['containerProperties'],
+                platformCapabilities=["FARGATE"]
+            )
+        result['job_definition'] = job_definition['jobDefinitionArn']
+
+        ### Fan crawler work out to array job children
+        if args.batch_shards:
+            if not args.batch_queue:
+                raise ValueError('--batch_shards requires --batch_queue')
+            with metrics.phase('submit_batch_job'):
+                job = submit_array_job(
+                    batch_client,
+                    f'{args.family}-{int(time.time())}',
+                    args.batch_queue,
+                    job_definition['jobDefinitionArn'],
+                    build_shards(args.batch_shards),
+                    ECS_CPU_TO_VCPU[int(args.shard_cpu or args.cpu)],
+                    args.shard_memory or args.memory,
+                    attempts=args.shard_attempts
+                )
+            result['batch_job'] = job['job_id']
+            if args.wait:
+                with metrics.phase('wait'):
+                    result.update(wait_for_array_job(
+                        batch_client,
+                        job,
+                        timeout=args.batch_timeout,
+                        initial_delay=args.poll_initial,
+                        max_delay=args.poll_max
+                    ))
+
+    ### Non batch deploy
+    if args.onlybatch == 0:
+        logger.info(f"ALLOCATED MEMORY FOR TASK : {args.memory}MB")
+        logger.info(f'Registering new task definition for task family: {args.family}')
+    
+        # -------------------------------------------------------------
+        # LOGIC FIX: Check environment to skip sidecars in DEV
+        # -------------------------------------------------------------
+        if args.environment.lower() != 'dev':
+            logger.info("Applying fluent bit configuration")
+
+            index_name = args.contanername
+            ## Add AWS region name for lightservers(used in the Opensearch)
+            if 'lightserver' in args.service:
+                index_name = f"{index_name}-{get_region()}"
+            if 'crawler-realtime' in args.service:
+                index_name = f'crawler-realtime-{args.environment.lower()}'
         
-    if args.enable_autoscaling:
-        setup_autoscaling(
-            cluster=args.cluster,
-            service=args.service,
-            min_cap=args.min_capacity,
-            max_cap=args.max_capacity,
-            target_cpu=args.target_cpu,
-            target_mem=args.target_memory
-        )
\ No newline at end of file
+            bucket_name = f"{args.environment.lower()}-traderlion-logging-configs"
+            logger.info(f"Using logging config bucket: {bucket_name}")
+        
+            ## Same config is uploaded once per run, even if several services use it
+            with metrics.phase('fluentbit_config'):
+                fluent_bit_config_location = shared.get(
+                    ('fluentbit', get_region(), bucket_name, args.contanername, index_name, args.fluentbit_profile),
+                    lambda: prepare_fluentbit_config(
+                        os.environ.get('ES_HOST', ''),
+                        args.contanername,
+                        logger,
+                        index_name,
+                        bucket_name,
+                        profile=args.fluentbit_profile,
+                        region=get_region()
+                    )
+                )
+
+        else:
+            fluent_bit_config_location = None
+            logger.info("Skipping Sidecars (FluentBit/OpenTelemetry) for DEV environment")
+        # -------------------------------------------------------------
+
+        context = argparse.Namespace(
+            args=args,
+            secrets=secrets,
+            port_mappings=portMappings,
+            image=image,
+            fluentbit_config_location=fluent_bit_config_location,
+            sidecars=args.environment.lower() != 'dev'
+        )
+        with metrics.phase('transform'):
+            run_pipeline(new_definition, context, skip=args.skip_stages)
+
+        ### Task definition registration
+        if args.fargate:
+
+            definition_args = {
+                'family': args.family,
+                'taskRoleArn': new_definition['taskDefinition']['taskRoleArn'],
+                'executionRoleArn': new_definition['taskDefinition']['executionRoleArn'],
+                'networkMode': 'bridge' if not args.fargate else 'awsvpc',
+                'memory': args.memory,
+                'containerDefinitions' : new_definition['taskDefinition']['containerDefinitions'],
+                'requiresCompatibilities' : ['EC2'] if not args.fargate else ['FARGATE'],
+                'runtimePlatform' : {
+                    'cpuArchitecture': 'ARM64',
+                    'operatingSystemFamily': 'LINUX'
+                },
+                'volumes' : [{ 'name': 'logs' }]
+            }
+
+            if args.cpu:
+                definition_args['cpu'] = args.cpu
+        else:
+            definition_args = {
+                'family' :args.family,
+                'executionRoleArn' : new_definition['taskDefinition']['executionRoleArn'],
+                'networkMode': 'bridge' if not args.fargate else 'awsvpc',
+                'memory': args.memory,
+                'containerDefinitions': new_definition['taskDefinition']['containerDefinitions'],
+                'requiresCompatibilities': ['EC2'] if not args.fargate else ['FARGATE'],
+                'volumes': [{ 'name': 'logs' }]
+            }
+            if args.cpu:
+                definition_args['cpu'] = args.cpu
+
+        current_hash = task_definition_hash(current_definition)
+        new_hash = task_definition_hash(definition_args)
+        unchanged = current_hash == new_hash
+        rollout = True
+        if unchanged and not args.force:
+            ## Latest revision may not be the running one: failed --wait rollout, manual rollback
+            if service_runs_revision(client, args.cluster, args.service, latest_revision_arn):
+                logger.info(f'Task definition is unchanged ({new_hash[:12]}). Skipping registration and rollout of {latest_revision_arn}')
+                rollout = False
+                with metrics.phase('rollout'):
+                    result.update(update_service_settings(args, client, latest_revision_arn, capacity_strategy, placement))
+            else:
+                logger.info(f'Task definition is unchanged ({new_hash[:12]}), but {args.service} does not run it. '
+                            f'Rolling out {latest_revision_arn} without registration')
+        else:
+            if unchanged:
+                logger.info('Task definition is unchanged, registering anyway: --force')
+            else:
+                logger.info(f'Task definition changed: {current_hash[:12]} -> {new_hash[:12]}')
+                logger.info(diff_task_definitions(current_definition, definition_args))
+            with metrics.phase('register_task_definition'):
+                task_definition = client.register_task_definition(**definition_args)
+            latest_revision_arn = task_definition['taskDefinition']['taskDefinitionArn']
+
+            if args.verbose:
+                logger.debug(f"New task definition json: {latest_revision_arn}")
+
+        if rollout:
+            profiler = start_coldstart_profile(args, client, latest_revision_arn) if args.coldstart_report else None
+            try:
+                with metrics.phase('rollout'):
+                    result.update(rollout_service(args, client, latest_revision_arn, capacity_strategy, placement))
+            except BaseException:
+                if profiler:
+                    profiler[1].set()
+                raise
+            if profiler:
+                with metrics.phase('coldstart'):
+                    result['coldstart'] = finish_coldstart_profile(args, profiler)
+            ## Only after a successful rollout, bundles of every revision the service still runs are kept
+            if args.secrets_bundle and not args.disable_ssm_management:
+                with metrics.phase('prune_bundles'):
+                    prune_bundles(
+                        args.environment,
+                        args.family,
+                        secrets,
+                        args.secrets_bundle_keep,
+                        service_task_definitions(client, args.cluster, args.service)
+                    )
+
+        if args.enable_autoscaling:
+            with metrics.phase('autoscaling'):
+                plan = setup_autoscaling(
+                    cluster=args.cluster,
+                    service=args.service,
+                    min_cap=args.min_capacity,
+                    max_cap=args.max_capacity,
+                    target_cpu=args.target_cpu,
+                    target_mem=args.target_memory,
+                    sessions=args.market_sessions,
+                    timezone=args.market_timezone,
+                    lead_minutes=args.market_lead_minutes,
+                    scale_in_delay=args.market_scale_in_delay,
+                    calendar_path=args.market_calendar,
+                    target_requests=args.target_requests,
+                    alb_resource_label=args.alb_resource_label,
+                    custom_metrics=args.target_metric,
+                    scale_out_cooldown=args.scale_out_cooldown,
+                    scale_in_cooldown=args.scale_in_cooldown,
+                    mode=args.autoscaling_mode
+                )
+            if plan is not None:
+                result['autoscaling_changes'] = len(plan)
+        result['task_definition'] = latest_revision_arn
+    return result
+
+
+def validate_sizes(args):
+    """Reject cpu/memory combinations ECS or Batch would refuse on registration
+
+    Args:
+        args (obj): Service args
+    """
+    if args.service == 'crawler' and args.onlybatch == 1:
+        ## Job definitions are registered for Fargate
+        validate_fargate_size(args.cpu, args.memory)
+        if args.batch_shards:
+            validate_fargate_size(args.shard_cpu or args.cpu, args.shard_memory or args.memory)
+    elif args.fargate:
+        validate_fargate_size(args.cpu, args.memory)
+    elif args.cpu and int(args.cpu) < 128:
+        raise ValueError(f'Task cpu {args.cpu} is below the ECS minimum of 128 units')
+
+
+def report_sizing(args):
+    """Log size recommendation from the Container Insights history. Never fails the deploy
+
+    Args:
+        args (obj): Service args
+    """
+    batch = args.service == 'crawler' and args.onlybatch == 1
+    try:
+        with metrics.phase('sizing'):
+            samples = get_utilization(args.sizing_cluster or args.cluster, args.family, args.sizing_days)
+            recommendation = recommend_size(samples, fargate=args.fargate or batch)
+        logger.info(f"Sizing {args.family}: p95 cpu {recommendation['cpu_p95']}, peak memory {recommendation['memory_peak']}MiB. "
+                    f"Recommended {recommendation['cpu']}/{recommendation['memory']}: {compare_size(recommendation, args.cpu, args.memory)}")
+    except Exception as e:
+        logger.warning(f'Sizing report for {args.family} failed: {e}')
+
+
+def start_coldstart_profile(args, client, task_definition):
+    """Start watching the new revision tasks before the rollout, so their health transitions are seen
+
+    Args:
+        args (obj): Service args
+        client (obj): Boto3 ECS client
+        task_definition (str): Task definition ARN being rolled out
+
+    Returns:
+        tuple: Profile future and its stop event
+    """
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(
+        bind_context(profile_cold_starts),
+        client,
+        args.cluster,
+        args.service,
+        task_definition,
+        ## Scaled to 0 and back by the crawler-realtime/repeater restart, CodeDeploy keeps the service count
+        expected=args.desired_count if args.deployment is None and args.deploymentgroup is None else None,
+        timeout=args.coldstart_timeout,
+        history_dir=args.coldstart_history,
+        stop=stop,
+        initial_delay=args.poll_initial,
+        max_delay=min(args.poll_max, 10)
+    )
+    executor.shutdown(wait=False)
+    return future, stop
+
+
+def finish_coldstart_profile(args, profiler):
+    """Wait for the cold start profile. Never fails the deploy
+
+    Args:
+        args (obj): Service args
+        profiler (tuple): start_coldstart_profile result
+
+    Returns:
+        dict: Phase p50 seconds, empty if profiling failed
+    """
+    future, stop = profiler
+    try:
+        report = future.result()
+    except Exception as e:
+        logger.warning(f'Cold start profile of {args.service} failed: {e}')
+        return {}
+    return {phase: item['p50'] for phase, item in report['phases'].items()}
+
+
+def validate_args(args):
+    """Get missing required args
+
+    Args:
+        args (obj): Service args
+
+    Returns:
+        list: Names of the missing args
+    """
+    return [name for name in REQUIRED_ARGS if getattr(args, name) is None]
+
+
+def deploy_manifest(args, shared):
+    """Deploy all manifest services concurrently and log per service report
+
+    Args:
+        args (obj): CLI args
+        shared (SharedLookups): Lookups shared by the services
+
+    Returns:
+        list: Per service results
+    """
+    services_args = manifest_service_args(parser, args, load_manifest(args.manifest))
+    for service_args in services_args:
+        missing = validate_args(service_args)
+        if missing:
+            raise ValueError(f'Service {service_args.service} is missing manifest keys: {", ".join(missing)}')
+
+    def run(service_args):
+        if service_args.regions:
+            return deploy_regions(service_args, shared)
+        return [run_service(service_args, shared)]
+
+    logger.info(f'Deploying {len(services_args)} services with {args.workers} workers')
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        results = [result for service_results in executor.map(run, services_args) for result in service_results]
+
+    log_report(results)
+    return results
+
+
+def run_service(service_args, shared, name=None):
+    """Deploy the service, failures are reported in the result instead of raised
+
+    Args:
+        service_args (obj): Service args
+        shared (SharedLookups): Lookups shared by the services
+        name (str): Name for metrics and the report. Defaults to the service name
+
+    Returns:
+        dict: Service result with status, error and exit_code of failures
+    """
+    started = time.monotonic()
+    current_service.set(name or service_args.service)
+    result = {'service': name or service_args.service, 'cluster': service_args.cluster}
+    try:
+        with metrics.phase('total'):
+            result.update(deploy_service(service_args, shared))
+        result['status'] = 'success'
+    except RolloutFailed as e:
+        logger.error(str(e))
+        result['status'] = 'failed'
+        result['error'] = str(e)
+        result['exit_code'] = e.exit_code
+    except Exception as e:
+        logger.exception(f'Deployment of {name or service_args.service} failed')
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    result['seconds'] = round(time.monotonic() - started, 2)
+    return result
+
+
+def deploy_regions(args, shared):
+    """Deploy the service to every region of args.regions
+
+    The first region is the canary and is always waited for. The other regions are
+    deployed concurrently after it, each with its own clients. The first failure
+    stops the rollout: regions not started yet are skipped.
+
+    Args:
+        args (obj): Service args
+        shared (SharedLookups): Lookups shared by the services. Region specific keys include the region
+
+    Returns:
+        list: Per region results
+    """
+    canary, *regions = args.regions
+
+    def run(region, region_args):
+        with use_region(region):
+            result = run_service(region_args, shared, f'{args.service}@{region}')
+        result['region'] = region
+        return result
+
+    def skipped(region):
+        return {'service': f'{args.service}@{region}', 'cluster': args.cluster, 'region': region, 'status': 'skipped', 'seconds': 0.0}
+
+    logger.info(f'Deploying {args.service} to canary region {canary}')
+    ## Canary has to finish its rollout before other regions start
+    ## Own context copy, so the canary service name doesn't stick to the main thread
+    results = [bind_context(run)(canary, argparse.Namespace(**{**vars(args), 'wait': True}))]
+    if results[0]['status'] != 'success' or not regions:
+        return results + [skipped(region) for region in regions]
+
+    logger.info(f'Canary {canary} succeeded, deploying {args.service} to {", ".join(regions)}')
+    workers = args.region_workers or len(regions)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = {executor.submit(run, region, args): region for region in regions}
+    region_results = {}
+    for future in as_completed(futures):
+        region_results[futures[future]] = future.result()
+        if region_results[futures[future]]['status'] != 'success':
+            logger.error(f'{args.service} failed in {futures[future]}, skipping regions not started yet')
+            for pending in futures:
+                pending.cancel()
+            break
+    ## Regions already running are finished, cancelled ones never started
+    executor.shutdown(wait=True)
+    for future, region in futures.items():
+        if region not in region_results:
+            region_results[region] = skipped(region) if future.cancelled() else future.result()
+    return results + [region_results[region] for region in regions]
+
+
+def log_report(results):
+    """Log per service results
+
+    Args:
+        results (list): Service results
+    """
+    logger.info('------------------- Deploy report -------------------')
+    for result in results:
+        rollout = f"rollout {result['rollout_seconds']:.2f}s" if 'rollout_seconds' in result else ''
+        logger.info(f"{result['service']:<45} {result['status']:<8} {result['seconds']:>8.2f}s {rollout} {result.get('error', '')}")
+    logger.info('------------------- END Deploy report -------------------')
+
+
+def report_metrics(args):
+    """Log metrics summary and write requested metrics outputs
+
+    Args:
+        args (obj): CLI args
+    """
+    logger.info(f'Deploy metrics: {json.dumps(metrics.summary())}')
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+    if args.metrics_otel:
+        metrics.export_opentelemetry(logger)
+
+
+def main(argv=None):
+    """Deploy single service from the CLI args or all services from --manifest"""
+    args = parser.parse_args(argv)
+    setup_logging(args.log_format)
+    ## Hooks must be registered before the first client is created
+    metrics.install(get_session())
+    ## Extra stages are registered on import
+    load_stage_modules(args.stage_module + os.environ.get('DEPLOY_STAGE_MODULES', '').split(','))
+
+    ssm_cache = None
+    if args.ssm_cache:
+        ssm_cache = SSMCache(args.ssm_cache_dir, ttl=args.ssm_cache_ttl, refresh=args.ssm_cache_refresh)
+    shared = SharedLookups(ssm_cache)
+
+    if args.manifest:
+        results = deploy_manifest(args, shared)
+    else:
+        if validate_args(args):
+            logger.critical('Specify all of args:\
+                            --cluster, --service, --family, --port, --memory, \
+                            --capacityprovider, --contanername, --environment, --servicenames')
+            sys.exit(0)
+        if args.regions:
+            results = deploy_regions(args, shared)
+            log_report(results)
+        else:
+            current_service.set(args.service)
+            try:
+                with metrics.phase('total'):
+                    deploy_service(args, shared)
+            except RolloutFailed as e:
+                logger.critical(str(e))
+                report_metrics(args)
+                sys.exit(e.exit_code)
+            results = []
+
+    if ssm_cache:
+        logger.info(f'SSM cache: {ssm_cache.hits} paths reused, {ssm_cache.misses} refetched')
+    report_metrics(args)
+    failed = [result for result in results if result['status'] != 'success']
+    if failed:
+        sys.exit(max(result.get('exit_code', 1) for result in failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,27 +3,20 @@
 import os
 import sys
 import argparse
-import logging
 
-from formatter import CustomFormatter
+from log import setup_logging
 from helpers import prepare_fluentbit_config
+from fluentbit_profiles import DEFAULT_PROFILE, PROFILES
 from batch import *
 
-### Colored logging
-logger = logging.getLogger("Deployment")
-logger.setLevel(logging.DEBUG)
-
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-
-ch.setFormatter(CustomFormatter())
-
-logger.addHandler(ch)
+logger = setup_logging()
 
 ### Arg parser
 parser = argparse.ArgumentParser(description='traderlion fluent script for nodejs apps')
 parser.add_argument('--service', type=str, help='Service name')
 parser.add_argument('--containername', type=str, help='ECS task definition container name')
+parser.add_argument('--profile', type=str, choices=list(PROFILES), help='Fluent bit throughput profile', default=DEFAULT_PROFILE)
+parser.add_argument('--region', type=str, help='Region of the task. Defaults to AWS_DEFAULT_REGION', default=None)
 
 args = parser.parse_args()
 
@@ -38,9 +31,9 @@ if args.service in service_filter:
     logger.info('Filter passed. Creating fluent config file.')
     index_name = args.containername
     if "lightserver" in args.containername:
-        index_name = f"{index_name}-{os.environ.get('AWS_DEFAULT_REGION')}"
+        index_name = f"{index_name}-{args.region or os.environ.get('AWS_DEFAULT_REGION')}"
     logger.info(f'ES_HOST: {os.environ.get("ES_HOST")}')
-    content = prepare_fluentbit_config(os.environ.get('ES_HOST', ''), args.containername, logger, index_name, 'no-bucket', upload_s3=False)
+    content = prepare_fluentbit_config(os.environ.get('ES_HOST', ''), args.containername, logger, index_name, 'no-bucket', upload_s3=False, profile=args.profile, region=args.region)
     logger.info(content)
     with open(f'{file_dir}/builds/fluent/fluent.conf', 'w') as f:
         f.write(content)
\ No newline at end of file
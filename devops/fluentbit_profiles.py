@@ -0,0 +1,233 @@
+"""
+Fluent bit throughput profiles
+Returns:
+    None:
+"""
+import re
+
+DEFAULT_PROFILE = 'default'
+DEFAULT_REGION = 'us-east-2'
+
+### Region of the AWS managed Opensearch endpoint, used for the SigV4 signing region
+OPENSEARCH_REGION_PATTERN = re.compile(r'\.([a-z]{2}(?:-[a-z]+)+-\d+)\.(?:es|aoss)\.amazonaws\.com')
+
+### Tuning of the tail input and the outputs. "default" renders the config used before profiles were added
+PROFILES = {
+    'default': {
+        'storage_type': 'memory',
+        'mem_buf_limit': '50MB',
+        'buffer_chunk_size': '1M',
+        'buffer_max_size': '5M',
+        'refresh_interval': 5,
+        'opensearch_workers': 0,
+        'cloudwatch_workers': 1,
+        'keepalive': False,
+        'compress': None,
+        'opensearch_buffer_size': None,
+    },
+    ## Services writing a few lines per minute
+    'low_volume': {
+        'storage_type': 'memory',
+        'mem_buf_limit': '10MB',
+        'buffer_chunk_size': '256k',
+        'buffer_max_size': '1M',
+        'refresh_interval': 10,
+        'opensearch_workers': 0,
+        'cloudwatch_workers': 1,
+        'keepalive': False,
+        'compress': None,
+        'opensearch_buffer_size': None,
+    },
+    ## crawler-realtime, lightserver. Chunks are buffered on disk instead of dropped on backpressure
+    'high_throughput': {
+        'storage_type': 'filesystem',
+        'storage_path': '/var/log/flb-storage/',
+        'storage_backlog_mem_limit': '50M',
+        'storage_total_limit_size': '1G',
+        'mem_buf_limit': '100MB',
+        'buffer_chunk_size': '2M',
+        'buffer_max_size': '10M',
+        'refresh_interval': 2,
+        'opensearch_workers': 2,
+        'cloudwatch_workers': 2,
+        'keepalive': True,
+        'compress': 'gzip',
+        'opensearch_buffer_size': '1M',
+    },
+}
+
+STORAGE_TYPES = ('memory', 'filesystem')
+COMPRESSION = (None, 'gzip')
+SIZE_KEYS = (
+    'mem_buf_limit',
+    'buffer_chunk_size',
+    'buffer_max_size',
+    'storage_backlog_mem_limit',
+    'storage_total_limit_size',
+    'opensearch_buffer_size',
+)
+PROFILE_KEYS = SIZE_KEYS + (
+    'storage_type',
+    'storage_path',
+    'refresh_interval',
+    'opensearch_workers',
+    'cloudwatch_workers',
+    'keepalive',
+    'compress',
+)
+
+### Fluent bit size unit, for example 512k, 5M or 50MB
+SIZE_PATTERN = re.compile(r'^\d+(\.\d+)?[kKmMgG]?[bB]?$')
+
+FLUENTBIT_TEMPLATE = """
+[INPUT]
+    name    tail
+    Tag     {containername}-firelens*
+    Mem_Buf_Limit         {mem_buf_limit}
+    Buffer_Chunk_Size     {buffer_chunk_size}
+    Buffer_Max_Size       {buffer_max_size}
+    Refresh_Interval      {refresh_interval}
+    Rotate_Wait           30
+    DB                    /var/log/flb-tail.db
+    Skip_Long_Lines       Off
+{input_extra}    path    /var/www/app/tmp/traderlionApp/*.log
+[SERVICE]
+    Log_Level info
+{service_extra}[OUTPUT]
+    Name null
+    Match firelens-healthcheck
+[OUTPUT]
+    Name opensearch
+    Match {containername}-firelens*
+    Aws_Auth On
+    Aws_Region {opensearch_region}
+    Host {es_host}
+    Index {index_name}
+    Port 443
+    Suppress_Type_Name On
+    retry_limit 2
+    Generate_ID On
+    tls On
+{opensearch_extra}[OUTPUT]
+    Name                cloudwatch
+    Match               {containername}-firelens*
+    region              {region}
+    log_group_name      {containername}
+    log_stream_name     {containername}
+    log_retention_days  3
+    log_key             log
+    auto_retry_requests On
+    workers             {cloudwatch_workers}
+    Retry_Limit         20
+    net.keepalive       {keepalive}
+    auto_create_group   true{cloudwatch_extra}"""
+
+
+def get_profile(name):
+    """Get validated profile
+
+    Args:
+        name (str): Profile name, one of PROFILES
+
+    Returns:
+        dict: Profile settings
+    """
+    if name not in PROFILES:
+        raise ValueError(f'Unknown fluent bit profile "{name}". Use one of {", ".join(PROFILES)}')
+    profile = PROFILES[name]
+    validate_profile(profile)
+    return profile
+
+
+def validate_profile(profile):
+    """Raise ValueError if profile settings are not valid
+
+    Args:
+        profile (dict): Profile settings
+    """
+    unknown = set(profile) - set(PROFILE_KEYS)
+    if unknown:
+        raise ValueError(f'Unknown fluent bit profile keys: {", ".join(sorted(unknown))}')
+    if profile['storage_type'] not in STORAGE_TYPES:
+        raise ValueError(f'storage_type must be one of {", ".join(STORAGE_TYPES)}')
+    if profile['storage_type'] == 'filesystem' and not profile.get('storage_path'):
+        raise ValueError('storage_path is required for filesystem storage')
+    if profile.get('compress') not in COMPRESSION:
+        raise ValueError('compress must be gzip or None')
+    if not isinstance(profile.get('keepalive'), bool):
+        raise ValueError('keepalive must be True or False')
+    for key, minimum in (('refresh_interval', 1), ('opensearch_workers', 0), ('cloudwatch_workers', 1)):
+        if not isinstance(profile.get(key), int) or profile[key] < minimum:
+            raise ValueError(f'{key} must be an integer >= {minimum}')
+    for key in SIZE_KEYS:
+        if profile.get(key) is not None and not SIZE_PATTERN.match(str(profile[key])):
+            raise ValueError(f'{key} "{profile[key]}" is not a valid size, for example 512k or 5M')
+
+
+def opensearch_region(es_host, default=DEFAULT_REGION):
+    """Region of the Opensearch domain from its host name
+
+    Args:
+        es_host (str): Opensearch host, for example search-logs-abc.us-east-2.es.amazonaws.com
+        default (str): Region for custom domain names
+
+    Returns:
+        str: Region name
+    """
+    match = OPENSEARCH_REGION_PATTERN.search(es_host or '')
+    return match.group(1) if match else default
+
+
+def render_fluentbit_config(es_host, containername, index_name, profile=DEFAULT_PROFILE, region=DEFAULT_REGION):
+    """Render fluent bit config for the profile
+
+    Args:
+        es_host (str): Opensearch host
+        containername (str): Application container name, used for tags and log group
+        index_name (str): Opensearch index
+        profile (str): Profile name
+        region (str): Region of the task. CloudWatch logs stay in it, Opensearch is signed for the domain region
+
+    Returns:
+        str: Fluent bit config
+    """
+    settings = get_profile(profile)
+
+    def lines(items, leading=False):
+        items = [f'    {key} {value}' for key, value in items if value]
+        if leading:
+            return ''.join(f'\n{item}' for item in items)
+        return ''.join(f'{item}\n' for item in items)
+
+    filesystem = settings['storage_type'] == 'filesystem'
+    return FLUENTBIT_TEMPLATE.format(
+        containername=containername,
+        es_host=es_host,
+        index_name=index_name,
+        region=region,
+        opensearch_region=opensearch_region(es_host, region),
+        mem_buf_limit=settings['mem_buf_limit'],
+        buffer_chunk_size=settings['buffer_chunk_size'],
+        buffer_max_size=settings['buffer_max_size'],
+        refresh_interval=settings['refresh_interval'],
+        cloudwatch_workers=settings['cloudwatch_workers'],
+        keepalive='on' if settings['keepalive'] else 'off',
+        input_extra=lines([
+            ('storage.type', 'filesystem' if filesystem else None),
+        ]),
+        service_extra=lines([
+            ('storage.path', settings.get('storage_path') if filesystem else None),
+            ('storage.sync', 'normal' if filesystem else None),
+            ('storage.backlog.mem_limit', settings.get('storage_backlog_mem_limit') if filesystem else None),
+        ]),
+        opensearch_extra=lines([
+            ('workers', settings['opensearch_workers']),
+            ('compress', settings.get('compress')),
+            ('Buffer_Size', settings.get('opensearch_buffer_size')),
+            ('net.keepalive', 'on' if settings['keepalive'] else None),
+            ('storage.total_limit_size', settings.get('storage_total_limit_size') if filesystem else None),
+        ]),
+        cloudwatch_extra=lines([
+            ('storage.total_limit_size', settings.get('storage_total_limit_size') if filesystem else None),
+        ], leading=True),
+    ).lstrip("\n")
@@ -21,8 +21,9 @@ class CustomFormatter(logging.Formatter):
     bold_red = "\x1b[31;1m"
     reset = "\x1b[0m"
     lightblue = "\x1b[38;5;39m"
-    orange = "\x1b[38;5;178"
-    format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
+    orange = "\x1b[38;5;178m"
+    ## context is "[service] " set by log.ContextFilter, empty outside of service deploys
+    format = "%(asctime)s - %(name)s - %(levelname)s - %(context)s%(message)s (%(filename)s:%(lineno)d)"
 
     FORMATS = {
         logging.DEBUG: yellow + format + reset,
@@ -32,6 +33,11 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format + reset
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        ### Built once, not per record
+        self.formatters = {level: logging.Formatter(fmt) for level, fmt in self.FORMATS.items()}
+
     def format(self, record):
         """Format log
 
@@ -41,6 +47,7 @@ class CustomFormatter(logging.Formatter):
         Returns:
             str: format
         """
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        if not hasattr(record, 'context'):
+            record.context = ''
+        formatter = self.formatters.get(record.levelno) or self.formatters[logging.DEBUG]
         return formatter.format(record)
\ No newline at end of file
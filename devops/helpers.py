@@ -1,67 +1,92 @@
 import json
 import os
-import boto3
-
-def prepare_fluentbit_config(es_host, containername, logger, index_name, bucket_name, upload_s3=True):
-    config = f"""
-[SERVICE]
-    Log_Level info
-[OUTPUT]
-    Name null
-    Match firelens-healthcheck
-[OUTPUT]
-    Name opensearch
-    Match {containername}-firelens*
-    Aws_Auth On
-    Aws_Region us-east-2
-    Host {es_host}
-    Index {index_name}
-    Port 443
-    Suppress_Type_Name On
-    retry_limit 2
-    Generate_ID On
-    tls On
-[OUTPUT]
-    Name                cloudwatch
-    Match               {containername}-firelens*
-    region              us-east-2
-    log_group_name      {containername}
-    log_stream_name     {containername}
-    log_retention_days  3
-    log_key             log
-    auto_retry_requests On
-    workers             1
-    Retry_Limit         20
-    net.keepalive       off
-    auto_create_group   true""".lstrip("\n").rstrip("\n").rstrip("\n")
-
-    config = f"""
-[INPUT]
-    name    tail
-    Tag     {containername}-firelens*
-    Mem_Buf_Limit         50MB
-    Buffer_Chunk_Size     1M
-    Buffer_Max_Size       5M
-    Refresh_Interval      5
-    Rotate_Wait           30
-    DB                    /var/log/flb-tail.db
-    Skip_Long_Lines       Off
-    path    /var/www/app/tmp/traderlionApp/*.log
-""".lstrip("\n") + config
-
-    s3_client = boto3.client('s3', region_name='us-east-2')
-    output_path = '/tmp/output'
+import copy
+import base64
+import hashlib
+import functools
+from aws import get_client, get_region
+from fluentbit_profiles import DEFAULT_PROFILE, render_fluentbit_config
+from botocore.exceptions import ClientError
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+
+### Fluent bit configs of all regions are uploaded to the logging configs bucket in this region
+LOGGING_CONFIG_REGION = os.environ.get('LOGGING_CONFIG_REGION', 'us-east-2')
+
+### Services getting firelens and open telemetry sidecars. Matched as a part of the service name
+SIDECAR_SERVICES = (
+    'api',
+    'alerts',
+    'adminapi',
+    'lightserver',
+    'web',
+    'crawler',
+    'crawler-realtime-pre-regular-post-market',
+    'repeater',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def read_sidecar_template(name):
+    """Parse sidecar container template once per process
+
+    Args:
+        name (str): Template file name in the devops directory or absolute path
+
+    Returns:
+        dict: Parsed template. Shared, don't modify
+    """
+    with open(os.path.join(DIR_PATH, name), 'r') as template:
+        return json.loads(template.read())
+
+
+def load_sidecar_template(name):
+    """Get fresh copy of the sidecar container template, with awslogs pointed to the current region
+
+    Args:
+        name (str): Template file name in the devops directory or absolute path
+
+    Returns:
+        dict: Container definition
+    """
+    template = copy.deepcopy(read_sidecar_template(name))
+    options = template.get('logConfiguration', {}).get('options', {})
+    if 'awslogs-region' in options:
+        options['awslogs-region'] = get_region()
+    return template
+
+
+def sidecar_filter_passed(service_name):
+    """Check if service gets sidecars"""
+    return any(s in service_name for s in SIDECAR_SERVICES)
+
+
+def prepare_fluentbit_config(es_host, containername, logger, index_name, bucket_name, upload_s3=True, profile=DEFAULT_PROFILE, region=None):
+    config = render_fluentbit_config(es_host, containername, index_name, profile, region or get_region())
+    logger.info(f'Using fluent bit profile {profile}')
+
+    if not upload_s3:
+        return config
 
     try:
-        with open(output_path, 'w') as f:
-            f.write(config)
-        file_path = f'{containername}/logDestinations.conf'
+        body = config.encode()
+        md5 = hashlib.md5(body)
+        digest = md5.hexdigest()
+        ## Content addressed key, so every task definition revision pins the exact config it was deployed with
+        file_path = f'{containername}/logDestinations-{digest}.conf'
         s3_file_path = f'arn:aws:s3:::{bucket_name}/{file_path}'
-        if upload_s3:
-            s3_client.upload_file(output_path, bucket_name, file_path)
-            return s3_file_path
+        s3_client = get_client('s3', LOGGING_CONFIG_REGION)
+        if get_s3_object_md5(s3_client, bucket_name, file_path) == digest:
+            logger.info(f'Fluent bit config {file_path} is already uploaded')
         else:
-            return config
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=file_path,
+                Body=body,
+                ContentMD5=base64.b64encode(md5.digest()).decode(),
+                Metadata={'content-md5': digest}
+            )
+        return s3_file_path
     except Exception as e:
         try:
             logger.info('Got an error while uploading fluent bit configs into the s3: ')
@@ -70,6 +95,26 @@ def prepare_fluentbit_config(es_host, containername, logger, index_name, bucket_
             print(etwo)
         return False
 
+def get_s3_object_md5(s3_client, bucket_name, key):
+    """Get MD5 of the existing S3 object
+
+    Args:
+        s3_client (obj): Boto3 S3 client
+        bucket_name (str): Bucket name
+        key (str): Object key
+
+    Returns:
+        str: MD5 hex digest. None if object doesn't exist
+    """
+    try:
+        response = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    ## ETag is not MD5 for KMS encrypted objects, digest is stored in the metadata too
+    return response.get('Metadata', {}).get('content-md5') or response['ETag'].strip('"')
+
 def apply_opentelemetry_config(environment_name, service_name, definition, logger, containername):
     """
 
@@ -82,28 +127,12 @@ def apply_opentelemetry_config(environment_name, service_name, definition, logge
     Returns:
         dict: New ecs revision with logging container included.
     """
-    service_filter = (
-        'api',
-        'alerts',
-        'adminapi',
-        'lightserver',
-        'web',
-        'lightserver_pre_market',
-        'lightserver_post_market',
-        'lightserver_pre_regular_post_market',
-        'lightserver_pre_regular_market',
-        'crawler',
-        'crawler-realtime-pre-regular-post-market',
-        'repeater',
-    )
-
     container_definitions = definition['taskDefinition']['containerDefinitions']
-    dir_path = os.path.dirname(os.path.realpath(__file__))
 
     logger.info(f'Service name: {service_name}')
-    logger.info(f'Service filter: {service_filter}')
+    logger.info(f'Service filter: {SIDECAR_SERVICES}')
 
-    if any(s in service_name for s in service_filter):
+    if sidecar_filter_passed(service_name):
         logger.info('Filter passed')
         container_definitions[0]['name'] = containername
         logger.info(f'Found {len(container_definitions)} containers')
@@ -116,9 +145,7 @@ def apply_opentelemetry_config(environment_name, service_name, definition, logge
         ## Applying open telemetry collector for managed prometheus
         if not collector_exist:
             logger.info(f'Applying open telemetry configuration for service {service_name} in {environment_name} environment')
-            with open(f'{dir_path}/open_telemetry_collector.json', 'r') as log_definition:
-                telemetry_collector = json.loads(log_definition.read())
-            container_definitions.append(telemetry_collector)
+            container_definitions.append(load_sidecar_template('open_telemetry_collector.json'))
             definition['taskDefinition']['containerDefinitions'] = container_definitions
         else:
             # for item in definition['taskDefinition']['containerDefinitions'][-1]:
@@ -138,25 +165,13 @@ def apply_fluent_bit(environment_name, service_name, definition, fluentbit_confi
     Returns:
         dict: New ecs revision with logging container included.
     """
-    service_filter = (
-        'api',
-        'alerts',
-        'adminapi',
-        'lightserver',
-        'web',
-        'crawler',
-        'crawler-realtime-pre-regular-post-market',
-        'repeater',
-    )
-
     container_definitions = definition['taskDefinition']['containerDefinitions']
-    dir_path = os.path.dirname(os.path.realpath(__file__))
 
     logger.info(f'Service name: {service_name}')
-    logger.info(f'Service filter: {service_filter}')
+    logger.info(f'Service filter: {SIDECAR_SERVICES}')
 
     ## If passed filter
-    if any(s in service_name for s in service_filter):
+    if sidecar_filter_passed(service_name):
         logger.info('Filter passed')
         container_definitions[0]['name'] = containername
         logger.info(f'Found {len(container_definitions)} containers')
@@ -164,8 +179,7 @@ def apply_fluent_bit(environment_name, service_name, definition, fluentbit_confi
         # FIX: Relaxed logic to ensure single containers ALWAYS get sidecar injected
         if len(container_definitions) == 1:
             logger.info(f'Applying new logging configuration for service {service_name} in {environment_name} environment')
-            with open(f'{dir_path}/log_router.json', 'r') as log_definition:
-                log_router = json.loads(log_definition.read())
+            log_router = load_sidecar_template('log_router.json')
             
             if custom_image:
                 log_router['image'] = custom_image
@@ -191,8 +205,6 @@ def apply_fluent_bit(environment_name, service_name, definition, fluentbit_confi
             
         elif len(container_definitions) > 1 and container_definitions[0].get('logConfiguration', {}).get('logDriver') == "awsfirelens":
             logger.info("apply_fluent_bit: found two containers. Updating firelens configuration...")
-            with open(f'{dir_path}/log_router.json', 'r') as log_definition:
-                log_router = json.loads(log_definition.read())
             
             ## Update logging config if it's needed
             container_definitions[0]['name'] = containername
@@ -0,0 +1,132 @@
+"""
+Deployment logger setup: colored or JSON lines output through a background queue listener
+Returns:
+    None:
+"""
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+from aws import get_region
+from formatter import CustomFormatter
+from metrics import current_service
+
+LOGGER_NAME = 'Deployment'
+LOG_FORMATS = ('text', 'json')
+
+### Records of the standard LogRecord, everything else passed with extra= goes to the JSON line
+RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'context', 'service', 'region'}
+
+listener = None
+queue_handler = None
+
+
+class ContextFilter(logging.Filter):
+    """Add service and region of the deploying thread to the record
+
+    Runs in the logging thread, before the record is queued, so context vars are still readable.
+    """
+
+    def filter(self, record):
+        service = current_service.get()
+        record.service = None if service == 'run' else service
+        record.region = get_region()
+        record.context = f'[{record.service}] ' if record.service else ''
+        return True
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler keeping the traceback apart from the message, for the JSON formatter"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for CI log ingestion"""
+
+    def format(self, record):
+        """Format log
+
+        Args:
+            record (obj): Log record
+
+        Returns:
+            str: JSON line
+        """
+        line = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'service': getattr(record, 'service', None),
+            'region': getattr(record, 'region', None),
+            'file': record.filename,
+            'line': record.lineno,
+        }
+        line.update({key: value for key, value in vars(record).items() if key not in RECORD_FIELDS})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line['exception'] = record.exc_text
+        return json.dumps(line, default=str)
+
+
+def setup_logging(log_format=None, level=None, stream=None):
+    """Send Deployment logger records to stderr through a queue, so threads never wait on the stream
+
+    Calling it again replaces the previous setup.
+
+    Args:
+        log_format (str): text(colored) or json. Defaults to DEPLOY_LOG_FORMAT env or text
+        level (str|int): Logger level. Defaults to DEPLOY_LOG_LEVEL env or DEBUG
+        stream (obj): Output stream. Defaults to stderr
+
+    Returns:
+        obj: Deployment logger
+    """
+    global listener, queue_handler
+    log_format = log_format or os.environ.get('DEPLOY_LOG_FORMAT', 'text')
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f'Invalid log format {log_format}. Use one of {", ".join(LOG_FORMATS)}')
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else CustomFormatter())
+
+    queue_handler = ContextQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter())
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler)
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level or os.environ.get('DEPLOY_LOG_LEVEL', 'DEBUG'))
+    logger.addHandler(queue_handler)
+    listener.start()
+    return logger
+
+
+def stop_logging():
+    """Flush queued records and detach the queue handler"""
+    global listener, queue_handler
+    if queue_handler is not None:
+        logging.getLogger(LOGGER_NAME).removeHandler(queue_handler)
+        queue_handler = None
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+atexit.register(stop_logging)
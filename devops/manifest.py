@@ -0,0 +1,109 @@
+"""
+Multi-service deploy manifest
+Returns:
+    None:
+"""
+import json
+import argparse
+import threading
+from concurrent.futures import Future
+
+
+class SharedLookups:
+    """Memoized lookups shared by all services deployed in one run
+
+    The first caller of a key runs the loader, concurrent callers of the same
+    key wait for its result instead of repeating the AWS calls.
+
+    Args:
+        ssm_cache (SSMCache): Optional local SSM cache used by every service
+    """
+
+    def __init__(self, ssm_cache=None):
+        self.ssm_cache = ssm_cache
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Get memoized value
+
+        Args:
+            key (tuple): Lookup key
+            loader (func): Called once to build the value
+
+        Returns:
+            any: Loader result
+        """
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = self.futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(loader())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+
+def load_manifest(path):
+    """Load JSON or YAML manifest
+
+    Manifest is either a list of services or a dict with optional `defaults`
+    and `services` keys. Service keys are the deploy.py flags, for example
+    `{"service": "api", "cluster": "production-api", "port": 3000}`.
+
+    Args:
+        path (str): Manifest file path
+
+    Returns:
+        dict: Manifest with defaults and services keys
+    """
+    with open(path, 'r') as f:
+        content = f.read()
+
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError('PyYAML is required for YAML manifests. Use JSON or install pyyaml')
+        manifest = yaml.safe_load(content)
+    else:
+        manifest = json.loads(content)
+
+    if isinstance(manifest, list):
+        manifest = {'services': manifest}
+    manifest.setdefault('defaults', {})
+    manifest.setdefault('services', [])
+    return manifest
+
+
+def manifest_service_args(parser, base_args, manifest):
+    """Build per-service args. CLI args < manifest defaults < service entry
+
+    Args:
+        parser (obj): deploy.py argument parser, used for option names and types
+        base_args (obj): Parsed CLI args
+        manifest (dict): Loaded manifest
+
+    Returns:
+        list: argparse.Namespace for every service
+    """
+    actions = {action.dest: action for action in parser._actions}
+    services_args = []
+
+    for entry in manifest['services']:
+        values = vars(base_args).copy()
+        for key, value in {**manifest['defaults'], **entry}.items():
+            dest = key.lstrip('-').replace('-', '_')
+            if dest not in actions:
+                raise ValueError(f'Unknown manifest key "{key}" for service {entry.get("service")}')
+            action_type = actions[dest].type
+            if isinstance(value, str) and action_type is not None:
+                value = action_type(value)
+            elif isinstance(value, (int, float)) and action_type is str:
+                value = str(value)
+            values[dest] = value
+        services_args.append(argparse.Namespace(**values))
+    return services_args
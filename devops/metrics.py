@@ -0,0 +1,187 @@
+"""
+Deploy instrumentation: phase timings, AWS API calls and retries per service
+Returns:
+    None:
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+### Service deployed by the current thread, used to attribute API calls
+current_service = contextvars.ContextVar('current_service', default='run')
+
+
+def bind_context(func):
+    """Run func with the caller's context vars. Used for executor workers
+
+    Args:
+        func (func): Function submitted to a thread pool
+
+    Returns:
+        func: Wrapped function
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        ## Context object can't be entered by several threads at once
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+class DeployMetrics:
+    """Collects per service phase durations and botocore API call/retry counts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = defaultdict(Counter)
+        self.api_calls = defaultdict(Counter)
+        self.attempts = defaultdict(Counter)
+        self.spans = []
+        self.installed = False
+
+    def reset(self):
+        """Drop collected values. Installed hooks are kept"""
+        with self.lock:
+            self.phases.clear()
+            self.api_calls.clear()
+            self.attempts.clear()
+            self.spans.clear()
+
+    def install(self, session):
+        """Register botocore event hooks. Must be called before clients are created
+
+        Args:
+            session (obj): Shared boto3 session
+        """
+        if self.installed:
+            return
+        session.events.register('before-call', self.on_before_call)
+        session.events.register('before-send', self.on_before_send)
+        self.installed = True
+
+    def on_before_call(self, event_name, **kwargs):
+        """Counted once per API call"""
+        operation = '.'.join(event_name.split('.')[1:3])
+        with self.lock:
+            self.api_calls[current_service.get()][operation] += 1
+
+    def on_before_send(self, event_name, **kwargs):
+        """Counted once per HTTP attempt, including retries"""
+        operation = '.'.join(event_name.split('.')[1:3])
+        with self.lock:
+            self.attempts[current_service.get()][operation] += 1
+
+    @contextmanager
+    def phase(self, name):
+        """Time deploy phase of the current service
+
+        Args:
+            name (str): Phase name, for example ssm or register_task_definition
+        """
+        service = current_service.get()
+        start_ns = time.time_ns()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - started
+            with self.lock:
+                self.phases[service][name] += seconds
+                self.spans.append((service, name, start_ns, time.time_ns()))
+
+    def summary(self):
+        """Build JSON serializable summary
+
+        Returns:
+            dict: Per service phases, API calls and retries
+        """
+        with self.lock:
+            services = set(self.phases) | set(self.api_calls)
+            summary = {}
+            for service in sorted(services):
+                calls = self.api_calls[service]
+                retries = {
+                    operation: attempts - calls[operation]
+                    for operation, attempts in self.attempts[service].items()
+                    if attempts > calls[operation]
+                }
+                summary[service] = {
+                    'phases': {name: round(seconds, 3) for name, seconds in self.phases[service].items()},
+                    'api_calls': dict(calls),
+                    'api_calls_total': sum(calls.values()),
+                    'retries': retries,
+                    'retries_total': sum(retries.values())
+                }
+            return summary
+
+    def write_json(self, path):
+        """Write summary as JSON file"""
+        with open(path, 'w') as f:
+            f.write(json.dumps(self.summary(), indent=4))
+
+    def write_prometheus(self, path):
+        """Write summary in Prometheus text format, for node_exporter textfile collector"""
+        lines = [
+            '# HELP deploy_phase_seconds Duration of the deploy phase',
+            '# TYPE deploy_phase_seconds gauge',
+        ]
+        summary = self.summary()
+        for service, item in summary.items():
+            for name, seconds in item['phases'].items():
+                lines.append(f'deploy_phase_seconds{{service="{service}",phase="{name}"}} {seconds}')
+        lines += [
+            '# HELP deploy_api_calls AWS API calls made by the deploy',
+            '# TYPE deploy_api_calls gauge',
+        ]
+        for service, item in summary.items():
+            for operation, count in item['api_calls'].items():
+                lines.append(f'deploy_api_calls{{service="{service}",operation="{operation}"}} {count}')
+        lines += [
+            '# HELP deploy_api_retries AWS API call retries made by the deploy',
+            '# TYPE deploy_api_retries gauge',
+        ]
+        for service, item in summary.items():
+            for operation, count in item['retries'].items():
+                lines.append(f'deploy_api_retries{{service="{service}",operation="{operation}"}} {count}')
+
+        ## Textfile collector may read the file at any time
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+    def export_opentelemetry(self, logger):
+        """Export phases as OpenTelemetry spans. OTLP exporter is configured with OTEL_* env variables
+
+        Args:
+            logger (obj): Logger
+
+        Returns:
+            bool: False if opentelemetry packages are not installed
+        """
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning('OpenTelemetry export skipped: install opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http')
+            return False
+
+        provider = TracerProvider(resource=Resource.create({'service.name': 'devops-deploy'}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        tracer = provider.get_tracer('deploy')
+        with self.lock:
+            spans = list(self.spans)
+        for service, name, start_ns, end_ns in spans:
+            span = tracer.start_span(name, start_time=start_ns, attributes={'deploy.service': service})
+            span.end(end_time=end_ns)
+        provider.shutdown()
+        return True
+
+
+metrics = DeployMetrics()
@@ -0,0 +1,203 @@
+"""
+Task definition transform pipeline
+
+Stages are registered with an order and run one after another on the task
+definition. Extra stages(new sidecars for example) live in their own modules,
+loaded with deploy.py --stage_module, and register themselves with register_stage.
+Returns:
+    None:
+"""
+import time
+import logging
+import importlib
+
+from secrets_bundle import loader_environment
+from helpers import apply_fluent_bit, apply_opentelemetry_config, load_sidecar_template, sidecar_filter_passed
+
+logger = logging.getLogger("Deployment")
+
+### Stage name -> (order, function)
+STAGES = {}
+
+
+def register_stage(name, order):
+    """Register pipeline stage. Stage with the same name replaces the previous one
+
+    Stage function gets the task definition(describe_task_definition response)
+    and the pipeline context, and changes the definition in place.
+
+    Args:
+        name (str): Stage name
+        order (int): Stages run in ascending order
+
+    Returns:
+        func: Decorator
+    """
+    def decorator(func):
+        STAGES[name] = (order, func)
+        return func
+    return decorator
+
+
+def register_sidecar(name, order, template, services=None):
+    """Register stage appending sidecar container from the JSON template
+
+    Args:
+        name (str): Stage name
+        order (int): Stage order
+        template (str): Template file in the devops directory or absolute path
+        services (tuple): Service names getting the sidecar. Defaults to the firelens/otel services
+    """
+    @register_stage(name, order)
+    def add_sidecar(definition, context):
+        if not context.sidecars:
+            return
+        if services is None and not sidecar_filter_passed(context.args.service):
+            return
+        if services is not None and context.args.service not in services:
+            return
+        sidecar = load_sidecar_template(template)
+        container_definitions = definition['taskDefinition']['containerDefinitions']
+        if any(item['name'] == sidecar['name'] for item in container_definitions):
+            logger.info(f'Found {sidecar["name"]} container. Skipping.')
+            return
+        container_definitions.append(sidecar)
+
+
+def load_stage_modules(modules):
+    """Import modules registering extra stages
+
+    Args:
+        modules (list): Module names
+    """
+    for module in modules or []:
+        if module.strip():
+            importlib.import_module(module.strip())
+
+
+def run_pipeline(definition, context, skip=()):
+    """Run registered stages
+
+    Args:
+        definition (dict): describe_task_definition response, changed in place
+        context (obj): Pipeline context: args, secrets, port_mappings, fluentbit_config_location, sidecars
+        skip (tuple): Stage names to skip
+
+    Returns:
+        dict: Stage name -> seconds
+    """
+    timings = {}
+    for name, (order, stage) in sorted(STAGES.items(), key=lambda item: item[1][0]):
+        if name in skip:
+            continue
+        started = time.monotonic()
+        stage(definition, context)
+        timings[name] = time.monotonic() - started
+        if context.args.verbose:
+            logger.debug(f'Stage {name}: {timings[name] * 1000:.2f}ms')
+    return timings
+
+
+@register_stage('secrets', 10)
+def secrets_stage(definition, context):
+    ## Remove if SSM management is disabled
+    container = definition['taskDefinition']['containerDefinitions'][0]
+    container['secrets'] = [] if context.args.disable_ssm_management else context.secrets
+
+
+@register_stage('ports', 20)
+def ports_stage(definition, context):
+    container = definition['taskDefinition']['containerDefinitions'][0]
+    container['portMappings'] = context.port_mappings
+    ### Not privileged if fargate. Required
+    if context.args.fargate:
+        container['privileged'] = False
+
+
+@register_stage('image', 30)
+def image_stage(definition, context):
+    args = context.args
+    container = definition['taskDefinition']['containerDefinitions'][0]
+    ### pass markettype
+    if args.markettype:
+        container['environment'] = [
+            {
+                "name": "MARKETS",
+                "value": args.markettype
+            }
+        ]
+    container['image'] = context.image
+    container['name'] = args.contanername
+
+
+@register_stage('secrets_loader', 35)
+def secrets_loader_stage(definition, context):
+    ## Bundled secrets are expanded by the loader, removed again when bundling is turned off.
+    ## Runs after the image stage, --markettype replaces the environment
+    container = definition['taskDefinition']['containerDefinitions'][0]
+    environment = loader_environment(
+        container.get('environment'),
+        context.args.secrets_bundle and not context.args.disable_ssm_management
+    )
+    if environment != container.get('environment', []):
+        container['environment'] = environment
+
+
+@register_stage('firelens', 40)
+def firelens_stage(definition, context):
+    if not context.sidecars:
+        return
+    args = context.args
+    apply_fluent_bit(
+        args.environment.lower(),
+        args.service,
+        definition,
+        context.fluentbit_config_location,
+        logger,
+        args.contanername,
+        custom_image=None if not args.fluentimage else args.fluentimage
+    )
+
+
+@register_stage('otel', 50)
+def otel_stage(definition, context):
+    if not context.sidecars:
+        return
+    args = context.args
+    logger.info('Applying opentelemetry config')
+    apply_opentelemetry_config(
+        args.environment.lower(),
+        args.service,
+        definition,
+        logger,
+        args.contanername
+    )
+
+
+@register_stage('mounts', 60)
+def mounts_stage(definition, context):
+    if context.args.fargate:
+        return
+    for container in definition['taskDefinition']['containerDefinitions']:
+        container['mountPoints'] = [{
+            "sourceVolume": "logs",
+            "containerPath": "/var/www/app/tmp/traderlionApp/"
+        }]
+
+
+@register_stage('compatibilities', 70)
+def compatibilities_stage(definition, context):
+    task_definition = definition['taskDefinition']
+    if context.args.fargate:
+        logger.info('Enabling fargate')
+        task_definition['requiresCompatibilities'] = ['FARGATE']
+        task_definition['networkMode'] = 'awsvpc'
+        ### Cleanup compatibilities from previous EC2 revision
+        if 'compatibilities' in task_definition:
+            del task_definition['compatibilities']
+    else:
+        logger.info('Disabling/skipping fargate')
+        task_definition['requiresCompatibilities'] = ['EC2']
+        task_definition['networkMode'] = 'bridge'
+        if 'compatibilities' not in task_definition:
+            task_definition['compatibilities'] = ['EC2']
@@ -0,0 +1,158 @@
+"""
+ECS capacity provider strategies and task placement
+Returns:
+    None:
+"""
+
+FARGATE_PROVIDERS = ('FARGATE', 'FARGATE_SPOT')
+
+### ECS limits
+MAX_STRATEGY_PROVIDERS = 20
+MAX_WEIGHT = 1000
+MAX_BASE = 100000
+MAX_PLACEMENT_STRATEGIES = 5
+MAX_PLACEMENT_CONSTRAINTS = 10
+
+### Placement strategy type -> allowed fields. spread also takes any attribute:<name>
+PLACEMENT_FIELDS = {
+    'binpack': ('cpu', 'memory'),
+    'spread': ('instanceId', 'host'),
+    'random': (),
+}
+CONSTRAINT_TYPES = ('distinctInstance', 'memberOf')
+
+
+def parse_capacity_strategy(spec, fargate=False):
+    """Parse capacity provider strategy like "FARGATE:2:1,FARGATE_SPOT:0:3"
+
+    Base tasks run on the first provider, the rest is split by weight. Here
+    2 tasks on FARGATE, then 1 of every 4 extra tasks on FARGATE and 3 on FARGATE_SPOT.
+
+    Args:
+        spec (str): Comma separated provider[:base[:weight]]. Defaults: base 0, weight 1
+        fargate (bool): Fargate service, only FARGATE and FARGATE_SPOT are allowed
+
+    Returns:
+        list: ECS capacityProviderStrategy
+    """
+    strategy = []
+    for item in spec.split(','):
+        provider, *values = item.strip().split(':')
+        if not provider or len(values) > 2:
+            raise ValueError(f'Invalid capacity provider "{item.strip()}", expected provider[:base[:weight]]')
+        base = int(values[0]) if values and values[0] else 0
+        weight = int(values[1]) if len(values) == 2 else 1
+        if not 0 <= base <= MAX_BASE or not 0 <= weight <= MAX_WEIGHT:
+            raise ValueError(f'Capacity provider {provider}: base must be 0-{MAX_BASE}, weight 0-{MAX_WEIGHT}')
+        strategy.append({'capacityProvider': provider, 'base': base, 'weight': weight})
+
+    providers = [item['capacityProvider'] for item in strategy]
+    if len(set(providers)) != len(providers):
+        raise ValueError(f'Capacity provider listed twice in "{spec}"')
+    if len(strategy) > MAX_STRATEGY_PROVIDERS:
+        raise ValueError(f'Capacity provider strategy supports up to {MAX_STRATEGY_PROVIDERS} providers')
+    if len([item for item in strategy if item['base'] > 0]) > 1:
+        raise ValueError('Only one capacity provider can have a base')
+    if not any(item['weight'] > 0 for item in strategy):
+        raise ValueError('At least one capacity provider needs weight above 0')
+    fargate_providers = [provider for provider in providers if provider in FARGATE_PROVIDERS]
+    if fargate and len(fargate_providers) != len(providers):
+        raise ValueError(f'Fargate service can only use {" and ".join(FARGATE_PROVIDERS)} capacity providers')
+    if not fargate and fargate_providers:
+        raise ValueError(f'EC2 service can not use {", ".join(fargate_providers)} capacity providers')
+    return strategy
+
+
+def appspec_capacity_strategy(strategy):
+    """CodeDeploy AppSpec form of the strategy"""
+    return [
+        {'CapacityProvider': item['capacityProvider'], 'Base': item['base'], 'Weight': item['weight']}
+        for item in strategy
+    ]
+
+
+def parse_placement_strategy(spec):
+    """Parse placement strategy like "spread:attribute:ecs.availability-zone,binpack:memory"
+
+    Rules are applied in order: here tasks are spread across AZs first and then packed
+    on the instance with the least memory left in that AZ.
+
+    Args:
+        spec (str): Comma separated type[:field]
+
+    Returns:
+        list: ECS placementStrategy
+    """
+    strategy = []
+    for item in spec.split(','):
+        strategy_type, _, field = item.strip().partition(':')
+        if strategy_type not in PLACEMENT_FIELDS:
+            raise ValueError(f'Invalid placement strategy "{item.strip()}". Use one of {", ".join(PLACEMENT_FIELDS)}')
+        if strategy_type == 'random':
+            if field:
+                raise ValueError('random placement strategy takes no field')
+            strategy.append({'type': strategy_type})
+            continue
+        if field not in PLACEMENT_FIELDS[strategy_type] and \
+                not (strategy_type == 'spread' and field.startswith('attribute:') and len(field) > len('attribute:')):
+            valid = ', '.join(PLACEMENT_FIELDS[strategy_type] + (('attribute:<name>',) if strategy_type == 'spread' else ()))
+            raise ValueError(f'Invalid {strategy_type} field "{field}". Use one of {valid}')
+        strategy.append({'type': strategy_type, 'field': field})
+    if len(strategy) > MAX_PLACEMENT_STRATEGIES:
+        raise ValueError(f'ECS supports up to {MAX_PLACEMENT_STRATEGIES} placement strategy rules')
+    return strategy
+
+
+def parse_placement_constraint(spec):
+    """Parse placement constraint: "distinctInstance" or "memberOf:<cluster query expression>"
+
+    Args:
+        spec (str): Constraint
+
+    Returns:
+        dict: ECS placement constraint
+    """
+    constraint_type, _, expression = spec.strip().partition(':')
+    if constraint_type not in CONSTRAINT_TYPES:
+        raise ValueError(f'Invalid placement constraint "{spec}". Use one of {", ".join(CONSTRAINT_TYPES)}')
+    if constraint_type == 'distinctInstance':
+        if expression:
+            raise ValueError('distinctInstance constraint takes no expression')
+        return {'type': constraint_type}
+    if not expression:
+        raise ValueError('memberOf constraint needs an expression, for example "memberOf:attribute:ecs.instance-type =~ c6i.*"')
+    return {'type': constraint_type, 'expression': expression}
+
+
+def placement_update_args(strategy, constraints, fargate=False, capacity_strategy=None):
+    """Validate placement against the launch type and build update_service arguments
+
+    Args:
+        strategy (list): ECS placementStrategy
+        constraints (list): ECS placementConstraints or parse_placement_constraint specs
+        fargate (bool): Fargate service
+        capacity_strategy (list): ECS capacityProviderStrategy of the service
+
+    Returns:
+        dict: placementStrategy/placementConstraints arguments. Empty if nothing is set
+    """
+    ## Manifest values are not parsed by argparse
+    if isinstance(constraints, (str, dict)):
+        constraints = [constraints]
+    constraints = [parse_placement_constraint(item) if isinstance(item, str) else item for item in constraints or []]
+    if not strategy and not constraints:
+        return {}
+    if len(constraints) > MAX_PLACEMENT_CONSTRAINTS:
+        raise ValueError(f'ECS supports up to {MAX_PLACEMENT_CONSTRAINTS} placement constraints')
+    fargate_providers = [
+        item['capacityProvider'] for item in capacity_strategy or []
+        if item['capacityProvider'] in FARGATE_PROVIDERS
+    ]
+    if fargate or fargate_providers:
+        raise ValueError('Placement strategies and constraints are not supported on Fargate')
+    update_args = {}
+    if strategy:
+        update_args['placementStrategy'] = strategy
+    if constraints:
+        update_args['placementConstraints'] = constraints
+    return update_args
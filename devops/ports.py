@@ -0,0 +1,81 @@
+"""
+Container port mappings
+Returns:
+    None:
+"""
+
+DEFAULT_PORT_RANGE = '40000-40100'
+
+### Network modes where ECS accepts containerPortRange
+RANGE_NETWORK_MODES = ('bridge', 'awsvpc')
+PORT_MAPPING_MODES = ('auto', 'range', 'individual')
+
+
+def parse_port_spec(spec):
+    """Parse port spec like "40000-40100,50000"
+
+    Args:
+        spec (str): Comma separated ports and port ranges. Empty or "none" for no extra ports
+
+    Returns:
+        list: Sorted (start, end) tuples
+    """
+    if not spec or spec.strip().lower() == 'none':
+        return []
+
+    ranges = []
+    for item in spec.split(','):
+        start, _, end = item.strip().partition('-')
+        start, end = int(start), int(end or start)
+        if not 1 <= start <= end <= 65535:
+            raise ValueError(f'Invalid port range "{item.strip()}"')
+        ranges.append((start, end))
+
+    ranges.sort()
+    for previous, current in zip(ranges, ranges[1:]):
+        if current[0] <= previous[1]:
+            raise ValueError(f'Overlapping port ranges {previous[0]}-{previous[1]} and {current[0]}-{current[1]}')
+    return ranges
+
+
+def build_port_mappings(app_port, spec, network_mode, mode='auto'):
+    """Build ECS port mappings for the application port and the extra port spec
+
+    Ranges are emitted as containerPortRange where network mode allows it,
+    otherwise every port gets its own mapping.
+
+    Args:
+        app_port (int): Application container port
+        spec (str): Extra ports, see parse_port_spec
+        network_mode (str): Task definition network mode: bridge, awsvpc or host
+        mode (str): auto, range or individual
+
+    Returns:
+        list: ECS portMappings
+    """
+    if mode not in PORT_MAPPING_MODES:
+        raise ValueError(f'Unknown port mapping mode "{mode}". Use one of {", ".join(PORT_MAPPING_MODES)}')
+    if mode == 'range' and network_mode not in RANGE_NETWORK_MODES:
+        raise ValueError(f'containerPortRange is not supported for {network_mode} network mode')
+    use_ranges = mode != 'individual' and network_mode in RANGE_NETWORK_MODES
+
+    def mapping(port):
+        return {
+            "hostPort": 0 if network_mode == 'bridge' else port,
+            "protocol": "tcp",
+            "containerPort": port
+        }
+
+    portMappings = [mapping(app_port)]
+    for start, end in parse_port_spec(spec):
+        if start <= app_port <= end:
+            raise ValueError(f'Application port {app_port} overlaps port range {start}-{end}')
+        if use_ranges and end > start:
+            ### hostPort is assigned by ECS for the ranges
+            portMappings.append({
+                "protocol": "tcp",
+                "containerPortRange": f'{start}-{end}'
+            })
+        else:
+            portMappings.extend(mapping(port) for port in range(start, end + 1))
+    return portMappings
@@ -0,0 +1,316 @@
+"""
+ECS rollout helpers
+Returns:
+    None:
+"""
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from metrics import bind_context
+
+logger = logging.getLogger("Deployment")
+
+### describe_tasks accepts up to 100 tasks
+DESCRIBE_TASKS_BATCH_SIZE = 100
+
+
+def waiter_config(timeout, delay):
+    """Build WaiterConfig for the timeout in seconds"""
+    return {
+        'Delay': delay,
+        'MaxAttempts': max(1, math.ceil(timeout / delay))
+    }
+
+
+def list_service_tasks(client, cluster, service, desired_status='RUNNING'):
+    """List service task ARNs
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        desired_status (str): RUNNING, PENDING or STOPPED
+
+    Returns:
+        list: Task ARNs
+    """
+    paginator = client.get_paginator('list_tasks')
+    response_iterator = paginator.paginate(
+        cluster=cluster,
+        serviceName=service,
+        desiredStatus=desired_status,
+        PaginationConfig={
+            'PageSize': 100
+        }
+    )
+    return [task for page in response_iterator for task in page['taskArns']]
+
+
+def service_task_definitions(client, cluster, service):
+    """Task definitions of all service deployments(or CodeDeploy task sets), old ones still draining included
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+
+    Returns:
+        set: Task definition ARNs
+    """
+    services = client.describe_services(cluster=cluster, services=[service])['services']
+    if not services:
+        return set()
+    description = services[0]
+    arns = {item['taskDefinition'] for item in description.get('deployments', []) + description.get('taskSets', [])}
+    if description.get('taskDefinition'):
+        arns.add(description['taskDefinition'])
+    return arns
+
+
+def service_runs_revision(client, cluster, service, task_definition):
+    """Check if the service PRIMARY deployment(or CodeDeploy task set) is the task definition
+
+    A PRIMARY deployment with FAILED rollout state doesn't count, it needs another rollout.
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        task_definition (str): Task definition ARN
+
+    Returns:
+        bool: True if the service already runs the revision
+    """
+    services = client.describe_services(cluster=cluster, services=[service])['services']
+    if not services:
+        return False
+    description = services[0]
+    primary = next(
+        (item for item in description.get('deployments', []) + description.get('taskSets', []) if item['status'] == 'PRIMARY'),
+        None
+    )
+    if primary is None:
+        return description.get('taskDefinition') == task_definition
+    return primary['taskDefinition'] == task_definition and primary.get('rolloutState') != 'FAILED'
+
+
+def stop_tasks(client, cluster, task_arns, max_workers, timeout, delay):
+    """Stop tasks concurrently and wait until all of them are stopped
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        task_arns (list): Tasks to stop
+        max_workers (int): Max parallel stop_task calls
+        timeout (int): Seconds to wait for STOPPED status, for all tasks together
+        delay (int): Seconds between status checks
+    """
+    def stop(task_arn):
+        try:
+            client.stop_task(cluster=cluster, task=task_arn, reason='Deployment restart')
+        except ClientError as e:
+            ## Task could be stopped by the scheduler meanwhile
+            logger.warning(f'Failed to stop task {task_arn}: {e}')
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(task_arns)))) as executor:
+        list(executor.map(bind_context(stop), task_arns))
+
+    ## One deadline for all batches, so the outage stays within the timeout
+    deadline = time.monotonic() + timeout
+    waiter = client.get_waiter('tasks_stopped')
+    for i in range(0, len(task_arns), DESCRIBE_TASKS_BATCH_SIZE):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RolloutTimeout(f'Tasks of {cluster} did not stop in {timeout}s')
+        waiter.wait(
+            cluster=cluster,
+            tasks=task_arns[i:i + DESCRIBE_TASKS_BATCH_SIZE],
+            WaiterConfig=waiter_config(remaining, min(delay, remaining))
+        )
+
+
+def drain_and_restart(client, cluster, service, task_definition, desired_count,
+                      max_workers=10, timeout=600, delay=5, update_args=None):
+    """Scale service to 0, stop all tasks at once and scale it back. Used for singleton
+    realtime services(crawler-realtime, repeater) where old and new tasks can't run together
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        task_definition (str): Task definition ARN to start
+        desired_count (int): Desired count after restart
+        max_workers (int): Max parallel stop_task calls
+        timeout (int): Seconds to wait for tasks to stop and then for service to become stable
+        delay (int): Seconds between status checks
+        update_args (dict): Extra update_service arguments applied when scaling back, capacity provider
+            strategy and placement
+
+    Returns:
+        dict: Stopped tasks count, drain and outage durations in seconds
+    """
+    ## Listed before scaling in, so tasks already being stopped by ECS are awaited too
+    task_arns = list_service_tasks(client, cluster, service)
+
+    outage_started = time.monotonic()
+    client.update_service(
+        cluster=cluster,
+        service=service,
+        desiredCount=0,
+        taskDefinition=task_definition
+    )
+    logger.info(f'Stopping {len(task_arns)} tasks of {service}')
+    if task_arns:
+        stop_tasks(client, cluster, task_arns, max_workers, timeout, delay)
+    drain_seconds = time.monotonic() - outage_started
+
+    client.update_service(
+        cluster=cluster,
+        service=service,
+        desiredCount=desired_count,
+        taskDefinition=task_definition,
+        **(update_args or {})
+    )
+    client.get_waiter('services_stable').wait(
+        cluster=cluster,
+        services=[service],
+        WaiterConfig=waiter_config(timeout, delay)
+    )
+
+    report = {
+        'tasks_stopped': len(task_arns),
+        'drain_seconds': round(drain_seconds, 2),
+        'outage_seconds': round(time.monotonic() - outage_started, 2)
+    }
+    logger.info(f'Restart of {service} finished. Stopped {report["tasks_stopped"]} tasks in {report["drain_seconds"]}s, '
+                f'outage {report["outage_seconds"]}s')
+    return report
+
+
+class RolloutFailed(Exception):
+    """ECS or CodeDeploy deployment failed"""
+    exit_code = 2
+
+
+class RolloutTimeout(RolloutFailed):
+    """Deployment didn't finish in time"""
+    exit_code = 3
+
+
+def poll_intervals(initial=2, maximum=30, factor=1.5):
+    """Adaptive polling intervals: fast at first, then backing off to the maximum
+
+    Args:
+        initial (float): First interval in seconds
+        maximum (float): Max interval in seconds
+        factor (float): Growth factor
+
+    Yields:
+        float: Seconds to sleep before the next poll
+    """
+    delay = initial
+    while True:
+        yield delay
+        delay = min(maximum, delay * factor)
+
+
+def watch_ecs_deployment(client, cluster, service, task_definition, timeout=1800, initial_delay=2, max_delay=30):
+    """Follow ECS rolling deployment of the task definition until it completes
+
+    Args:
+        client (obj): Boto3 ECS client
+        cluster (str): ECS cluster
+        service (str): ECS service name
+        task_definition (str): Deployed task definition ARN
+        timeout (int): Seconds to wait
+        initial_delay (float): First polling interval
+        max_delay (float): Max polling interval
+
+    Returns:
+        float: Rollout duration in seconds
+    """
+    started = time.monotonic()
+    for delay in poll_intervals(initial_delay, max_delay):
+        description = client.describe_services(cluster=cluster, services=[service])['services'][0]
+        deployment = next(
+            (item for item in description['deployments'] if item['taskDefinition'] == task_definition),
+            None
+        )
+        if deployment is None:
+            raise RolloutFailed(f'Deployment of {task_definition} not found in {service}. Replaced by another deployment?')
+
+        state = deployment.get('rolloutState')
+        logger.info(f'{service}: rollout {state or deployment["status"]}, running {deployment["runningCount"]}/'
+                    f'{deployment["desiredCount"]}, pending {deployment["pendingCount"]}, failed {deployment.get("failedTasks", 0)}')
+
+        if state == 'FAILED':
+            raise RolloutFailed(f'Deployment of {service} failed: {deployment.get("rolloutStateReason")}')
+        ## Services without rolloutState: done when only the new deployment is left and all tasks run
+        if state == 'COMPLETED' or (state is None and len(description['deployments']) == 1
+                                    and deployment['runningCount'] == deployment['desiredCount']):
+            break
+        if time.monotonic() - started + delay > timeout:
+            raise RolloutTimeout(f'Deployment of {service} did not finish in {timeout}s')
+        time.sleep(delay)
+
+    rollout_seconds = round(time.monotonic() - started, 2)
+    logger.info(f'{service}: rollout completed in {rollout_seconds}s')
+    return rollout_seconds
+
+
+def get_traffic_weights(deploy_client, deployment_id, target_ids):
+    """Get traffic weights of blue/green task sets
+
+    Returns:
+        str: For example "Blue 90.0%, Green 10.0%"
+    """
+    if not target_ids:
+        return ''
+    targets = deploy_client.batch_get_deployment_targets(deploymentId=deployment_id, targetIds=target_ids)['deploymentTargets']
+    task_sets = [
+        task_set
+        for target in targets
+        for task_set in target.get('ecsTarget', {}).get('taskSetsInfo', [])
+    ]
+    return ', '.join(f'{item.get("taskSetLabel")} {item.get("trafficWeight", 0):.1f}%' for item in task_sets)
+
+
+def watch_codedeploy_deployment(deploy_client, deployment_id, timeout=1800, initial_delay=2, max_delay=30):
+    """Follow CodeDeploy blue/green deployment until it succeeds
+
+    Args:
+        deploy_client (obj): Boto3 CodeDeploy client
+        deployment_id (str): CodeDeploy deployment id
+        timeout (int): Seconds to wait
+        initial_delay (float): First polling interval
+        max_delay (float): Max polling interval
+
+    Returns:
+        float: Rollout duration in seconds
+    """
+    started = time.monotonic()
+    target_ids = None
+    for delay in poll_intervals(initial_delay, max_delay):
+        info = deploy_client.get_deployment(deploymentId=deployment_id)['deploymentInfo']
+        status = info['status']
+
+        if target_ids is None and status not in ('Created', 'Queued'):
+            target_ids = deploy_client.list_deployment_targets(deploymentId=deployment_id)['targetIds']
+        traffic = get_traffic_weights(deploy_client, deployment_id, target_ids) if target_ids else ''
+        logger.info(f'{deployment_id}: {status} {traffic}'.rstrip())
+
+        if status == 'Succeeded':
+            break
+        if status in ('Failed', 'Stopped'):
+            error = info.get('errorInformation', {})
+            raise RolloutFailed(f'CodeDeploy deployment {deployment_id} {status.lower()}: {error.get("code")} {error.get("message")}')
+        if time.monotonic() - started + delay > timeout:
+            raise RolloutTimeout(f'CodeDeploy deployment {deployment_id} did not finish in {timeout}s, last status {status}')
+        time.sleep(delay)
+
+    rollout_seconds = round(time.monotonic() - started, 2)
+    logger.info(f'{deployment_id}: deployment succeeded in {rollout_seconds}s')
+    return rollout_seconds
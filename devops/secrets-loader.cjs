@@ -0,0 +1,27 @@
+/**
+ * Expands SSM secrets bundles before the app starts.
+ *
+ * deploy.py --secrets_bundle replaces per variable secrets with a few SSM_BUNDLE_*
+ * secrets holding JSON objects, and preloads this file with NODE_OPTIONS=--require.
+ * Variables already set in the container environment are kept.
+ */
+const PREFIX = 'SSM_BUNDLE_';
+
+for (const key of Object.keys(process.env)) {
+  if (!key.startsWith(PREFIX)) {
+    continue;
+  }
+  let values;
+  try {
+    values = JSON.parse(process.env[key]);
+  } catch (error) {
+    console.error(`secrets-loader: ${key} is not valid JSON`);
+    throw error;
+  }
+  for (const [name, value] of Object.entries(values)) {
+    if (process.env[name] === undefined) {
+      process.env[name] = value;
+    }
+  }
+  delete process.env[key];
+}
@@ -0,0 +1,251 @@
+"""
+SSM secrets bundles: service variables packed into a few JSON parameters
+Returns:
+    None:
+"""
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from aws import get_client
+from botocore.exceptions import ClientError
+from metrics import bind_context
+from ssm import count_api_call, get_path_metadata, SSM_GET_BATCH_SIZE, SSM_MAX_WORKERS, SSM_WRITE_RETRIES
+
+logger = logging.getLogger("Deployment")
+
+### Container variables holding the bundles, expanded by secrets-loader.cjs
+BUNDLE_PREFIX = 'SSM_BUNDLE_'
+### Advanced tier limit. Bundles up to 4KB stay in the standard tier
+BUNDLE_MAX_BYTES = 8192
+STANDARD_MAX_BYTES = 4096
+### Loader copied into the image, see builds/web-app/DockerfileARM64
+LOADER_PATH = '/app/secrets-loader.cjs'
+### Services whose image ships the loader
+LOADER_SERVICES = ('web',)
+### Task definition revisions whose bundles are kept, older bundles are deleted
+BUNDLE_KEEP_REVISIONS = 5
+### delete_parameters accepts up to 10 names per call
+SSM_DELETE_BATCH_SIZE = 10
+
+
+def parameter_name(value_from):
+    """SSM parameter name from the secret valueFrom ARN"""
+    if ':parameter/' in value_from:
+        return '/' + value_from.split(':parameter/', 1)[1]
+    return value_from
+
+
+def get_parameter_values(names):
+    """Read decrypted values and types in concurrent batches of 10 names
+
+    Args:
+        names (list): Full parameter names
+
+    Returns:
+        dict: Parameter name -> get_parameters entry. Missing parameters are not included
+    """
+    def get_batch(batch):
+        response = get_client('ssm', retries=SSM_WRITE_RETRIES).get_parameters(Names=batch, WithDecryption=True)
+        count_api_call('GetParameters')
+        return response['Parameters']
+
+    batches = [names[i:i + SSM_GET_BATCH_SIZE] for i in range(0, len(names), SSM_GET_BATCH_SIZE)]
+    if not batches:
+        return {}
+    parameters = {}
+    with ThreadPoolExecutor(max_workers=min(SSM_MAX_WORKERS, len(batches))) as executor:
+        for entries in executor.map(bind_context(get_batch), batches):
+            parameters.update({entry['Name']: entry for entry in entries})
+    return parameters
+
+
+def check_loader_image(service, batch=False):
+    """Refuse bundling for images without secrets-loader.cjs, the app would start without its variables
+
+    Args:
+        service (str): ECS service name
+        batch (bool): Batch job definition deploy
+    """
+    if batch or service not in LOADER_SERVICES:
+        raise ValueError(f'--secrets_bundle needs {LOADER_PATH} in the {service}{" batch" if batch else ""} image. '
+                         f'Images shipping it: {", ".join(LOADER_SERVICES)}')
+
+
+def split_bundles(values, max_bytes=BUNDLE_MAX_BYTES):
+    """Split variables into JSON objects below max_bytes
+
+    Args:
+        values (dict): Variable name -> value
+        max_bytes (int): Max JSON size of one bundle
+
+    Returns:
+        tuple: List of bundles and names of variables too big for any bundle
+    """
+    bundles, oversized = [{}], []
+    for name in sorted(values):
+        if len(json.dumps({name: values[name]}).encode()) > max_bytes:
+            oversized.append(name)
+            continue
+        if len(json.dumps({**bundles[-1], name: values[name]}).encode()) > max_bytes:
+            bundles.append({})
+        bundles[-1][name] = values[name]
+    return [bundle for bundle in bundles if bundle], oversized
+
+
+def put_bundle(name, value, secure):
+    """Write bundle parameter
+
+    Args:
+        name (str): Full parameter name
+        value (str): Bundle JSON
+        secure (bool): SecureString for the sensitive bundles
+    """
+    get_client('ssm', retries=SSM_WRITE_RETRIES).put_parameter(
+        Name=name,
+        Value=value,
+        Type='SecureString' if secure else 'String',
+        Tier='Advanced' if len(value.encode()) > STANDARD_MAX_BYTES else 'Standard',
+        Overwrite=True
+    )
+    count_api_call('PutParameter')
+
+
+def bundle_secrets(environment, family, secrets):
+    """Replace per parameter secrets with a few JSON bundle secrets
+
+    SecureString parameters go to SecureString bundles, the rest to String bundles.
+    Bundles are stored under /{environment}/_bundles/{family}/ with the content hash
+    in the name, so older task definition revisions keep their bundles(until prune_bundles)
+    and unchanged bundles are not written again.
+
+    Args:
+        environment (str): Environment name
+        family (str): Task definition family
+        secrets (list): Secrets list from get_vars_from_ssm
+
+    Returns:
+        list: Bundle secrets, plus variables too big to bundle
+    """
+    if not secrets:
+        return secrets
+    parameters = get_parameter_values([parameter_name(item['valueFrom']) for item in secrets])
+    groups = {'config': {}, 'secrets': {}}
+    unbundled = []
+    for item in secrets:
+        entry = parameters.get(parameter_name(item['valueFrom']))
+        if entry is None:
+            logger.warning(f'SSM parameter {item["valueFrom"]} not found, keeping it as a separate secret')
+            unbundled.append(item)
+            continue
+        groups['secrets' if entry['Type'] == 'SecureString' else 'config'][item['name']] = entry['Value']
+
+    ## Bundle variable name -> (parameter name, value, secure)
+    bundles = {}
+    by_name = {item['name']: item for item in secrets}
+    for kind, values in groups.items():
+        kind_bundles, oversized = split_bundles(values)
+        unbundled.extend(by_name[name] for name in oversized)
+        for i, bundle in enumerate(kind_bundles):
+            value = json.dumps(bundle, sort_keys=True, separators=(',', ':'))
+            digest = hashlib.sha256(value.encode()).hexdigest()[:16]
+            bundles[f'{BUNDLE_PREFIX}{kind.upper()}_{i}'] = (f'{bundle_path(environment, family)}/{kind}-{i}-{digest}', value, kind == 'secrets')
+
+    ## Content addressed names: existing bundles are never rewritten
+    names = [name for name, value, secure in bundles.values()]
+    existing = get_parameter_values(names)
+    missing = [name for name in names if name not in existing]
+    for name, value, secure in bundles.values():
+        if name in missing:
+            put_bundle(name, value, secure)
+    if missing:
+        existing.update(get_parameter_values(missing))
+    bundled = [{'name': variable, 'valueFrom': existing[name]['ARN']} for variable, (name, value, secure) in bundles.items()]
+
+    logger.info(f'Bundled {len(secrets) - len(unbundled)} SSM variables of {family} into {len(bundled)} secrets, '
+                f'{len(unbundled)} kept separate')
+    return bundled + unbundled
+
+
+def bundle_path(environment, family):
+    """SSM path of the task definition family bundles. Services may share a name across families"""
+    return f'/{environment}/_bundles/{family}'
+
+
+def referenced_bundles(family, keep, task_definitions=()):
+    """Bundle parameter names used by the last task definition revisions of the family
+
+    Args:
+        family (str): Task definition family
+        keep (int): Number of revisions
+        task_definitions (set): Other revisions to include, for example the ones the service runs
+
+    Returns:
+        set: Parameter names
+    """
+    client = get_client('ecs')
+    arns = client.list_task_definitions(familyPrefix=family, sort='DESC', maxResults=keep)['taskDefinitionArns']
+    names = set()
+    for arn in set(arns) | set(task_definitions):
+        definition = client.describe_task_definition(taskDefinition=arn)['taskDefinition']
+        for container in definition['containerDefinitions']:
+            names.update(
+                parameter_name(item['valueFrom']) for item in container.get('secrets', [])
+                if item['name'].startswith(BUNDLE_PREFIX)
+            )
+    return names
+
+
+def prune_bundles(environment, family, secrets, keep=BUNDLE_KEEP_REVISIONS, running=()):
+    """Delete bundles not used by the new secrets, the last keep revisions or the running ones. Errors are only logged
+
+    Called after a successful rollout only, so a failed deploy never removes bundles.
+
+    Args:
+        environment (str): Environment name
+        family (str): Task definition family
+        secrets (list): bundle_secrets result of the rolled out revision
+        keep (int): Revisions whose bundles are kept
+        running (set): Task definition ARNs of the service deployments
+    """
+    try:
+        used = referenced_bundles(family, keep, running) | {
+            parameter_name(item['valueFrom']) for item in secrets if item['name'].startswith(BUNDLE_PREFIX)
+        }
+        stale = sorted(item['Name'] for item in get_path_metadata(bundle_path(environment, family)) if item['Name'] not in used)
+        client = get_client('ssm', retries=SSM_WRITE_RETRIES)
+        for i in range(0, len(stale), SSM_DELETE_BATCH_SIZE):
+            client.delete_parameters(Names=stale[i:i + SSM_DELETE_BATCH_SIZE])
+            count_api_call('DeleteParameters')
+    except ClientError as e:
+        logger.warning(f'Pruning secrets bundles of {family} failed: {e}')
+        return
+    if stale:
+        logger.info(f'Deleted {len(stale)} secrets bundles of {family} not used by the last {keep} or the running revisions')
+
+
+def loader_environment(environment, enabled=True):
+    """Add the bundle loader to NODE_OPTIONS of the container environment, or remove it
+
+    Args:
+        environment (list): Container environment, name/value pairs
+        enabled (bool): False removes the loader left by a bundled revision
+
+    Returns:
+        list: Container environment
+    """
+    require = f'--require {LOADER_PATH}'
+    result = []
+    for item in environment or []:
+        if item['name'] == 'NODE_OPTIONS':
+            value = ' '.join(item['value'].replace(require, '').split())
+            if enabled:
+                value = f'{value} {require}'.strip()
+            if value:
+                result.append({'name': 'NODE_OPTIONS', 'value': value})
+            continue
+        result.append(dict(item))
+    if enabled and not any(item['name'] == 'NODE_OPTIONS' for item in result):
+        result.append({'name': 'NODE_OPTIONS', 'value': require})
+    return result
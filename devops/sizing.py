@@ -0,0 +1,222 @@
+"""
+Task size validation and right-sizing recommendations
+
+    python devops/sizing.py --cluster production-api --family api --fargate
+    python devops/sizing.py --family api --fargate --fixture usage.json
+
+Returns:
+    None:
+"""
+import sys
+import json
+import math
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+from aws import get_client
+
+logger = logging.getLogger("Deployment")
+
+ECS_CPU_TO_VCPU = {
+    256: "0.25",
+    512: "0.5",
+    1024: "1",
+    2048: "2",
+    4096: "4",
+    8192: "8",
+    16384: "16"
+}
+
+### Fargate CPU units -> valid memory values, MiB. Also used by Batch on Fargate
+FARGATE_SIZES = {
+    256: (512, 1024, 2048),
+    512: tuple(range(1024, 4096 + 1, 1024)),
+    1024: tuple(range(2048, 8192 + 1, 1024)),
+    2048: tuple(range(4096, 16384 + 1, 1024)),
+    4096: tuple(range(8192, 30720 + 1, 1024)),
+    8192: tuple(range(16384, 61440 + 1, 4096)),
+    16384: tuple(range(32768, 122880 + 1, 8192)),
+}
+
+### Fargate Linux/ARM hourly prices(us-east-2), only used to rank the sizes
+FARGATE_VCPU_HOUR = 0.03238
+FARGATE_GB_HOUR = 0.00356
+
+### EC2 task sizes are rounded up to these steps
+EC2_CPU_STEP = 128
+EC2_MEMORY_STEP = 128
+
+CONTAINER_INSIGHTS_NAMESPACE = 'ECS/ContainerInsights'
+
+
+def fargate_sizes():
+    """All valid Fargate (cpu, memory) pairs"""
+    return [(cpu, memory) for cpu, memories in FARGATE_SIZES.items() for memory in memories]
+
+
+def validate_fargate_size(cpu, memory):
+    """Raise ValueError if cpu/memory is not a Fargate size
+
+    Args:
+        cpu (int|str): CPU units
+        memory (int|str): Memory, MiB
+
+    Returns:
+        tuple: (cpu, memory) as ints
+    """
+    if not cpu or not memory:
+        raise ValueError('Fargate needs both --cpu and --memory')
+    cpu, memory = int(cpu), int(memory)
+    if cpu not in FARGATE_SIZES:
+        raise ValueError(f'Invalid Fargate cpu {cpu}. Use one of {", ".join(str(item) for item in FARGATE_SIZES)}')
+    memories = FARGATE_SIZES[cpu]
+    if memory not in memories:
+        closest = min(memories, key=lambda item: abs(item - memory))
+        valid = ', '.join(str(item) for item in memories) if len(memories) <= 4 else \
+            f'{memories[0]}-{memories[-1]} in steps of {memories[1] - memories[0]}'
+        raise ValueError(f'Invalid Fargate memory {memory} for cpu {cpu}. Valid: {valid}, closest {closest}')
+    return cpu, memory
+
+
+def percentile(values, percent):
+    """Nearest rank percentile"""
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def get_utilization(cluster, family, days=14, period=300):
+    """Read per task CPU and memory usage of the task family from Container Insights
+
+    Args:
+        cluster (str): ECS cluster. For Batch jobs the compute environment cluster
+        family (str): Task definition family or Batch job definition name
+        days (int): History length
+        period (int): Seconds per data point
+
+    Returns:
+        dict: cpu(average CPU units per period) and memory(max MiB per period) samples
+    """
+    client = get_client('cloudwatch')
+    dimensions = [
+        {'Name': 'ClusterName', 'Value': cluster},
+        {'Name': 'TaskDefinitionFamily', 'Value': family}
+    ]
+
+    def query(query_id, metric, stat):
+        return {
+            'Id': query_id,
+            'MetricStat': {
+                'Metric': {'Namespace': CONTAINER_INSIGHTS_NAMESPACE, 'MetricName': metric, 'Dimensions': dimensions},
+                'Period': period,
+                'Stat': stat
+            }
+        }
+
+    end = datetime.now(timezone.utc)
+    samples = {'cpu': [], 'memory': []}
+    paginator = client.get_paginator('get_metric_data')
+    response_iterator = paginator.paginate(
+        MetricDataQueries=[query('cpu', 'CpuUtilized', 'Average'), query('memory', 'MemoryUtilized', 'Maximum')],
+        StartTime=end - timedelta(days=days),
+        EndTime=end
+    )
+    for page in response_iterator:
+        for result in page['MetricDataResults']:
+            samples[result['Id']].extend(result['Values'])
+    return samples
+
+
+def load_fixture(path):
+    """Load usage samples from the JSON file: {"cpu": [CPU units...], "memory": [MiB...]}"""
+    with open(path) as f:
+        samples = json.loads(f.read())
+    return {'cpu': samples.get('cpu', []), 'memory': samples.get('memory', [])}
+
+
+def recommend_size(samples, fargate=True, cpu_target=0.7, memory_target=0.8):
+    """Smallest size keeping p95 CPU and peak memory under the utilization targets
+
+    Args:
+        samples (dict): cpu and memory samples
+        fargate (bool): Recommend Fargate size, otherwise EC2 task size
+        cpu_target (float): Target CPU utilization at p95 usage
+        memory_target (float): Target memory utilization at peak usage
+
+    Returns:
+        dict: Usage and recommended cpu/memory
+    """
+    if not samples['cpu'] or not samples['memory']:
+        raise ValueError('No utilization samples. Is Container Insights enabled for the cluster?')
+    cpu_p95 = percentile(samples['cpu'], 95)
+    memory_peak = max(samples['memory'])
+    cpu_needed = cpu_p95 / cpu_target
+    memory_needed = memory_peak / memory_target
+
+    if fargate:
+        candidates = [
+            (cpu, memory) for cpu, memory in fargate_sizes()
+            if cpu >= cpu_needed and memory >= memory_needed
+        ]
+        if not candidates:
+            raise ValueError(f'No Fargate size fits {cpu_needed:.0f} CPU units and {memory_needed:.0f}MiB')
+        cpu, memory = min(candidates, key=lambda item: item[0] / 1024 * FARGATE_VCPU_HOUR + item[1] / 1024 * FARGATE_GB_HOUR)
+    else:
+        cpu = max(EC2_CPU_STEP, math.ceil(cpu_needed / EC2_CPU_STEP) * EC2_CPU_STEP)
+        memory = max(EC2_MEMORY_STEP, math.ceil(memory_needed / EC2_MEMORY_STEP) * EC2_MEMORY_STEP)
+
+    return {
+        'cpu_p95': round(cpu_p95, 1),
+        'memory_peak': round(memory_peak, 1),
+        'cpu': cpu,
+        'memory': memory,
+    }
+
+
+def compare_size(recommendation, cpu, memory):
+    """Describe current size against the recommendation
+
+    Returns:
+        str: Comparison text
+    """
+    notes = []
+    if cpu and int(cpu) != recommendation['cpu']:
+        notes.append(f"cpu {cpu} -> {recommendation['cpu']}")
+    if memory and int(memory) < recommendation['memory']:
+        notes.append(f"memory {memory} -> {recommendation['memory']} (peak {recommendation['memory_peak']}MiB, OOM risk)")
+    elif memory and int(memory) > recommendation['memory']:
+        notes.append(f"memory {memory} -> {recommendation['memory']} (over-provisioned)")
+    return ', '.join(notes) or 'current size matches the recommendation'
+
+
+parser = argparse.ArgumentParser(description='ECS/Batch task size recommender')
+parser.add_argument('--cluster', type=str, help='ECS cluster. For Batch the compute environment cluster')
+parser.add_argument('--family', type=str, help='Task definition family or job definition name')
+parser.add_argument('--fargate', action='store_true', help='Recommend Fargate size', default=False)
+parser.add_argument('--fixture', type=str, help='JSON file with cpu/memory samples instead of CloudWatch', default=None)
+parser.add_argument('--days', type=int, help='Days of history', default=14)
+parser.add_argument('--cpu_target', type=float, help='Target CPU utilization at p95', default=0.7)
+parser.add_argument('--memory_target', type=float, help='Target memory utilization at peak', default=0.8)
+parser.add_argument('--cpu', type=str, help='Current CPU units', default=None)
+parser.add_argument('--memory', type=str, help='Current memory, MiB', default=None)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if args.fixture:
+        samples = load_fixture(args.fixture)
+    elif args.cluster and args.family:
+        samples = get_utilization(args.cluster, args.family, args.days)
+    else:
+        parser.error('Specify --cluster and --family, or --fixture')
+
+    recommendation = recommend_size(samples, args.fargate, args.cpu_target, args.memory_target)
+    if args.cpu or args.memory:
+        recommendation['change'] = compare_size(recommendation, args.cpu, args.memory)
+    print(json.dumps(recommendation, indent=4))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,17 +3,95 @@ SSM helpers
 Returns:
     None:
 """
-from aws import ssm_client
-from botocore.config import Config
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from aws import get_client, get_session, get_region
+from botocore.exceptions import ClientError
 from helpers import ssm_extend
+from metrics import bind_context
+
+logger = logging.getLogger("Deployment")
+
+### Max number of service paths resolved at the same time
+SSM_MAX_WORKERS = 8
+### Max number of parallel put_parameter calls in update_ssm
+SSM_WRITE_WORKERS = 4
+### get_parameters accepts up to 10 names per call
+SSM_GET_BATCH_SIZE = 10
+SSM_THROTTLING_CODES = ('ThrottlingException', 'TooManyUpdates')
+### Writes go through adaptive retry mode: client side rate limiting plus backoff on throttling
+SSM_WRITE_RETRIES = dict(max_attempts=20, mode='adaptive')
+
+### SSM API calls made by this module, keyed by operation name
+api_calls = Counter()
+api_calls_lock = threading.Lock()
+
+
+def count_api_call(operation):
+    """Increase SSM API call counter
+
+    Args:
+        operation (str): SSM operation name
+    """
+    with api_calls_lock:
+        api_calls[operation] += 1
+
+
+def count_throttled_attempt(response=None, **kwargs):
+    """Botocore needs-retry hook. Counts throttled SSM attempts"""
+    if response is not None and response[1].get('Error', {}).get('Code') in SSM_THROTTLING_CODES:
+        count_api_call('Throttled')
+
+
+### Registered on the shared session, so every SSM client created later gets it
+get_session().events.register('needs-retry.ssm', count_throttled_attempt)
+
+
+def get_current_values(names):
+    """Read current values in batches of 10 names
+
+    Args:
+        names (list): Full parameter names
+
+    Returns:
+        dict: Parameter name -> value. Missing parameters are not included
+    """
+    values = {}
+    for i in range(0, len(names), SSM_GET_BATCH_SIZE):
+        response = get_client('ssm', retries=SSM_WRITE_RETRIES).get_parameters(Names=names[i:i + SSM_GET_BATCH_SIZE])
+        count_api_call('GetParameters')
+        for entry in response['Parameters']:
+            values[entry['Name']] = entry['Value']
+    return values
+
+
+def put_value(name, value):
+    """Write single String parameter
+
+    Args:
+        name (str): Full parameter name
+        value (str): New value
+    """
+    get_client('ssm', retries=SSM_WRITE_RETRIES).put_parameter(
+        Name=name,
+        Value=value,
+        Type='String',
+        Overwrite=True
+    )
+    count_api_call('PutParameter')
 
 
 def update_ssm(ssm_vars, service, cluster):
     """
-        Updating AWS Systems Manager
+        Updating AWS Systems Manager. Only changed values are written
         ssm_vars -> list of vars to update [0 -> key, 1-> value]
         service -> AWS ECS service name
+        Returns dict with written, skipped and throttled counts
     """
+    desired = {}
     for key in ssm_vars:
         rt_value = None
         if 'crawler-realtime' in cluster:
@@ -21,45 +99,175 @@ def update_ssm(ssm_vars, service, cluster):
                 rt_value = 'false'
             if key[0] == 'CRAWLER_DISABLE_RT_SERVER':
                 rt_value = 'false'
-            Config(retries = dict(max_attempts=20))
-        ssm_client.put_parameter(
-            Name=f'/{service}-{cluster}/{key[0]}',
-            Value=rt_value if rt_value else key[1],
-            Type='String',
-            Overwrite=True
-        )
+        desired[f'/{service}-{cluster}/{key[0]}'] = rt_value if rt_value else key[1]
 
+    throttled_before = api_calls['Throttled']
+    current = get_current_values(list(desired))
+    changed = {name: value for name, value in desired.items() if current.get(name) != value}
 
+    errors = []
+    if changed:
+        with ThreadPoolExecutor(max_workers=min(SSM_WRITE_WORKERS, len(changed))) as executor:
+            futures = {executor.submit(bind_context(put_value), name, value): name for name, value in changed.items()}
+            for future, name in futures.items():
+                try:
+                    future.result()
+                except ClientError as e:
+                    logger.error(f'Failed to update {name}: {e}')
+                    errors.append(e)
+
+    report = {
+        'written': len(changed) - len(errors),
+        'skipped': len(desired) - len(changed),
+        'throttled': api_calls['Throttled'] - throttled_before,
+        'failed': len(errors)
+    }
+    logger.info(f'SSM update for /{service}-{cluster}: {report}')
+    if errors:
+        raise errors[0]
+    return report
+
+
+def get_deleted_parameters(ssm_path):
+    """Get names of the parameters tagged for deletion(delete=1) in one listing
+
+    Args:
+        ssm_path (str): SSM path, for example /production/api
+
+    Returns:
+        set: Parameter names
+    """
+    paginator = get_client('ssm').get_paginator('describe_parameters')
+    response_iterator = paginator.paginate(
+        ParameterFilters=[
+            {'Key': 'Path', 'Option': 'OneLevel', 'Values': [ssm_path]},
+            {'Key': 'tag:delete', 'Option': 'Equals', 'Values': ['1']}
+        ],
+        PaginationConfig={
+            'PageSize': 50
+        }
+    )
 
-def get_vars_from_ssm(environment, services_list):
+    deleted = set()
+    for page in response_iterator:
+        count_api_call('DescribeParameters')
+        deleted.update(entry['Name'] for entry in page['Parameters'])
+    return deleted
+
+
+def get_path_metadata(ssm_path):
+    """Get metadata of all parameters under the path. Used to revalidate cached entries
+
+    Args:
+        ssm_path (str): SSM path, for example /production/api
+
+    Returns:
+        list: Parameters as returned by describe_parameters
+    """
+    paginator = get_client('ssm').get_paginator('describe_parameters')
+    response_iterator = paginator.paginate(
+        ParameterFilters=[
+            {'Key': 'Path', 'Option': 'OneLevel', 'Values': [ssm_path]}
+        ],
+        PaginationConfig={
+            'PageSize': 50
+        }
+    )
+
+    parameters = []
+    for page in response_iterator:
+        count_api_call('DescribeParameters')
+        parameters.extend(page['Parameters'])
+    return parameters
+
+
+def get_path_parameters(ssm_path):
+    """Get all parameters stored directly under the path
+
+    Args:
+        ssm_path (str): SSM path, for example /production/api
+
+    Returns:
+        list: Parameters as returned by get_parameters_by_path
+    """
+    paginator = get_client('ssm').get_paginator('get_parameters_by_path')
+    response_iterator = paginator.paginate(
+        Path=ssm_path,
+        PaginationConfig={
+            'PageSize': 10
+        }
+    )
+
+    parameters = []
+    for page in response_iterator:
+        count_api_call('GetParametersByPath')
+        parameters.extend(page['Parameters'])
+    return parameters
+
+
+def get_path_secrets(environment, service_path, cache=None):
+    """Get secrets list for the single service path
+
+    Args:
+        environment (str): Environment name
+        service_path (str): Service name used in the SSM path
+        cache (SSMCache): Optional local cache. Revalidated with one metadata listing, the delete
+            tag listing runs on every call
+
+    Returns:
+        list: List of variables
+    """
+    ssm_path = f'/{environment}/{service_path}'
+
+    ## Tagging doesn't change Version or LastModifiedDate, deletion tags are never taken from the cache
+    deleted = get_deleted_parameters(ssm_path)
+    cached = cache.get(environment, ssm_path) if cache else None
+    if cached and cache.is_valid(cached, get_path_metadata(ssm_path)):
+        parameters = cached['parameters']
+    else:
+        parameters = get_path_parameters(ssm_path)
+        if cache:
+            cache.put(environment, ssm_path, parameters)
+
+    secrets = []
+    for entry in parameters:
+        if entry['Name'] in deleted:
+            continue
+        secrets.append({
+            "name" : entry['Name'].split(f'{ssm_path}/')[-1],
+            "valueFrom" : entry['ARN']
+        })
+    return secrets
+
+
+def get_vars_from_ssm(environment, services_list, cache=None, shared=None):
     """Get variables from the SSM and configure secrets list
 
+    Service paths are resolved concurrently. Deletion tags are fetched with one
+    listing per path, so the number of API calls doesn't grow with the number of parameters.
+
     Args:
         environment (str): Environment name
         services_list (list): List of the services to get variables
+        cache (SSMCache): Optional local cache, only changed paths are refetched
+        shared (SharedLookups): Optional lookups shared with other services of the same deploy run
 
     Returns:
         list: List of variables
     """
+    if not services_list:
+        return []
+
+    def resolve(path):
+        if shared is None:
+            return get_path_secrets(environment, path, cache)
+        return shared.get(('ssm', get_region(), environment, path), lambda: get_path_secrets(environment, path, cache))
 
-    paginator = ssm_client.get_paginator('get_parameters_by_path')
     secrets = []
-    delete_tag = {'Key': 'delete', 'Value': '1'}
-
-    for service_path in services_list:
-        ssm_path = f'/{environment}/{service_path}'
-        response_iterator = paginator.paginate(
-            Path = ssm_path
-        )
-
-        for page in response_iterator:
-            for entry in page['Parameters']:
-                name = entry['Name'].split(f'{ssm_path}/')[-1]
-                arn = entry['ARN']
-                response = ssm_client.list_tags_for_resource(ResourceType='Parameter', ResourceId=entry['Name'])
-                if delete_tag not in response['TagList']:
-                    secrets.append({
-                        "name" : name,
-                        "valueFrom" : arn
-                    })
-    return ssm_extend(secrets)
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=min(SSM_MAX_WORKERS, len(services_list))) as executor:
+        ## map keeps services_list order, ssm_extend relies on it
+        for path_secrets in executor.map(bind_context(resolve), services_list):
+            secrets.extend(dict(item) for item in path_secrets)
+    if cache:
+        cache.save()
+    return ssm_extend(secrets)
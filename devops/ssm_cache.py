@@ -0,0 +1,154 @@
+"""
+Local cache for SSM-resolved secrets lists
+Returns:
+    None:
+"""
+import os
+import json
+import time
+import threading
+
+from aws import get_region
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.ssm-cache')
+DEFAULT_CACHE_TTL = 3600
+
+
+def parameter_metadata(entry):
+    """Keep only the fields used to revalidate cached parameters
+
+    Args:
+        entry (dict): Parameter returned by get_parameters_by_path or describe_parameters
+
+    Returns:
+        dict: Name, ARN, Version and LastModifiedDate of the parameter
+    """
+    modified = entry.get('LastModifiedDate')
+    return {
+        'Name': entry['Name'],
+        'ARN': entry.get('ARN'),
+        'Version': entry.get('Version'),
+        'LastModifiedDate': modified.isoformat() if hasattr(modified, 'isoformat') else modified
+    }
+
+
+class SSMCache:
+    """On-disk cache of the parameters listed under /{environment}/{service} paths
+
+    One JSON file per environment and region, keyed by SSM path. Only names, ARNs and versions
+    are stored, never parameter values.
+
+    Args:
+        cache_dir (str): Directory for the cache files
+        ttl (int): Seconds after which an entry is evicted
+        refresh (bool): Ignore cached entries and refetch everything
+    """
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_CACHE_TTL, refresh=False):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.ttl = ttl
+        self.refresh = refresh
+        self.entries = {}
+        self.dirty = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _scope(self, environment):
+        ## Parameter ARNs and versions differ between regions
+        return f'{environment}-{get_region()}'
+
+    def _path(self, environment):
+        return os.path.join(self.cache_dir, f'{environment}.json')
+
+    def _read(self, environment):
+        try:
+            with open(self._path(environment), 'r') as f:
+                entries = json.loads(f.read())
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {
+            path: entry for path, entry in entries.items()
+            if now - entry.get('fetched_at', 0) < self.ttl
+        }
+
+    def get(self, environment, ssm_path):
+        """Get cached entry for the path
+
+        Args:
+            environment (str): Environment name
+            ssm_path (str): SSM path
+
+        Returns:
+            dict: Cached entry or None if missing, expired or refresh is forced
+        """
+        environment = self._scope(environment)
+        with self.lock:
+            if self.refresh:
+                self.misses += 1
+                return None
+            if environment not in self.entries:
+                self.entries[environment] = self._read(environment)
+            entry = self.entries[environment].get(ssm_path)
+            if entry is None:
+                self.misses += 1
+            return entry
+
+    def put(self, environment, ssm_path, parameters):
+        """Store freshly fetched parameters for the path
+
+        Deletion tags are not cached: tagging changes neither Version nor LastModifiedDate,
+        so a cached set could not be revalidated.
+
+        Args:
+            environment (str): Environment name
+            ssm_path (str): SSM path
+            parameters (list): Parameters returned by get_parameters_by_path
+        """
+        environment = self._scope(environment)
+        entry = {
+            'fetched_at': time.time(),
+            'parameters': [parameter_metadata(item) for item in parameters]
+        }
+        with self.lock:
+            self.entries.setdefault(environment, {})[ssm_path] = entry
+            self.dirty.setdefault(environment, {})[ssm_path] = entry
+
+    def is_valid(self, entry, metadata):
+        """Compare cached entry with the current metadata listing
+
+        Args:
+            entry (dict): Cached entry
+            metadata (list): Parameters returned by describe_parameters
+
+        Returns:
+            bool: True if no parameter was added, removed or modified
+        """
+        def versions(parameters):
+            return {
+                item['Name']: (item['Version'], item['LastModifiedDate'])
+                for item in parameters
+            }
+        valid = versions(entry['parameters']) == versions(parameter_metadata(item) for item in metadata)
+        with self.lock:
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return valid
+
+    def save(self):
+        """Write changed entries, merged with entries written by other runs meanwhile"""
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for environment, changed in self.dirty.items():
+                entries = self._read(environment)
+                entries.update(changed)
+                tmp_path = f'{self._path(environment)}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(json.dumps(entries, indent=4))
+                os.replace(tmp_path, self._path(environment))
+            self.dirty = {}
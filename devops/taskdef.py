@@ -0,0 +1,148 @@
+"""
+Task definition helpers
+Returns:
+    None:
+"""
+import json
+import difflib
+import hashlib
+
+### Fields accepted by register_task_definition. Everything else in describe_task_definition is read only
+REGISTER_FIELDS = (
+    'family',
+    'taskRoleArn',
+    'executionRoleArn',
+    'networkMode',
+    'containerDefinitions',
+    'volumes',
+    'placementConstraints',
+    'requiresCompatibilities',
+    'cpu',
+    'memory',
+    'pidMode',
+    'ipcMode',
+    'proxyConfiguration',
+    'inferenceAccelerators',
+    'ephemeralStorage',
+    'runtimePlatform',
+)
+
+### Values ECS fills in for the containers when they are not set
+CONTAINER_DEFAULTS = {
+    'cpu': 0,
+    'essential': True,
+}
+
+### Values ECS fills in for the container health check
+HEALTH_CHECK_DEFAULTS = {
+    'interval': 30,
+    'timeout': 5,
+    'retries': 3,
+}
+
+### Lists where order doesn't matter, sorted before hashing
+SORT_KEYS = {
+    'secrets': 'name',
+    'environment': 'name',
+    'environmentFiles': 'value',
+    'mountPoints': 'containerPath',
+    'volumesFrom': 'sourceContainer',
+    'portMappings': 'containerPort',
+    'dependsOn': 'containerName',
+    'ulimits': 'name',
+}
+
+
+def strip_empty(value):
+    """Drop None, empty lists and empty dicts recursively"""
+    if isinstance(value, dict):
+        value = {key: strip_empty(item) for key, item in value.items()}
+        return {key: item for key, item in value.items() if item not in (None, [], {})}
+    if isinstance(value, list):
+        return [strip_empty(item) for item in value]
+    return value
+
+
+def normalize_port_mapping(mapping, network_mode):
+    """Drop port mapping values ECS echoes or assigns: tcp protocol, awsvpc hostPort, dynamic host ports"""
+    mapping = dict(mapping)
+    if mapping.get('protocol') == 'tcp':
+        del mapping['protocol']
+    ## awsvpc host port always equals the container port, ranges get their host ports from the agent
+    if network_mode == 'awsvpc' or 'containerPortRange' in mapping or mapping.get('hostPort') == 0:
+        mapping.pop('hostPort', None)
+    mapping.pop('hostPortRange', None)
+    return mapping
+
+
+def normalize_container(container, network_mode):
+    """Drop container values ECS fills in with defaults and sort unordered lists"""
+    container = {
+        key: value for key, value in container.items()
+        if CONTAINER_DEFAULTS.get(key, object()) != value
+    }
+    if isinstance(container.get('healthCheck'), dict):
+        container['healthCheck'] = {
+            key: value for key, value in container['healthCheck'].items()
+            if HEALTH_CHECK_DEFAULTS.get(key, object()) != value
+        }
+    if isinstance(container.get('portMappings'), list):
+        container['portMappings'] = [normalize_port_mapping(item, network_mode) for item in container['portMappings']]
+    for key in ('mountPoints', 'volumesFrom'):
+        if isinstance(container.get(key), list):
+            container[key] = [{name: value for name, value in item.items() if (name, value) != ('readOnly', False)} for item in container[key]]
+    for key, sort_key in SORT_KEYS.items():
+        if isinstance(container.get(key), list):
+            container[key] = sorted(container[key], key=lambda item: str(item.get(sort_key, item)))
+    return container
+
+
+def normalize_task_definition(definition):
+    """Normalize task definition so registered and new definitions can be compared
+
+    Args:
+        definition (dict): describe_task_definition()['taskDefinition'] or register_task_definition args
+
+    Returns:
+        dict: Normalized definition
+    """
+    normalized = {key: definition[key] for key in REGISTER_FIELDS if key in definition}
+    for key in ('cpu', 'memory'):
+        if key in normalized:
+            normalized[key] = str(normalized[key])
+
+    if isinstance(normalized.get('requiresCompatibilities'), list):
+        normalized['requiresCompatibilities'] = sorted(normalized['requiresCompatibilities'])
+    network_mode = normalized.get('networkMode', 'bridge')
+    normalized['containerDefinitions'] = [
+        normalize_container(container, network_mode) for container in normalized.get('containerDefinitions', [])
+    ]
+    return strip_empty(normalized)
+
+
+def task_definition_hash(definition):
+    """Content hash of the normalized task definition
+
+    Args:
+        definition (dict): Task definition
+
+    Returns:
+        str: sha256 hex digest
+    """
+    content = json.dumps(normalize_task_definition(definition), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def diff_task_definitions(current, new):
+    """Unified diff of the normalized task definitions
+
+    Args:
+        current (dict): Registered task definition
+        new (dict): New task definition
+
+    Returns:
+        str: Diff text
+    """
+    def lines(definition):
+        return json.dumps(normalize_task_definition(definition), sort_keys=True, indent=2, default=str).splitlines()
+    return '\n'.join(difflib.unified_diff(lines(current), lines(new), 'registered', 'new', lineterm=''))